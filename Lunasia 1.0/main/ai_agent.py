@@ -9,12 +9,15 @@ import re
 import openai
 import subprocess
 import os
+from collections import deque
 from config import load_config
 from utils import get_location, scan_windows_apps, open_website, open_application, search_web
 from weather import WeatherTool
 from amap_tool import AmapTool
 from memory_lake import MemoryLake
+from session_store import SessionConversationStore
 from mcp_server import LocalMCPServer
+from tool_plan import run_plan
 
 class MCPTools:
     """MCP工具管理类"""
@@ -25,7 +28,7 @@ class MCPTools:
     def execute_mcp_command(self, tool_name, **params):
         """执行MCP命令（同步版本）"""
         try:
-            # 重新加载自定义工具
+            # 自定义工具文件有变化时才重新加载（未变化时只有一次stat）
             self.server.reload_custom_tools()
             result = self.server.call_tool(tool_name, **params)
             return result
@@ -35,13 +38,22 @@ class MCPTools:
     async def execute_mcp_command_async(self, tool_name, **params):
         """执行MCP命令（异步版本）"""
         try:
-            # 重新加载自定义工具
+            # 自定义工具文件有变化时才重新加载（未变化时只有一次stat）
             self.server.reload_custom_tools()
             result = self.server.call_tool(tool_name, **params)
             return result
         except Exception as e:
             return f"MCP命令执行失败: {str(e)}"
     
+    def execute_plan(self, steps, max_workers=4):
+        """执行多工具计划：互不依赖的调用并发执行，按完成顺序产出结果（见 tool_plan.run_plan）
+        
+        目前只有工具管理对话框的多选测试使用（在后台线程中逐个接收结果）；
+        AIAgent 的每轮对话最多调用一个工具，尚未接入，需要多工具的对话仍然逐个调用
+        """
+        self.server.reload_custom_tools()
+        return run_plan(self.server, steps, max_workers=max_workers)
+    
     def list_available_tools(self):
         """列出可用工具（同步版本）"""
         try:
@@ -85,19 +97,44 @@ class MCPTools:
 class AIAgent:
     """露尼西亚AI核心"""
     
+    # 会话关键词（_extract_keywords使用，同时登记到会话索引）
+    SESSION_KEYWORDS = [
+        '天气', '时间', '搜索', '打开', '计算', '距离', '系统', '文件', '笔记', 
+        '穿衣', '出门', '建议', '教堂', '景点', '历史', '参观', '路线', '法兰克福',
+        '大教堂', '老城区', '游客', '高峰期', '规划', '咨询', '询问', '问过', '讨论过',
+        '提到过', '说过', '介绍过', '推荐过', '建议过', '介绍', '一下', '什么', '哪里',
+        '位置', '地址', '建筑', '标志性', '历史', '文化', '旅游', '游览', '参观'
+    ]
+    # 询问"上一个"时优先匹配的景点、建筑、旅游相关词
+    SCENIC_WORDS = [
+        '教堂', '大教堂', '法兰克福', '建筑', '景点', '历史', '参观', '游览', '旅游', '铁桥', '桥', '故宫',
+        '天安门', '红场', '莫斯科', '柏林', '勃兰登堡门', '广场', '公园', '博物馆', '遗址', '古迹', '埃菲尔铁塔'
+    ]
+    # 用户引用之前对话的说法
+    PREVIOUS_QUERY_WORDS = ['上一个', '上个', '之前', '刚才', '你提到', '你说过', '我们讨论过', '你问过']
+    # 本身就是在询问"上个"的对话，检索时排除
+    PREVIOUS_QUERY_EXCLUDE = ['上个', '上一个', '之前', '刚才']
+    # 第一条记忆查询相关词
+    FIRST_MEMORY_WORDS = ['第一条', '识底深湖', '记忆']
+    
     def __init__(self, config):
         self.name = "露尼西亚"
         self.role = "游戏少女前线中威廉的姐姐"
         self.memory_lake = MemoryLake()
         self.developer_mode = False
         self.current_topic = ""
-        self.conversation_history = []
+        # 只保留最近的对话历史，避免长时间运行后无限增长
+        self.conversation_history = deque(maxlen=config.get("session_memory_max_turns", 200) * 2)
         self.config = config
         self.location = get_location()
         self.last_save_date = None
         
-        # 本次程序运行时的对话记录
-        self.session_conversations = []
+        # 本次程序运行时的对话记录（内存中保留最近的对话，较早的溢出到磁盘）
+        spill_file = os.path.join(os.path.dirname(self.memory_lake.memory_file), "session_spill.jsonl")
+        index_terms = (self.SESSION_KEYWORDS + self.SCENIC_WORDS + self.PREVIOUS_QUERY_EXCLUDE
+                       + self.FIRST_MEMORY_WORDS)
+        self.session_conversations = SessionConversationStore(config.get("session_memory_max_turns", 200),
+                                                              spill_file, index_terms)
         
         # 最近生成的代码缓存
         self.last_generated_code = None
@@ -217,49 +254,27 @@ class AIAgent:
 
     def _add_session_conversation(self, user_input, ai_response):
         """添加本次会话的对话记录"""
-        # 🚀 修复：防重复添加机制
-        # 检查是否已经存在相同的对话
-        for existing_conv in self.session_conversations:
-            if (existing_conv.get('user_input') == user_input and 
-                existing_conv.get('ai_response') == ai_response):
-                print(f"⚠️ 检测到重复对话，跳过添加到会话记录: {user_input[:30]}...")
-                return
-        
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        self.session_conversations.append({
-            "timestamp": timestamp,
-            "user_input": user_input,
-            "ai_response": ai_response,
-            "full_text": f"指挥官: {user_input}\n露尼西亚: {ai_response}",
-            "saved": False  # 标记为未保存，当保存到记忆系统时会改为True
-        })
-        
-        print(f"✅ 添加对话到会话记录: {user_input[:30]}... (当前共{len(self.session_conversations)}条)")
+        # 🚀 修复：防重复添加机制（按对话内容哈希去重）
+        # 新对话默认未保存，保存到记忆系统时在已保存位图中标记
+        if self.session_conversations.add(user_input, ai_response) is None:
+            print(f"⚠️ 检测到重复对话，跳过添加到会话记录: {user_input[:30]}...")
+            return
+        
+        # 开发者模式下不保存完整聊天记录
+        if not self.developer_mode:
+            self.memory_lake.record_transcript(user_input, ai_response)
+        
+        print(f"✅ 添加对话到会话记录: {user_input[:30]}... (当前共{self.session_conversations.total_count()}条)")
 
     def _mark_conversation_as_saved(self, user_input, ai_response):
         """标记对话为已保存"""
-        # 在session_conversations中找到匹配的对话并标记为已保存
-        for conv in self.session_conversations:
-            if (conv.get('user_input') == user_input and 
-                conv.get('ai_response') == ai_response and 
-                not conv.get('saved', False)):
-                conv['saved'] = True
-                print(f"✅ 标记对话为已保存: {user_input[:50]}...")
-                break
+        if self.session_conversations.mark_saved(user_input, ai_response):
+            print(f"✅ 标记对话为已保存: {user_input[:50]}...")
 
     def _extract_keywords(self, text):
         """提取关键词"""
         keywords = []
-        # 扩展关键词列表
-        common_words = [
-            '天气', '时间', '搜索', '打开', '计算', '距离', '系统', '文件', '笔记', 
-            '穿衣', '出门', '建议', '教堂', '景点', '历史', '参观', '路线', '法兰克福',
-            '大教堂', '老城区', '游客', '高峰期', '规划', '咨询', '询问', '问过', '讨论过',
-            '提到过', '说过', '介绍过', '推荐过', '建议过', '介绍', '一下', '什么', '哪里',
-            '位置', '地址', '建筑', '标志性', '历史', '文化', '旅游', '游览', '参观'
-        ]
-        
-        for word in common_words:
+        for word in self.SESSION_KEYWORDS:
             if word in text:
                 keywords.append(word)
         
@@ -1415,50 +1430,29 @@ Purpose: Commander's English music collection"""
         
         user_keywords = self._extract_keywords(user_input)
         user_text = user_input.lower()
+        session = self.session_conversations
         
         # 检查是否是询问上一个问题
-        if any(word in user_text for word in ['上一个', '上个', '之前', '刚才', '你提到', '你说过', '我们讨论过', '你问过']):
-            # 如果有具体的关键词（如"景点"），优先搜索包含该关键词的对话
+        if any(word in user_text for word in self.PREVIOUS_QUERY_WORDS):
+            # 如果有具体的关键词（如"景点"），优先搜索包含该关键词的对话，但排除询问"上个"的对话本身
             if user_keywords:
-                for conv in reversed(self.session_conversations):
-                    conv_text = conv["full_text"].lower()
-                    # 改进关键词匹配：检查用户关键词是否在对话中出现，但排除询问"上个"的对话本身
-                    if any(keyword in conv_text for keyword in user_keywords) and not any(word in conv_text for word in ['上个', '上一个', '之前', '刚才']):
-                        return f"【{conv['timestamp']}】{conv['full_text']}"
+                matches = session.latest(user_keywords, exclude=self.PREVIOUS_QUERY_EXCLUDE)
+                if matches:
+                    return f"【{matches[0]['timestamp']}】{matches[0]['full_text']}"
             
             # 如果没有找到相关关键词的对话，尝试智能匹配
-            # 检查是否有景点、建筑、旅游相关的对话
-            for conv in reversed(self.session_conversations):
-                conv_text = conv["full_text"].lower()
-                # 检查是否包含景点相关的词汇，但排除询问"上个"的对话本身
-                if any(word in conv_text for word in ['教堂', '大教堂', '法兰克福', '建筑', '景点', '历史', '参观', '游览', '旅游', '铁桥', '桥', '故宫', '天安门', '红场', '莫斯科', '柏林', '勃兰登堡门', '广场', '公园', '博物馆', '遗址', '古迹', '埃菲尔铁塔']) and not any(word in conv_text for word in ['上个', '上一个', '之前', '刚才']):
-                    return f"【{conv['timestamp']}】{conv['full_text']}"
+            # 检查是否有景点、建筑、旅游相关的对话，但排除询问"上个"的对话本身
+            matches = session.latest(self.SCENIC_WORDS, exclude=self.PREVIOUS_QUERY_EXCLUDE)
+            if matches:
+                return f"【{matches[0]['timestamp']}】{matches[0]['full_text']}"
             
             # 如果还是没有找到，返回最近的对话
-            if len(self.session_conversations) >= 1:
-                # 返回最近的对话
-                last_conv = self.session_conversations[-1]
-                return f"【{last_conv['timestamp']}】{last_conv['full_text']}"
+            last_conv = session[-1]
+            return f"【{last_conv['timestamp']}】{last_conv['full_text']}"
+        
+        # 通过会话索引查找包含用户关键词的对话，最多返回3个相关上下文（最新的在前）
+        relevant_contexts = session.latest(user_keywords, limit=3)
         
-        # 从最近的对话开始搜索
-        relevant_contexts = []
-        for conv in reversed(self.session_conversations):
-            # 检查对话内容是否包含用户提到的关键词
-            conv_text = conv["full_text"].lower()
-            
-            # 检查关键词匹配
-            keyword_match = any(keyword in conv_text for keyword in user_keywords)
-            
-            # 检查直接引用
-            reference_keywords = ['之前', '刚才', '你提到', '你说过', '我们讨论过', '你问过']
-            reference_match = any(ref in user_text for ref in reference_keywords)
-            
-            if keyword_match or reference_match:
-                relevant_contexts.append(conv)
-                # 最多返回3个相关上下文
-                if len(relevant_contexts) >= 3:
-                    break
-            
         if relevant_contexts:
             # 构建上下文信息
             context_parts = []
@@ -1501,12 +1495,10 @@ Purpose: Commander's English music collection"""
         
         # 检查是否是简短回答且上下文包含第一条记忆查询
         if user_input in ['需要', '要', '好的', '可以'] and self.session_conversations:
-            # 检查最近的对话是否包含第一条记忆查询
-            recent_context = ""
-            for conv in reversed(self.session_conversations[-3:]):  # 检查最近3条对话
-                recent_context += conv["full_text"].lower()
-            
-            if "第一条" in recent_context and ("识底深湖" in recent_context or "记忆" in recent_context):
+            # 检查最近3条对话是否包含第一条记忆查询（通过会话索引，不扫描对话原文）
+            recent_start = self.session_conversations.total_count() - 3
+            if (self.session_conversations.latest(["第一条"], since=recent_start) and
+                    self.session_conversations.latest(["识底深湖", "记忆"], since=recent_start)):
                 try:
                     first_memory = self.memory_lake.get_first_memory()
                     if first_memory:
@@ -1530,16 +1522,22 @@ Purpose: Commander's English music collection"""
             for conv in self.session_conversations:
                 context_parts.append(f"【{conv['timestamp']}】{conv['full_text']}")
         
-        # 2. 此前识底深湖的100条信息（主题、日期、时间）
+        # 2. 识底深湖历史记忆：与当前输入相关的记忆 + 重点记忆 + 最近几条（主题、日期、时间）
         try:
-            # 获取识底深湖的历史记忆
-            historical_memories = self.memory_lake.get_recent_memories(100)
+            historical_memories = self.memory_lake.select_context_memories(
+                user_input,
+                top_k=self.config.get("memory_context_top_k", 5),
+                recent_count=self.config.get("memory_context_recent", 5),
+                max_total=self.config.get("memory_context_max", 15)
+            )
             if historical_memories:
                 context_parts.append("【历史记忆】")
-                for memory in historical_memories:
+                print(f"🧠 注入 {len(historical_memories)} 条历史记忆:")
+                for memory, reason in historical_memories:
                     # 格式化记忆信息：主题、日期、时间
-                    memory_info = f"【{memory.get('date', '未知日期')} {memory.get('time', '未知时间')}】主题：{memory.get('topic', '未知主题')}"
+                    memory_info = f"【{memory.get('date', '未知日期')} {memory.get('timestamp', '未知时间')}】主题：{memory.get('topic', '未知主题')}"
                     context_parts.append(memory_info)
+                    print(f"   - [{reason}] {memory_info}")
         except Exception as e:
             print(f"获取历史记忆失败: {str(e)}")
         
@@ -1774,11 +1772,11 @@ Purpose: Commander's English music collection"""
         # 添加对话到当前会话
         self.memory_lake.add_conversation(user_input, ai_response, self.developer_mode, self._mark_conversation_as_saved)
         
-        # 检查是否需要总结
+        # 检查是否需要总结（交给后台总结队列，不阻塞回复）
         if self.memory_lake.should_summarize():
-            topic = self.memory_lake.summarize_and_save_topic(force_save=True)
-            if topic and not self.developer_mode:
-                print(f"记忆系统：已总结主题 - {topic}")
+            batch_id = self.memory_lake.enqueue_current_conversation()
+            if batch_id and not self.developer_mode:
+                print(f"记忆系统：已加入后台总结队列 - {batch_id}")
         
         # 每天结束时保存对话日志
         current_date = datetime.datetime.now().strftime("%Y-%m-%d")
@@ -2985,26 +2983,20 @@ Purpose: Commander's English music collection"""
             current_memory_count = len(self.memory_lake.current_conversation)
             
             # 获取本次会话的对话数量
-            session_count = len(self.session_conversations)
+            session_count = self.session_conversations.total_count()
             
             # 如果本次会话有对话但记忆系统中没有，说明有未保存的对话
             if session_count > 0 and current_memory_count == 0:
-                # 将本次会话的所有对话添加到记忆系统
-                for conv in self.session_conversations:
+                # 将本次会话的所有对话添加到记忆系统（包括已溢出到磁盘的较早对话）
+                for conv in list(self.session_conversations.read_spilled()) + self.session_conversations[:]:
                     self.memory_lake.add_conversation(conv["user_input"], conv["ai_response"])
                     unsaved_conversations.append(conv["full_text"])
             
-            # 强制保存到识底深湖
+            # 强制保存到识底深湖（后台总结，完成后自动标记为重点记忆）
             if self.memory_lake.current_conversation:
-                topic = self.memory_lake.summarize_and_save_topic(force_save=True)
+                batch_id = self.memory_lake.enqueue_current_conversation(is_important=True)
                 
-                if topic:
-                    # 标记为重点记忆（最新保存的记忆是最后一个）
-                    topics = self.memory_lake.memory_index.get("topics", [])
-                    if topics:
-                        latest_index = len(topics) - 1
-                        self.memory_lake.mark_as_important(latest_index)
-                    
+                if batch_id:
                     # 构建响应消息
                     response = f"（轻轻点头）好的指挥官，我已经将这个重要时刻记录到识底深湖中，并标记为重点记忆。"
                     
@@ -3017,10 +3009,10 @@ Purpose: Commander's English music collection"""
                             for i, conv in enumerate(unsaved_conversations, 1):
                                 response += f"{i}. {conv}\n"
                         
-                        response += f"\n主题：{topic}\n时间：{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                        response += f"\n主题：正在后台总结中\n时间：{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
                     
                     # 清空本次会话记录，因为已经保存到记忆系统
-                    self.session_conversations = []
+                    self.session_conversations.clear()
                     
                     return response
                 else:
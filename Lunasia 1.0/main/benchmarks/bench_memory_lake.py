@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖性能基准
+生成1k/10k/100k主题的合成记忆湖，测量初始化/加载、保存、检索、统计和记忆对话框加载主题列表的耗时与内存
+
+用法:
+    python benchmarks/bench_memory_lake.py                          # 默认 1000 10000 100000
+    python benchmarks/bench_memory_lake.py --sizes 1000 10000 --output result.json
+    python benchmarks/bench_memory_lake.py --baseline result.json    # 与上次结果对比
+
+合成记忆湖在临时目录中生成，基准期间关闭分层归档和聊天记录写入，测得的是存储与检索本身的开销
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MAIN_DIR)
+
+TOPIC_TEMPLATES = [
+    "{place}的{thing}推荐", "讨论{thing}的历史", "{place}{thing}出行规划", "关于{skill}的学习计划",
+    "{skill}代码调试", "{place}天气与穿衣建议", "{thing}和{skill}的比较", "回忆{place}之行",
+]
+PLACES = ["法兰克福", "柏林", "莫斯科", "北京", "上海", "成都", "巴黎", "东京", "杭州", "西安"]
+THINGS = ["大教堂", "博物馆", "老城区", "美食", "公园", "古迹", "广场", "铁桥", "咖啡馆", "书店"]
+SKILLS = ["Python", "数据库", "机器学习", "前端", "网络协议", "算法", "摄影", "吉他", "日语", "写作"]
+KEYWORD_POOL = PLACES + THINGS + SKILLS + ["天气", "出门", "建议", "历史", "旅游", "路线", "文件", "笔记"]
+QUERIES = ["之前说过的法兰克福大教堂", "还记得Python调试的事吗", "上个月讨论过的天气", "继续聊聊博物馆"]
+
+
+def generate_lake(count: int, seed: int = 7, spread_days: int = 25):
+    """生成旧版单文件格式的记忆湖（首次加载时会迁移为分片存储）"""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    topics = []
+    for i in range(count):
+        place, thing, skill = rng.choice(PLACES), rng.choice(THINGS), rng.choice(SKILLS)
+        date = today - datetime.timedelta(days=spread_days * (count - i) // count)
+        rounds = rng.randint(1, 5)
+        details = "\n\n".join(
+            f"第{r + 1}轮对话：指挥官询问{place}的{thing}，露尼西亚介绍了{thing}的特点、开放时间和{skill}相关的注意事项。"
+            for r in range(rounds)
+        )
+        topics.append({
+            "topic": rng.choice(TOPIC_TEMPLATES).format(place=place, thing=thing, skill=skill),
+            "timestamp": f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+            "date": date.isoformat(),
+            "conversation_count": rounds,
+            "keywords": rng.sample(KEYWORD_POOL, rng.randint(3, 8)),
+            "conversation_details": details,
+            "is_important": i == 0 or rng.random() < 0.01
+        })
+    return {"topics": topics, "conversations": {}, "contexts": {}}
+
+
+def rss_bytes():
+    """当前进程常驻内存（需要psutil；Unix下退回到峰值RSS）"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def timed(run, repeat: int = 1):
+    """返回 (最后一次结果, 最快一次耗时毫秒)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return result, round(best, 3)
+
+
+def bench_dialog(lake):
+    """记忆对话框加载主题列表耗时（没有PyQt5时跳过）"""
+    try:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        from ui_dialogs import MemoryLakeDialog
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication([])
+    dialog = MemoryLakeDialog(lake)
+    _, elapsed = timed(dialog.load_topics)
+    dialog.deleteLater()
+    app.processEvents()
+    return elapsed
+
+
+def bench_size(count: int, repeat: int):
+    from memory_lake import MemoryLake
+
+    workdir = tempfile.mkdtemp(prefix=f"lunasia_bench_{count}_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        # 基准期间关闭后台归档和聊天记录写入，避免后台线程干扰计时
+        with open("ai_agent_config.json", 'w', encoding='utf-8') as f:
+            json.dump({"memory_compaction_enabled": False, "chat_log_enabled": False}, f)
+        with open("memory_lake.json", 'w', encoding='utf-8') as f:
+            json.dump(generate_lake(count), f, ensure_ascii=False)
+
+        gc.collect()
+        rss_before = rss_bytes()
+        results = {"topics": count}
+
+        lake, results["migrate_ms"] = timed(lambda: MemoryLake("memory_lake.json", "chat_logs"))
+        lake.summary_queue.stop()
+        del lake
+        gc.collect()
+
+        lake, results["init_ms"] = timed(lambda: MemoryLake("memory_lake.json", "chat_logs"))
+        lake.summary_queue.stop()
+        rss_after = rss_bytes()
+        _, results["load_memory_ms"] = timed(lake.load_memory, repeat)
+        _, results["save_memory_ms"] = timed(lake.save_memory, repeat)
+        _, results["search_relevant_memories_ms"] = timed(
+            lambda: [lake.search_relevant_memories(query) for query in QUERIES], repeat)
+        _, results["get_recent_memories_ms"] = timed(lambda: lake.get_recent_memories(100), repeat)
+        _, results["get_first_memory_ms"] = timed(lake.get_first_memory, repeat)
+        _, results["get_memory_stats_ms"] = timed(lake.get_memory_stats, repeat)
+        results["dialog_load_topics_ms"] = bench_dialog(lake)
+        results["rss_bytes"] = rss_after
+        results["rss_delta_bytes"] = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        results["disk_bytes"] = lake.store.disk_size()
+        return results
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline):
+    """与基准结果对比，返回 {主题数: {指标: 当前/基准}}"""
+    previous = {str(item["topics"]): item for item in baseline.get("results", [])}
+    comparison = {}
+    for item in results:
+        old = previous.get(str(item["topics"]))
+        if not old:
+            continue
+        ratios = {}
+        for key, value in item.items():
+            if key == "topics" or not isinstance(value, (int, float)) or not isinstance(old.get(key), (int, float)):
+                continue
+            if old[key]:
+                ratios[key] = round(value / old[key], 3)
+        comparison[str(item["topics"])] = ratios
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="识底深湖性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="每项操作重复次数（取最快一次）")
+    parser.add_argument("--output", default="bench_memory_lake.json")
+    parser.add_argument("--baseline", help="上次的结果文件，用于对比")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.sizes:
+        print(f"📊 测试 {count} 个主题...")
+        item = bench_size(count, args.repeat)
+        results.append(item)
+        for key, value in item.items():
+            if key != "topics":
+                print(f"  {key:<30} {value}")
+
+    report = {
+        "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "results": results
+    }
+    if args.baseline:
+        try:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                report["baseline"] = args.baseline
+                report["comparison"] = compare(results, json.load(f))
+            print("对比基准（当前/基准，小于1表示更快或更小）:")
+            for size, ratios in report["comparison"].items():
+                print(f"  {size}: " + ", ".join(f"{key}={ratio}" for key, ratio in ratios.items()))
+        except Exception as e:
+            print(f"⚠️ 读取基准结果失败: {str(e)}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+主题记录内存/CPU对比基准
+对比原有字典主题与MemoryTopic在大量主题下的内存占用、加载耗时和相关性检索耗时
+
+用法: python benchmarks/bench_memory_topic.py [主题数量，默认100000]
+"""
+
+import datetime
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_lake import MemoryLake
+from memory_topic import KEYWORDS, MemoryTopic, topics_from_dicts
+
+VOCABULARY = ["天气", "编程", "Python", "音乐", "电影", "旅行", "美食", "工作", "学习", "游戏",
+              "记忆", "识底深湖", "露尼西亚", "地图", "文件", "搜索", "健康", "运动", "读书", "计划",
+              "代码", "调试", "部署", "数据库", "网络", "历史", "科学", "艺术", "新闻", "购物"]
+
+
+def make_topic_dicts(count: int, seed: int = 42):
+    """生成与manifest.json中主题头信息结构相同的字典（JSON解析后每条都是新字符串）"""
+    rng = random.Random(seed)
+    start = datetime.date.today() - datetime.timedelta(days=730)
+    topics = []
+    for i in range(count):
+        date = start + datetime.timedelta(days=rng.randrange(730))
+        keywords = rng.sample(VOCABULARY, rng.randint(3, 8))
+        topics.append({
+            "topic": f"关于{keywords[0]}和{keywords[1]}的讨论{i}",
+            "timestamp": f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}",
+            "date": "".join(list(date.isoformat())),
+            "conversation_count": rng.randint(1, 20),
+            "keywords": ["".join(list(keyword)) for keyword in keywords],
+            "is_important": rng.random() < 0.01,
+            "id": f"{i:012x}",
+            "shard": "".join(list(date.isoformat()[:7]))
+        })
+    return topics
+
+
+def measure_memory(label, build):
+    """返回 (结果, 常驻内存增量字节)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"  {label:<16} {size / 1024 / 1024:8.1f} MB")
+    return result, size
+
+
+def measure_time(label, run, repeat: int = 3):
+    """返回最快一次的耗时秒（不开启tracemalloc，避免干扰计时）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    print(f"  {label:<16} {best * 1000:8.1f} ms")
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    user_keywords = ["Python", "调试", "天气"]
+    print(f"📊 主题数量: {count}")
+
+    print("字典主题:")
+    dicts, dict_size = measure_memory("内存", lambda: make_topic_dicts(count))
+    # 直接调用识底深湖中的相关性计算（_calculate_relevance 不使用实例状态）
+    dict_search = measure_time("相关性检索", lambda: [
+        t for t in dicts if MemoryLake._calculate_relevance(None, t, user_keywords, "") > 0.3
+    ])
+    dict_stats = measure_time("统计重点记忆", lambda: sum(1 for t in dicts if t.get("is_important", False)))
+
+    print("MemoryTopic:")
+    measure_time("由字典转换", lambda: topics_from_dicts(dicts), repeat=1)
+    # 记录本身的常驻内存（只统计新建的字典和记录，转换后字典不再被引用）
+    records, record_size = measure_memory("内存", lambda: topics_from_dicts(make_topic_dicts(count)))
+    today_ordinal = datetime.date.today().toordinal()
+    keyword_ids = [KEYWORDS.lookup(keyword) for keyword in user_keywords]
+    record_search = measure_time("相关性检索", lambda: [
+        t for t in records if MemoryLake._calculate_topic_relevance(t, user_keywords, keyword_ids, today_ordinal) > 0.3
+    ])
+    record_stats = measure_time("统计重点记忆", lambda: sum(1 for t in records if t.is_important))
+
+    round_trip = MemoryTopic.from_dict(records[0].to_dict())
+    assert round_trip.to_dict() == records[0].to_dict()
+
+    print("对比:")
+    print(f"  内存: {dict_size / 1024 / 1024:.1f} MB -> {record_size / 1024 / 1024:.1f} MB "
+          f"(节省 {100 * (1 - record_size / dict_size):.0f}%)")
+    print(f"  检索: {dict_search * 1000:.1f} ms -> {record_search * 1000:.1f} ms "
+          f"({dict_search / record_search:.1f}x)")
+    print(f"  统计: {dict_stats * 1000:.1f} ms -> {record_stats * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
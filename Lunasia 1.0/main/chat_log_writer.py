@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+聊天记录归档
+完整对话按天写入 chat_logs/chat_YYYY-MM-DD.jsonl.gz，由后台线程批量压缩写入，聊天主流程只做一次入队
+每批记录写成一个独立的gzip成员，旁路索引记录各成员的偏移和时间范围，可按时间随机读取
+"""
+
+import datetime
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+LOG_FILE_PATTERN = re.compile(r"^chat_(\d{4}-\d{2}-\d{2})\.(jsonl\.gz|idx)$")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ChatLogWriter:
+    """按天滚动的压缩聊天记录写入器"""
+
+    def __init__(self, log_dir: str = "chat_logs", retention_days: int = 90, max_queue: int = 1000,
+                 flush_interval: float = 2.0, batch_size: int = 100, stats=None):
+        self.log_dir = log_dir
+        self.stats = stats  # 记忆统计计数器，新增/删除记录文件时更新
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file_lock = threading.Lock()
+        self._dropped = 0
+        self._last_retention_day = None
+        self._worker = threading.Thread(target=self._run, name="ChatLogWriter", daemon=True)
+        self._worker.start()
+
+    # ---- 写入 ----
+
+    def write(self, user_input: str, ai_response: str, timestamp: Optional[datetime.datetime] = None) -> bool:
+        """记录一轮对话（只入队，不等待写盘）；队列已满时丢弃并返回False"""
+        record = {
+            "time": (timestamp or datetime.datetime.now()).strftime(TIME_FORMAT),
+            "user_input": user_input,
+            "ai_response": ai_response
+        }
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self._dropped += 1
+            if self._dropped == 1 or self._dropped % 100 == 0:
+                print(f"⚠️ 聊天记录写入队列已满，已丢弃 {self._dropped} 条")
+            return False
+
+    def close(self, timeout: float = 5.0):
+        """写入队列中剩余的记录并停止后台线程"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._worker.join(timeout)
+
+    def _run(self):
+        """后台线程：攒批后按天分组压缩写入"""
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"⚠️ 写入聊天记录失败: {str(e)}")
+
+    def _write_batch(self, batch: List[Dict]):
+        days = {}
+        for record in batch:
+            days.setdefault(record["time"][:10], []).append(record)
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        with self._file_lock:
+            for day, records in days.items():
+                payload = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                member = gzip.compress(payload.encode('utf-8'))
+                log_path, index_path = self._paths(day)
+                with open(log_path, 'ab') as f:
+                    offset = f.tell()
+                    f.write(member)
+                if offset == 0 and self.stats:
+                    self.stats.adjust(total_log_files=1)
+                entry = {
+                    "offset": offset,
+                    "length": len(member),
+                    "start": records[0]["time"],
+                    "end": records[-1]["time"],
+                    "count": len(records)
+                }
+                with open(index_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + "\n")
+
+            today = datetime.date.today()
+            if self._last_retention_day != today:
+                self._last_retention_day = today
+                self._apply_retention(today)
+
+    def _paths(self, day: str):
+        return (os.path.join(self.log_dir, f"chat_{day}.jsonl.gz"),
+                os.path.join(self.log_dir, f"chat_{day}.idx"))
+
+    def _apply_retention(self, today: datetime.date):
+        """删除超过保留天数的记录文件（retention_days<=0表示永久保留）"""
+        if self.retention_days <= 0:
+            return
+        cutoff = (today - datetime.timedelta(days=self.retention_days)).isoformat()
+        removed = 0
+        for name in os.listdir(self.log_dir):
+            match = LOG_FILE_PATTERN.match(name)
+            if match and match.group(1) < cutoff:
+                try:
+                    os.remove(os.path.join(self.log_dir, name))
+                    removed += 1
+                    if name.endswith('.jsonl.gz') and self.stats:
+                        self.stats.adjust(total_log_files=-1)
+                except OSError as e:
+                    print(f"⚠️ 删除过期聊天记录失败: {str(e)}")
+        if removed:
+            print(f"🗑️ 已清理 {removed} 个过期聊天记录文件")
+
+    # ---- 读取 ----
+
+    def read_range(self, start: datetime.datetime, end: datetime.datetime) -> List[Dict]:
+        """读取时间范围内的对话（只解压与范围重叠的gzip成员）"""
+        start_text = start.strftime(TIME_FORMAT)
+        end_text = end.strftime(TIME_FORMAT)
+        records = []
+        day = start.date()
+        while day <= end.date():
+            records.extend(
+                record for record in self._read_day(day.isoformat(), start_text, end_text)
+                if start_text <= record.get("time", "") <= end_text
+            )
+            day += datetime.timedelta(days=1)
+        return records
+
+    def _read_day(self, day: str, start_text: str, end_text: str) -> List[Dict]:
+        log_path, index_path = self._paths(day)
+        if not os.path.exists(log_path) or not os.path.exists(index_path):
+            return []
+
+        records = []
+        with self._file_lock:
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    members = [json.loads(line) for line in f if line.strip()]
+                with open(log_path, 'rb') as f:
+                    for member in members:
+                        if member["end"] < start_text or member["start"] > end_text:
+                            continue
+                        f.seek(member["offset"])
+                        data = zlib.decompressobj(wbits=31).decompress(f.read(member["length"]))
+                        records.extend(json.loads(line) for line in data.decode('utf-8').splitlines() if line)
+            except (OSError, ValueError, zlib.error) as e:
+                print(f"⚠️ 读取聊天记录 {day} 失败: {str(e)}")
+        return records
+
+    def count_log_files(self) -> int:
+        """聊天记录文件数量（每天一个）"""
+        if not os.path.isdir(self.log_dir):
+            return 0
+        return len([name for name in os.listdir(self.log_dir) if name.endswith('.jsonl.gz')])
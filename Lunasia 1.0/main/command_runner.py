@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+流式命令执行
+基于asyncio子进程：stdout/stderr 到达一块就产出一块，长时间运行的构建、脚本可以边运行边显示；
+- 输出上限：只保留开头和结尾的输出，中间部分省略（记录省略的字符数）
+- 取消：传入 threading.Event，界面设置后终止整个进程组
+- 超时：超时后同样终止进程组
+- 结束时报告退出码、耗时和CPU时间
+"""
+
+import asyncio
+import codecs
+import locale
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+READ_CHUNK_SIZE = 4096
+CANCEL_POLL_INTERVAL = 0.1
+KILL_GRACE_PERIOD = 2.0
+
+# 子进程CPU时间通过 RUSAGE_CHILDREN 的差值计算；同时运行多个命令时差值会混在一起，加锁只保证读数一致
+_rusage_lock = threading.Lock()
+
+
+def _children_cpu_times():
+    try:
+        import resource
+        with _rusage_lock:
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime, usage.ru_stime
+    except (ImportError, OSError):
+        # Windows没有resource模块，不统计CPU时间
+        return None
+
+
+class OutputBuffer:
+    """输出缓冲：超过上限时保留开头和结尾，中间省略"""
+
+    def __init__(self, max_chars: int = 100000):
+        self.head_chars = max_chars // 2
+        self.tail_chars = max_chars - self.head_chars
+        self._head = []
+        self._head_size = 0
+        self._tail = deque()
+        self._tail_size = 0
+        self.dropped_chars = 0
+
+    def append(self, text: str):
+        if self._head_size < self.head_chars:
+            part = text[:self.head_chars - self._head_size]
+            self._head.append(part)
+            self._head_size += len(part)
+            text = text[len(part):]
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > self.tail_chars:
+            overflow = self._tail_size - self.tail_chars
+            first = self._tail[0]
+            if len(first) <= overflow:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+                self.dropped_chars += len(first)
+            else:
+                self._tail[0] = first[overflow:]
+                self._tail_size -= overflow
+                self.dropped_chars += overflow
+
+    @property
+    def truncated(self) -> bool:
+        return self.dropped_chars > 0
+
+    def text(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if self.dropped_chars:
+            return f"{head}\n...（省略 {self.dropped_chars} 字符）...\n{tail}"
+        return head + tail
+
+
+def _popen_options() -> Dict:
+    # 命令在独立的进程组中运行，取消时连同shell启动的子进程一起终止
+    if sys.platform == "win32":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _terminate(process, force: bool):
+    if process.returncode is not None:
+        return
+    try:
+        if sys.platform == "win32":
+            if force:
+                subprocess.run(f"taskkill /T /F /PID {process.pid}", shell=True, capture_output=True)
+            else:
+                process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (ProcessLookupError, OSError):
+        pass
+
+
+async def stream_command(command: str, timeout: Optional[float] = 30,
+                         cancel_event: Optional[threading.Event] = None,
+                         cwd: Optional[str] = None) -> AsyncIterator[Dict]:
+    """执行shell命令，逐块产出输出
+
+    产出 {"type": "stdout"/"stderr", "text": ...}，最后产出
+    {"type": "exit", "return_code", "elapsed", "cpu_user", "cpu_system", "timed_out", "cancelled"}
+    """
+    encoding = locale.getpreferredencoding(False)
+    cpu_before = _children_cpu_times()
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_shell(
+        command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        stdin=asyncio.subprocess.DEVNULL, cwd=cwd, **_popen_options())
+
+    pending = asyncio.Queue()
+
+    async def pump(stream, name):
+        # 增量解码，多字节字符被分在两块之间时不会产生乱码
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        while True:
+            data = await stream.read(READ_CHUNK_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                await pending.put({"type": name, "text": text})
+            if not data:
+                break
+        await pending.put(None)
+
+    readers = [asyncio.ensure_future(pump(process.stdout, "stdout")),
+               asyncio.ensure_future(pump(process.stderr, "stderr"))]
+    open_streams = len(readers)
+    timed_out = cancelled = killed = False
+    deadline = start + timeout if timeout else None
+    try:
+        while open_streams:
+            if cancel_event is not None and cancel_event.is_set() and not (cancelled or timed_out):
+                cancelled = True
+                _terminate(process, force=False)
+                deadline = time.perf_counter() + KILL_GRACE_PERIOD
+            if deadline is not None and time.perf_counter() >= deadline:
+                if killed:
+                    # 强制结束后管道仍未关闭（脱离进程组的后台进程占着管道），不再等待其输出
+                    break
+                if not (timed_out or cancelled):
+                    timed_out = True
+                    _terminate(process, force=False)
+                else:
+                    # 终止信号后仍未退出，强制结束
+                    killed = True
+                    _terminate(process, force=True)
+                deadline = time.perf_counter() + KILL_GRACE_PERIOD
+            try:
+                item = await asyncio.wait_for(pending.get(), timeout=CANCEL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                continue
+            if item is None:
+                open_streams -= 1
+            else:
+                yield item
+        return_code = await process.wait()
+    finally:
+        if process.returncode is None:
+            _terminate(process, force=True)
+            await process.wait()
+        for reader in readers:
+            reader.cancel()
+
+    cpu_after = _children_cpu_times()
+    yield {
+        "type": "exit",
+        "return_code": return_code,
+        "elapsed": round(time.perf_counter() - start, 3),
+        "cpu_user": round(cpu_after[0] - cpu_before[0], 3) if cpu_before and cpu_after else None,
+        "cpu_system": round(cpu_after[1] - cpu_before[1], 3) if cpu_before and cpu_after else None,
+        "timed_out": timed_out,
+        "cancelled": cancelled
+    }
+
+
+class _AnyEvent:
+    """任一事件被设置即视为取消（调用方的取消事件 + 迭代提前结束）"""
+
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self) -> bool:
+        return any(event.is_set() for event in self.events)
+
+
+def _iter_in_new_loop(command, timeout, cancel_event, cwd) -> Iterator[Dict]:
+    loop = asyncio.new_event_loop()
+    chunks = stream_command(command, timeout=timeout, cancel_event=cancel_event, cwd=cwd)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(chunks.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        # 迭代提前结束时也要终止子进程
+        loop.run_until_complete(chunks.aclose())
+        loop.close()
+
+
+def _iter_in_thread(command, timeout, cancel_event, cwd) -> Iterator[Dict]:
+    """调用线程中已有事件循环在运行（例如在协程中同步调用工具）时，在辅助线程中运行独立的事件循环"""
+    chunks = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def run():
+        try:
+            for chunk in _iter_in_new_loop(command, timeout, _AnyEvent(cancel_event, stop), cwd):
+                chunks.put(chunk)
+        except BaseException as e:
+            chunks.put(e)
+        finally:
+            chunks.put(done)
+
+    worker = threading.Thread(target=run, name="CommandRunner", daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        worker.join()
+
+
+def iter_command(command: str, timeout: Optional[float] = 30,
+                 cancel_event: Optional[threading.Event] = None,
+                 cwd: Optional[str] = None) -> Iterator[Dict]:
+    """stream_command 的同步版本（运行独立的事件循环，供工具调用和界面线程使用）"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return _iter_in_new_loop(command, timeout, cancel_event, cwd)
+    return _iter_in_thread(command, timeout, cancel_event, cwd)
+
+
+def run_command(command: str, timeout: Optional[float] = 30, max_output_chars: int = 100000,
+                cancel_event: Optional[threading.Event] = None) -> Dict:
+    """执行命令并收集输出（输出过长时只保留开头和结尾）"""
+    stdout = OutputBuffer(max_output_chars)
+    stderr = OutputBuffer(max_output_chars)
+    summary = {}
+    for chunk in iter_command(command, timeout=timeout, cancel_event=cancel_event):
+        if chunk["type"] == "stdout":
+            stdout.append(chunk["text"])
+        elif chunk["type"] == "stderr":
+            stderr.append(chunk["text"])
+        else:
+            summary = chunk
+    summary = {key: value for key, value in summary.items() if key != "type"}
+    summary.update(stdout=stdout.text(), stderr=stderr.text(),
+                   truncated=stdout.truncated or stderr.truncated)
+    return summary
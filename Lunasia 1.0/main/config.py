@@ -23,6 +23,21 @@ def load_config():
         "default_search_engine": "baidu",  # 默认搜索引擎
         "selected_model": "deepseek-reasoner",
         "memory_summary_model": "deepseek-reasoner",  # 识底深湖总结使用的模型
+        "memory_summary_context_budget": 12000,  # 一次结构化总结的对话长度上限（字符），超出后逐轮总结
+        "memory_summary_cache_size": 5000,  # 逐轮总结缓存条目上限（memory_summary_cache.json）
+        "memory_local_summary_enabled": True,  # 简单会话使用本地抽取式总结（需要NumPy），不调用AI
+        "memory_local_summary_max_rounds": 3,  # 本地总结的会话轮数上限，超出后交给AI总结
+        "memory_local_summary_max_chars": 1200,  # 本地总结的会话总字数上限，超出后交给AI总结
+        "memory_compaction_enabled": True,  # 是否将旧记忆分层归档为日/周/月摘要
+        "memory_compaction_horizon_days": 30,  # 超过多少天的普通记忆归档为摘要（重点记忆不归档）
+        "memory_shard_cache_size": 6,  # 内存中最多缓存的月份详情分片数
+        "chat_log_enabled": True,  # 是否将完整对话按天压缩保存到chat_logs目录
+        "chat_log_retention_days": 90,  # 聊天记录保留天数（0表示永久保留）
+        "chat_log_queue_size": 1000,  # 聊天记录后台写入队列长度，写盘跟不上时丢弃新记录
+        "memory_context_top_k": 5,  # 每次提问注入的最相关历史记忆条数
+        "memory_context_recent": 5,  # 同时注入的最近历史记忆条数
+        "memory_context_max": 15,  # 注入提示词的历史记忆总数上限（含重点记忆）
+        "session_memory_max_turns": 200,  # 本次会话在内存中保留的对话轮数，更早的对话溢出到磁盘
         "max_tokens": 1000,  # AI最大token数，0表示无限制
         "window_transparency": 100,  # 窗口透明度，100表示完全不透明
         "show_remember_details": True,  # 是否显示"记住这个时刻"的详细信息
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+本地抽取式总结（识底深湖第0层总结）
+把句子表示为字符二元组的哈希向量，按余弦相似度构建句子图，用TextRank（幂迭代）为句子打分，
+每轮回答按长度比例保留得分最高的句子（按原文顺序输出），短回答同样压缩，只有一两句话时才原样保留；
+较短、较简单的会话在本地毫秒级完成，不调用AI
+需要NumPy；未安装时 NUMPY_AVAILABLE 为False，调用方应直接使用AI总结
+"""
+
+import re
+import zlib
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+SENTENCE_PATTERN = re.compile(r"[^。！？!?；;\n]+[。！？!?；;]*")
+VECTOR_DIM = 4096
+NGRAM = 2
+# 每轮回答保留原文长度的比例，以及保留字数的下限（不足下限的回答不再压缩）
+SUMMARY_RATIO = 0.4
+MIN_SUMMARY_CHARS = 60
+
+
+def split_sentences(text: str) -> List[str]:
+    """按中英文句末标点和换行切分句子"""
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.findall(text) if sentence.strip()]
+
+
+def _sentence_vectors(sentences: List[str]):
+    """句子 -> 单位化的字符二元组哈希向量矩阵"""
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        text = sentence.lower()
+        for j in range(max(1, len(text) - NGRAM + 1)):
+            rows.append(i)
+            cols.append(zlib.crc32(text[j:j + NGRAM].encode('utf-8')) % VECTOR_DIM)
+    matrix = np.zeros((len(sentences), VECTOR_DIM), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows), np.array(cols)), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def rank_sentences(sentences: List[str], damping: float = 0.85, iterations: int = 50):
+    """TextRank：返回每个句子的得分（numpy数组）"""
+    count = len(sentences)
+    if count <= 2:
+        return np.ones(count, dtype=np.float32)
+    vectors = _sentence_vectors(sentences)
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0.0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    row_sums[row_sums == 0] = 1.0
+    transition = (similarity / row_sums).T
+    scores = np.full(count, 1.0 / count, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / count + damping * (transition @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            return updated
+        scores = updated
+    return scores
+
+
+def summary_budget(length: int, max_chars: int = 300, ratio: float = SUMMARY_RATIO,
+                   min_chars: int = MIN_SUMMARY_CHARS) -> int:
+    """原文长度对应的摘要字数：按比例压缩，不低于下限、不超过上限"""
+    return min(max_chars, max(min_chars, int(length * ratio)))
+
+
+def extract_summary(text: str, max_chars: int = 300) -> str:
+    """保留得分最高的句子直到达到字数预算（按原文长度比例，不超过max_chars），按原文顺序拼接"""
+    text = text.strip()
+    max_chars = summary_budget(len(text), max_chars)
+    if len(text) <= max_chars:
+        return text
+    sentences = split_sentences(text)
+    if not sentences:
+        return text[:max_chars]
+    scores = rank_sentences(sentences)
+    chosen = set()
+    seen = set()
+    used = 0
+    for index in np.argsort(-scores, kind="stable"):
+        sentence = sentences[index]
+        if sentence in seen or (used + len(sentence) > max_chars and chosen):
+            continue
+        seen.add(sentence)
+        chosen.add(int(index))
+        used += len(sentence)
+    summary = "".join(sentences[i] for i in sorted(chosen))
+    return summary[:max_chars]
+
+
+def is_simple_session(conversations: List[Dict], max_rounds: int = 3, max_chars: int = 1200) -> bool:
+    """会话是否足够简单，可以在本地总结：轮数和总字数不超过阈值，且不包含代码块"""
+    if not conversations or len(conversations) > max_rounds:
+        return False
+    total = 0
+    for conv in conversations:
+        user_input = conv.get("user_input", "")
+        ai_response = conv.get("ai_response", "")
+        if "```" in ai_response:
+            return False
+        total += len(user_input) + len(ai_response)
+    return total <= max_chars
+
+
+def summarize_conversations(conversations: List[Dict], max_chars_per_round: int = 300) -> Optional[str]:
+    """逐轮抽取式总结，输出格式与AI逐轮总结相同（指挥官: xxx / 露尼西亚: xxx）"""
+    if not NUMPY_AVAILABLE:
+        return None
+    rounds = []
+    for conv in conversations:
+        user_input = conv.get("user_input", "").strip()
+        ai_response = extract_summary(conv.get("ai_response", ""), max_chars_per_round)
+        if user_input == "系统":
+            rounds.append(f"露尼西亚: {ai_response}")
+        else:
+            rounds.append(f"指挥官: {user_input[:max_chars_per_round // 3]}\n露尼西亚: {ai_response}")
+    return "\n\n".join(rounds)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+目录列举
+基于 os.scandir：类型判断直接使用目录项自带的信息，每个条目最多一次stat（Windows上列目录时已附带，不额外访问磁盘）
+- 可选递归（深度上限），按文件名通配符、大小、修改时间过滤
+- 按名称、大小或修改时间排序，结果分页返回，下一页通过游标继续
+- 按名称排序时，每个目录的条目各自排序后深度优先遍历，翻页从游标所在位置继续遍历，不会重新扫描已经返回过的部分；
+  按大小/修改时间排序需要遍历整棵目录树，但只在内存中保留一页大小的堆
+"""
+
+import base64
+import datetime
+import fnmatch
+import heapq
+import json
+import os
+import stat
+from typing import Dict, Iterator, List, Optional, Tuple
+
+SORT_KEYS = ("name", "size", "mtime")
+FILE_TYPES = ("all", "file", "dir")
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 2000
+
+
+def parse_bool(value) -> bool:
+    """工具参数可能以字符串传入（"true"/"是"）"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "on", "是")
+    return bool(value)
+
+
+def parse_time(value) -> Optional[float]:
+    """时间参数：时间戳或 ISO 格式日期（2024-01-01 / 2024-01-01 12:00:00）"""
+    if value in (None, ""):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.datetime.fromisoformat(str(value).strip()).timestamp()
+
+
+def encode_cursor(sort_by: str, descending: bool, key, path: str) -> str:
+    payload = json.dumps([sort_by, descending, key, path], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort_by: str, descending: bool):
+    """返回游标中的 (排序值, 路径)；游标与当前排序方式不一致时抛出ValueError"""
+    try:
+        saved_sort, saved_descending, key, path = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("游标无效")
+    if saved_sort != sort_by or saved_descending != descending:
+        raise ValueError("游标与当前的排序方式不一致")
+    return key, path
+
+
+class EntryFilter:
+    """条目过滤条件"""
+
+    def __init__(self, pattern: Optional[str] = None, file_type: str = "all",
+                 min_size: Optional[int] = None, max_size: Optional[int] = None,
+                 modified_after: Optional[float] = None, modified_before: Optional[float] = None):
+        if file_type not in FILE_TYPES:
+            raise ValueError(f"file_type 只能是 {', '.join(FILE_TYPES)}")
+        self.patterns = [item.strip() for item in pattern.split(";") if item.strip()] if pattern else []
+        self.file_type = file_type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.modified_after = modified_after
+        self.modified_before = modified_before
+
+    def needs_stat(self) -> bool:
+        return any(value is not None for value in (self.min_size, self.max_size,
+                                                   self.modified_after, self.modified_before))
+
+    def match_name(self, name: str, is_dir: bool) -> bool:
+        if self.file_type == "file" and is_dir or self.file_type == "dir" and not is_dir:
+            return False
+        if self.patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns):
+            return False
+        if is_dir and (self.min_size is not None or self.max_size is not None):
+            return False  # 大小条件只针对文件
+        return True
+
+    def match_stat(self, size: int, mtime: float) -> bool:
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.modified_after is not None and mtime < self.modified_after:
+            return False
+        if self.modified_before is not None and mtime > self.modified_before:
+            return False
+        return True
+
+
+class DirectoryLister:
+    """单次列举：scan() 产出符合条件的条目，errors 记录无法访问的目录数"""
+
+    def __init__(self, root: str, recursive: bool = False, max_depth: Optional[int] = None,
+                 entry_filter: Optional[EntryFilter] = None, descending: bool = False):
+        self.root = root
+        self.max_depth = (max_depth if max_depth is not None else 1 << 30) if recursive else 1
+        self.filter = entry_filter or EntryFilter()
+        self.descending = descending
+        self.errors = 0
+        self.scanned = 0
+
+    def _list_dir(self, path: str) -> List[os.DirEntry]:
+        try:
+            with os.scandir(path) as iterator:
+                entries = list(iterator)
+        except OSError:
+            self.errors += 1
+            return []
+        entries.sort(key=lambda entry: entry.name, reverse=self.descending)
+        return entries
+
+    def _is_after(self, name: str, cursor_name: str) -> bool:
+        return name < cursor_name if self.descending else name > cursor_name
+
+    def scan(self, resume_after: Optional[str] = None) -> Iterator[Dict]:
+        """深度优先遍历（同一目录内按名称排序）；resume_after 为上一页最后一个条目的相对路径，从它之后继续"""
+        cursor_parts = resume_after.split("/") if resume_after else None
+        # 栈中是 (目录项迭代器, 相对路径前缀, 深度, 本目录对应的游标位置)
+        stack = [(iter(self._list_dir(self.root)), "", 1, 0 if cursor_parts else None)]
+        while stack:
+            entries, prefix, depth, cursor_index = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            self.scanned += 1
+
+            if cursor_index is not None:
+                cursor_name = cursor_parts[cursor_index]
+                if entry.name != cursor_name and not self._is_after(entry.name, cursor_name):
+                    continue  # 游标之前的条目（包括其子目录）已经返回过
+                if entry.name == cursor_name:
+                    # 游标路径上的条目自身已返回过，只继续遍历其中游标之后的部分
+                    child_cursor = cursor_index + 1 if cursor_index + 1 < len(cursor_parts) else None
+                    self._push_children(stack, entry, prefix, depth, child_cursor)
+                    continue
+                # 越过游标后同一目录中剩余的条目不再受游标限制
+                stack[-1] = (entries, prefix, depth, None)
+
+            relative_path = prefix + entry.name
+            item = self._describe(entry, relative_path)
+            self._push_children(stack, entry, prefix, depth, None)
+            if item is not None:
+                yield item
+
+    def _push_children(self, stack, entry: os.DirEntry, prefix: str, depth: int, cursor_index):
+        if depth >= self.max_depth:
+            return
+        try:
+            # 不跟随符号链接，避免循环
+            is_dir = entry.is_dir(follow_symlinks=False)
+        except OSError:
+            return
+        if is_dir:
+            stack.append((iter(self._list_dir(entry.path)), prefix + entry.name + "/", depth + 1, cursor_index))
+
+    def _describe(self, entry: os.DirEntry, relative_path: str) -> Optional[Dict]:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not self.filter.match_name(entry.name, is_dir):
+            return None
+        try:
+            info = entry.stat()
+        except OSError:
+            if self.filter.needs_stat():
+                return None
+            return {"path": relative_path, "type": "dir" if is_dir else "file", "size": None, "mtime": None}
+        size = 0 if stat.S_ISDIR(info.st_mode) else info.st_size
+        if not self.filter.match_stat(size, info.st_mtime):
+            return None
+        return {"path": relative_path, "type": "dir" if is_dir else "file", "size": size, "mtime": info.st_mtime}
+
+
+def _sort_value(item: Dict, sort_by: str):
+    value = item[sort_by]
+    return value if value is not None else -1
+
+
+def list_directory(directory: str = ".", recursive: bool = False, max_depth: Optional[int] = None,
+                   entry_filter: Optional[EntryFilter] = None, sort_by: str = "name",
+                   descending: bool = False, limit: int = DEFAULT_PAGE_SIZE,
+                   cursor: Optional[str] = None) -> Dict:
+    """列出目录的一页条目，返回 {"directory", "entries", "next_cursor", "scanned", "errors"}"""
+    if sort_by not in SORT_KEYS:
+        raise ValueError(f"sort_by 只能是 {', '.join(SORT_KEYS)}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    lister = DirectoryLister(directory, recursive=recursive, max_depth=max_depth,
+                             entry_filter=entry_filter, descending=sort_by == "name" and descending)
+
+    if sort_by == "name":
+        resume_after = decode_cursor(cursor, sort_by, descending)[1] if cursor else None
+        entries = []
+        has_more = False
+        for item in lister.scan(resume_after):
+            if len(entries) == limit:
+                has_more = True  # 多取一条用于判断是否还有下一页
+                break
+            entries.append(item)
+        next_cursor = encode_cursor(sort_by, descending, None, entries[-1]["path"]) if has_more else None
+    else:
+        # (排序值, 路径) 作为全序，游标记录上一页最后一条的位置
+        after: Optional[Tuple] = tuple(decode_cursor(cursor, sort_by, descending)) if cursor else None
+
+        def order(item):
+            return (_sort_value(item, sort_by), item["path"])
+
+        candidates = lister.scan()
+        if after is not None:
+            if descending:
+                candidates = (item for item in candidates if order(item) < after)
+            else:
+                candidates = (item for item in candidates if order(item) > after)
+        select = heapq.nlargest if descending else heapq.nsmallest
+        page = select(limit + 1, candidates, key=order)
+        has_more = len(page) > limit
+        entries = page[:limit]
+        next_cursor = encode_cursor(sort_by, descending, *order(entries[-1])) if has_more else None
+
+    for item in entries:
+        if item["mtime"] is not None:
+            item["mtime"] = datetime.datetime.fromtimestamp(item["mtime"]).strftime("%Y-%m-%d %H:%M:%S")
+    return {
+        "directory": directory,
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "scanned": lister.scanned,
+        "errors": lister.errors
+    }
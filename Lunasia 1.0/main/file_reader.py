@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+文件读取
+大文件通过 mmap 按需访问，只读取需要的部分：读取字节范围、开头/结尾若干行的开销只与读取的片段大小有关；
+按行号读取需要从头统计换行符（按块计数，不解码），grep 查找ASCII字面量时直接在字节上匹配
+- 编码检测：BOM -> UTF-8 -> GBK -> GB18030，只检查文件开头的一段
+- 输出上限：结果文字超过上限时截断并注明，同时提示如何继续读取
+"""
+
+import codecs
+import mmap
+import os
+import re
+from collections import deque
+from typing import Dict, Optional
+
+READ_MODES = ("auto", "head", "tail", "lines", "bytes", "grep")
+DEFAULT_MAX_CHARS = 20000
+HARD_MAX_CHARS = 200000
+DEFAULT_LINES = 100
+SNIFF_BYTES = 64 * 1024
+MMAP_THRESHOLD = 1024 * 1024
+# 解码前最多读取的字节数（每个字符最多4字节），保证读取量与输出上限成正比
+BYTES_PER_CHAR = 4
+# 可以直接在字节上查找ASCII字面量的编码（多字节字符的每个字节都不在ASCII范围内）
+BYTE_GREP_ENCODINGS = ("utf-8", "utf-8-sig")
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def detect_encoding(sample: bytes) -> Optional[str]:
+    """根据文件开头的字节判断编码；看起来是二进制文件时返回None"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b"\x00" in sample:
+        return None
+    for encoding in ("utf-8", "gbk", "gb18030"):
+        # 样本末尾可能截断了一个多字节字符，用增量解码器忽略末尾不完整的部分
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"  # 无法判断时按UTF-8读取，无效字节显示为替换字符
+
+
+def _decode(data: bytes, encoding: str, at_start: bool = True):
+    """解码字节片段，返回 (文字, 开头跳过的字节数)；末尾不完整的多字节字符不解码"""
+    skipped = 0
+    if not at_start and encoding in ("utf-8", "utf-8-sig"):
+        # 从文件中间开始读取时跳过被截断的UTF-8多字节字符的后续字节
+        while skipped < min(len(data), 3) and 0x80 <= data[skipped] <= 0xBF:
+            skipped += 1
+        data = data[skipped:]
+        encoding = "utf-8"
+    return codecs.getincrementaldecoder(encoding)(errors="replace").decode(data, final=False), skipped
+
+
+def _count_newlines(buffer, start: int, end: int, chunk_size: int = 1024 * 1024) -> int:
+    """统计 [start, end) 中的换行数（分块进行，不复制整个范围）"""
+    count = 0
+    for position in range(start, end, chunk_size):
+        count += buffer[position:min(end, position + chunk_size)].count(b"\n")
+    return count
+
+
+def _line_start(buffer, line_number: int, chunk_size: int = 1024 * 1024) -> int:
+    """第 line_number 行（从1开始）的起始字节位置，行数不足时返回文件长度
+
+    先按块统计换行数跳过整块，只在目标所在的块内逐个查找
+    """
+    remaining = line_number - 1
+    position = 0
+    size = len(buffer)
+    while remaining > 0 and position < size:
+        chunk_end = min(size, position + chunk_size)
+        count = buffer[position:chunk_end].count(b"\n")
+        if count < remaining:
+            remaining -= count
+            position = chunk_end
+            continue
+        for _ in range(remaining):
+            position = buffer.find(b"\n", position, chunk_end) + 1
+        return position
+    return position if remaining == 0 else size
+
+
+def _after_lines(buffer, start: int, count: int, limit: int) -> int:
+    """从 start 开始 count 行之后的字节位置（不超过 limit）"""
+    position = start
+    for _ in range(count):
+        newline = buffer.find(b"\n", position, limit)
+        if newline < 0:
+            return limit
+        position = newline + 1
+    return position
+
+
+def _tail_start(buffer, count: int, floor: int = 0) -> int:
+    """最后 count 行的起始字节位置（不早于 floor）"""
+    end = len(buffer)
+    if end and buffer[end - 1:end] == b"\n":
+        end -= 1  # 文件末尾的换行不算作一行
+    position = end
+    for _ in range(count):
+        newline = buffer.rfind(b"\n", floor, position)
+        if newline < 0:
+            return floor
+        position = newline
+    return position + 1
+
+
+class FileReader:
+    """以 bytes 或 mmap 方式打开的只读文件（两者都支持 find/rfind/切片/正则）"""
+
+    def __init__(self, path: str, encoding: Optional[str] = None):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._file = open(path, "rb")
+        self._mmap = None
+        try:
+            if self.size >= MMAP_THRESHOLD:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.buffer = self._mmap
+            else:
+                self.buffer = self._file.read()
+        except Exception:
+            self.close()
+            raise
+        self.encoding = encoding or detect_encoding(self.buffer[:SNIFF_BYTES])
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _slice(self, start: int, end: int, max_chars: int) -> Dict:
+        """解码 [start, end) 字节范围，超过字符上限时截断"""
+        byte_limit = max_chars * BYTES_PER_CHAR
+        truncated = end - start > byte_limit
+        text, skipped = _decode(self.buffer[start:min(end, start + byte_limit)], self.encoding, at_start=start == 0)
+        if len(text) > max_chars:
+            text = text[:max_chars]
+            truncated = True
+        next_offset = end if end < self.size else None
+        if truncated:
+            # 下次读取的起始位置：已返回的文字对应的字节数（UTF-16无法从中间续读）
+            next_offset = None
+            if self.encoding != "utf-16":
+                encoding = self.encoding if start == 0 else "utf-8" if self.encoding == "utf-8-sig" else self.encoding
+                next_offset = start + skipped + len(text.encode(encoding, errors="replace"))
+        if truncated and next_offset is not None:
+            end = next_offset  # 实际返回到的位置
+        return {"text": text, "truncated": truncated, "start": start, "end": end, "next_offset": next_offset}
+
+    def _line_limit(self, start: int, max_chars: int) -> int:
+        # 按行查找的范围：多出1字节，_slice 才能判断出需要截断
+        return min(self.size, start + max_chars * BYTES_PER_CHAR + 1)
+
+    def read_head(self, lines: int, max_chars: int) -> Dict:
+        return self._slice(0, _after_lines(self.buffer, 0, lines, self._line_limit(0, max_chars)), max_chars)
+
+    def read_tail(self, lines: int, max_chars: int) -> Dict:
+        # 只保留结尾：超出上限时从后往前截取
+        floor = max(0, self.size - max_chars * BYTES_PER_CHAR)
+        start = _tail_start(self.buffer, lines, floor)
+        text, _ = _decode(self.buffer[start:self.size], self.encoding, at_start=start == 0)
+        truncated = start == floor and floor > 0 and self.buffer[floor - 1:floor] != b"\n"
+        if len(text) > max_chars:
+            text = text[-max_chars:]
+            truncated = True
+        return {"text": text, "truncated": truncated, "start": start, "end": self.size, "next_offset": None}
+
+    def read_lines(self, start_line: int, end_line: Optional[int], max_chars: int) -> Dict:
+        start = _line_start(self.buffer, max(1, start_line))
+        if end_line is None:
+            end = self.size
+        else:
+            end = _after_lines(self.buffer, start, max(0, end_line - max(1, start_line) + 1),
+                               self._line_limit(start, max_chars))
+        return self._slice(start, end, max_chars)
+
+    def read_bytes(self, offset: int, length: Optional[int], max_chars: int) -> Dict:
+        start = min(max(0, offset), self.size)
+        end = self.size if length is None else min(self.size, start + max(0, length))
+        return self._slice(start, end, max_chars)
+
+    def grep(self, pattern: str, regex: bool = False, ignore_case: bool = False,
+             context: int = 0, max_matches: int = 100, max_chars: int = DEFAULT_MAX_CHARS) -> Dict:
+        """查找匹配的行，返回带行号的结果
+
+        ASCII字面量在UTF-8文件中直接按字节匹配，不解码整个文件；其余情况逐行解码后匹配
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        if regex or not pattern.isascii() or self.encoding not in BYTE_GREP_ENCODINGS:
+            # 字节正则会把非ASCII字符类拆成单个字节，GBK的后续字节也可能与ASCII相同，都会误匹配
+            return self._grep_text(pattern, regex, flags, context, max_matches, max_chars)
+        matcher = re.compile(re.escape(pattern).encode("ascii"), flags | re.MULTILINE)
+
+        parts = []
+        total_chars = 0
+        matches = 0
+        truncated = False
+        line_number = 1
+        counted_to = 0
+        last_end = -1  # 已输出内容的结束位置，避免上下文重复
+        for match in matcher.finditer(self.buffer):
+            line_begin = self.buffer.rfind(b"\n", 0, match.start()) + 1
+            if line_begin < last_end:
+                continue  # 与上一个匹配同一行或在其上下文中
+            line_number += _count_newlines(self.buffer, counted_to, line_begin)
+            counted_to = line_begin
+            block_start = line_begin
+            first_line = line_number
+            for _ in range(context):
+                if block_start == 0 or block_start <= last_end:
+                    break
+                block_start = self.buffer.rfind(b"\n", 0, block_start - 1) + 1
+                first_line -= 1
+            block_end = _after_lines(self.buffer, line_begin, context + 1, self.size)
+            lines = _decode(self.buffer[block_start:block_end], self.encoding)[0].splitlines()
+            block = "\n".join(f"{first_line + index}: {line}" for index, line in enumerate(lines))
+            if last_end >= 0 and block_start > last_end and context:
+                block = "--\n" + block
+            last_end = block_end
+            matches += 1
+            if total_chars + len(block) > max_chars:
+                truncated = True
+                break
+            parts.append(block)
+            total_chars += len(block) + 1
+            if matches >= max_matches:
+                truncated = matcher.search(self.buffer, block_end) is not None
+                break
+        return {"text": "\n".join(parts), "truncated": truncated, "matches": len(parts), "next_offset": None}
+
+    def _grep_text(self, pattern, regex, flags, context, max_matches, max_chars) -> Dict:
+        matcher = re.compile(pattern if regex else re.escape(pattern), flags)
+        parts = []
+        total_chars = 0
+        truncated = False
+        before = deque(maxlen=context)
+        block = None
+        after_remaining = 0
+        with open(self.path, "r", encoding=self.encoding, errors="replace", newline=None) as f:
+            for number, raw_line in enumerate(f, 1):
+                raw_line = raw_line.rstrip("\n")
+                line = f"{number}: {raw_line}"
+                if matcher.search(raw_line):
+                    if block is None:
+                        if len(parts) >= max_matches:
+                            truncated = True
+                            break
+                        block = list(before)
+                    block.append(line)
+                    after_remaining = context
+                elif block is not None and after_remaining:
+                    block.append(line)
+                    after_remaining -= 1
+                if block is not None and not after_remaining:
+                    text = "\n".join(block)
+                    if total_chars + len(text) > max_chars:
+                        truncated = True
+                        block = None
+                        break
+                    parts.append(text)
+                    total_chars += len(text) + 1
+                    block = None
+                    before.clear()
+                    continue
+                if block is None:
+                    before.append(line)
+        if block is not None:
+            parts.append("\n".join(block))
+        return {"text": "\n".join(parts), "truncated": truncated, "matches": len(parts), "next_offset": None}
+
+
+def read_text(path: str, mode: str = "auto", lines: Optional[int] = None, start_line: Optional[int] = None,
+              end_line: Optional[int] = None, offset: Optional[int] = None, length: Optional[int] = None,
+              pattern: Optional[str] = None, regex: bool = False, ignore_case: bool = False, context: int = 0,
+              max_matches: int = 100, max_chars: int = DEFAULT_MAX_CHARS, encoding: Optional[str] = None) -> Dict:
+    """按模式读取文件，返回 {"text", "truncated", "encoding", "size", "next_offset", ...}
+
+    mode: auto（整个文件，超出上限时截断）/ head / tail / lines（start_line~end_line）/ bytes（offset, length）/ grep（pattern）
+    """
+    if mode not in READ_MODES:
+        raise ValueError(f"mode 只能是 {', '.join(READ_MODES)}")
+    max_chars = max(1, min(int(max_chars), HARD_MAX_CHARS))
+    with FileReader(path, encoding) as reader:
+        if reader.encoding is None:
+            return {"binary": True, "size": reader.size, "encoding": None, "text": "", "truncated": False, "next_offset": None}
+        if mode == "auto":
+            result = reader.read_bytes(0, None, max_chars)
+        elif mode == "head":
+            result = reader.read_head(lines or DEFAULT_LINES, max_chars)
+        elif mode == "tail":
+            result = reader.read_tail(lines or DEFAULT_LINES, max_chars)
+        elif mode == "lines":
+            if start_line is None:
+                raise ValueError("lines 模式需要 start_line")
+            result = reader.read_lines(start_line, end_line, max_chars)
+        elif mode == "bytes":
+            result = reader.read_bytes(offset or 0, length, max_chars)
+        else:
+            if not pattern:
+                raise ValueError("grep 模式需要 pattern")
+            result = reader.grep(pattern, regex=regex, ignore_case=ignore_case, context=context,
+                                 max_matches=max_matches, max_chars=max_chars)
+        result.update(encoding=reader.encoding, size=reader.size, binary=False)
+        return result
@@ -721,6 +721,13 @@ class AIAgentApp(QMainWindow):
             # 保存未保存的会话记录到识底深湖
             self.save_unsaved_conversations()
             
+            # 后台总结线程不再领取新批次，未完成的批次保留在待总结队列中
+            self.agent.memory_lake.summary_queue.stop()
+            
+            # 写完队列中剩余的聊天记录
+            if self.agent.memory_lake.chat_log:
+                self.agent.memory_lake.chat_log.close()
+            
             # 显示退出消息
             self.statusBar().showMessage("正在保存会话记录...")
             
@@ -741,20 +748,16 @@ class AIAgentApp(QMainWindow):
                 return
             
             # 获取当前会话中的对话记录
-            session_conversations = getattr(self.agent, 'session_conversations', [])
+            session_conversations = getattr(self.agent, 'session_conversations', None)
             
-            if not session_conversations:
+            if not session_conversations or not session_conversations.total_count():
                 print("📝 没有需要保存的会话记录")
                 return
             
-            print(f"📝 开始保存 {len(session_conversations)} 条会话记录到识底深湖")
+            print(f"📝 开始保存 {session_conversations.total_count()} 条会话记录到识底深湖")
             
-            # 🚀 修复：过滤出未保存的对话记录
-            unsaved_conversations = []
-            for conv in session_conversations:
-                # 检查对话是否已经被保存过（通过检查saved标记）
-                if not conv.get('saved', False):
-                    unsaved_conversations.append(conv)
+            # 🚀 修复：过滤出未保存的对话记录（按已保存位图，包括已溢出到磁盘的较早对话）
+            unsaved_conversations = session_conversations.unsaved()
             
             if not unsaved_conversations:
                 print("📝 所有对话记录都已经保存过了")
@@ -772,18 +775,14 @@ class AIAgentApp(QMainWindow):
                     self.agent.memory_lake.add_conversation(user_input, ai_response, self.agent.developer_mode, self.agent._mark_conversation_as_saved)
             
             # 🚀 修复：强制保存当前会话（即使不足3条）
+            # 只加入持久化的后台总结队列，不在退出时等待AI接口；未完成的批次下次启动继续总结
             if self.agent.memory_lake.current_conversation:
-                topic = self.agent.memory_lake.summarize_and_save_topic(force_save=True)
-                if topic:
-                    print(f"✅ 退出时保存会话主题: {topic}")
-                    # 🚀 修复：在成功保存后，标记所有对话为已保存
-                    for conv in unsaved_conversations:
-                        conv['saved'] = True
-                else:
-                    print("✅ 退出时保存会话记录完成")
-                    # 🚀 修复：即使保存失败，也标记为已保存，避免重复尝试
-                    for conv in unsaved_conversations:
-                        conv['saved'] = True
+                batch_id = self.agent.memory_lake.enqueue_current_conversation()
+                if batch_id:
+                    print(f"✅ 退出时已加入后台总结队列: {batch_id}")
+                # 🚀 修复：已交给持久化队列，标记为已保存，避免重复加入
+                for conv in unsaved_conversations:
+                    session_conversations.mark_seq_saved(conv["seq"])
             
             # 🚀 修复：不清空session_conversations，只标记为已保存
             # 这样可以避免重复保存，同时保留对话历史
@@ -7,63 +7,157 @@ MCP客户端
 import asyncio
 import json
 import aiohttp
-from typing import Dict, List, Any, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 class MCPClient:
-    def __init__(self, server_url: str = "http://localhost:8000"):
+    """HTTP MCP客户端
+    
+    同一个客户端复用一个持久会话（连接数上限 + keep-alive），连接失败时自动重试（工具调用只在请求没有发出时重试）；
+    每次调用的超时按工具单独设置（tool_timeouts），没有设置的使用默认超时
+    """
+    
+    def __init__(self, server_url: str = "http://localhost:8000", timeout: float = 30,
+                 max_connections: int = 10, retries: int = 2, tool_timeouts: Optional[Dict[str, float]] = None):
         self.server_url = server_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.retries = retries
+        self.tool_timeouts = dict(tool_timeouts or {})
         self.session = None
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        self._get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
+        await self.close()
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+    
+    async def close(self):
+        if self.session and not self.session.closed:
             await self.session.close()
+        self.session = None
+    
+    async def _request(self, method: str, path: str, timeout: float, **kwargs):
+        """发送请求并读取JSON响应，返回 (状态码, 内容)
+        
+        只在连接没有建立（请求没有到达服务端）时重试；连接中途断开时服务端可能已经开始执行工具，
+        只有不改变状态的GET请求才重试，避免重复执行有副作用的工具
+        """
+        retry_errors = (aiohttp.ClientConnectorError,)
+        if method == "GET":
+            retry_errors += (aiohttp.ServerDisconnectedError,)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._get_session().request(
+                    method, f"{self.server_url}{path}",
+                    timeout=aiohttp.ClientTimeout(total=timeout), **kwargs
+                ) as response:
+                    if response.status == 200:
+                        return response.status, await response.json()
+                    return response.status, None
+            except retry_errors:
+                if attempt >= self.retries:
+                    raise
+                await asyncio.sleep(0.2 * (2 ** attempt))
     
     async def call_tool(self, tool_name: str, **kwargs) -> str:
         """调用MCP工具"""
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-            
             payload = {
                 "tool": tool_name,
                 "parameters": kwargs
             }
-            
-            async with self.session.post(
-                f"{self.server_url}/tools/call",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    return result.get("result", "调用成功但无返回结果")
-                else:
-                    return f"调用失败: HTTP {response.status}"
+            status, result = await self._request(
+                "POST", "/tools/call", self.tool_timeouts.get(tool_name, self.timeout), json=payload)
+            if status == 200:
+                return result.get("result", "调用成功但无返回结果")
+            else:
+                return f"调用失败: HTTP {status}"
         
         except asyncio.TimeoutError:
             return f"调用超时: {tool_name}"
         except Exception as e:
             return f"调用失败: {str(e)}"
     
-    async def list_tools(self) -> List[str]:
-        """获取可用工具列表"""
+    async def call_tools_batch(self, calls: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """一次请求执行多个工具调用，按完成顺序逐个产出结果
+        
+        calls: [{"tool": 工具名, "parameters": {...}, "id": 可选}, ...]
+        产出: {"id": ..., "tool": ..., "result": ...}，失败的调用 result 为错误说明
+        服务端不支持批量接口时退回为并发的单次调用
+        """
+        items = []
+        for index, call in enumerate(calls):
+            tool_name = call["tool"]
+            items.append({
+                "id": call.get("id", index),
+                "tool": tool_name,
+                "parameters": call.get("parameters") or {},
+                "timeout": self.tool_timeouts.get(tool_name, self.timeout)
+            })
+        if not items:
+            return
+        tools_by_id = {item["id"]: item["tool"] for item in items}
+        pending = set(tools_by_id)
+        fallback = False
+        error = "调用失败: 服务端没有返回结果"
+        
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-            
-            async with self.session.get(
-                f"{self.server_url}/tools/list",
-                timeout=aiohttp.ClientTimeout(total=10)
+            async with self._get_session().post(
+                f"{self.server_url}/tools/batch",
+                json={"calls": items},
+                # 不限制总时间：服务端对每一项（包括排队等待并发名额的时间）各自计时，超时的项会返回超时错误；
+                # 客户端只限制两次读取之间的间隔，服务端无响应时不会一直等待
+                timeout=aiohttp.ClientTimeout(total=None, sock_read=max(item["timeout"] for item in items) + 5)
             ) as response:
                 if response.status == 200:
-                    result = await response.json()
-                    return result.get("tools", [])
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+                        body = json.loads(line)
+                        pending.discard(body.get("id"))
+                        yield {
+                            "id": body.get("id"),
+                            "tool": tools_by_id.get(body.get("id")),
+                            "result": body.get("result", body.get("error", "调用成功但无返回结果"))
+                        }
+                elif response.status in (404, 405):
+                    fallback = True
                 else:
-                    return []
+                    error = f"调用失败: HTTP {response.status}"
+        except asyncio.TimeoutError:
+            error = "调用超时"
+        except Exception as e:
+            error = f"调用失败: {str(e)}"
+        
+        if not fallback:
+            # 批量请求中途失败时不重发（工具可能已经执行），剩余的调用直接返回错误
+            for call_id in list(pending):
+                yield {"id": call_id, "tool": tools_by_id[call_id], "result": error}
+            return
+        
+        # 服务端没有批量接口：并发逐个发送
+        async def call_one(item):
+            return item, await self.call_tool(item["tool"], **item["parameters"])
+        
+        for finished in asyncio.as_completed([call_one(item) for item in items]):
+            item, result = await finished
+            yield {"id": item["id"], "tool": item["tool"], "result": result}
+    
+    async def list_tools(self) -> List[str]:
+        """获取可用工具列表"""
+        try:
+            status, result = await self._request("GET", "/tools/list", 10)
+            if status == 200:
+                return result.get("tools", [])
+            else:
+                return []
         
         except Exception as e:
             print(f"获取工具列表失败: {str(e)}")
@@ -72,17 +166,11 @@ class MCPClient:
     async def get_tool_info(self, tool_name: str) -> Dict[str, Any]:
         """获取工具信息"""
         try:
-            if not self.session:
-                self.session = aiohttp.ClientSession()
-            
-            async with self.session.get(
-                f"{self.server_url}/tools/{tool_name}",
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                else:
-                    return {}
+            status, result = await self._request("GET", f"/tools/{tool_name}", 10)
+            if status == 200:
+                return result
+            else:
+                return {}
         
         except Exception as e:
             print(f"获取工具信息失败: {str(e)}")
@@ -107,4 +195,14 @@ class LocalMCPClient:
         """获取工具信息"""
         return self.server.get_tool_info(tool_name)
     
-
+    async def call_tools_batch(self, calls: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """并发调用多个本地工具，按完成顺序逐个产出结果（与MCPClient相同的接口）"""
+        loop = asyncio.get_running_loop()
+        
+        async def call_one(index, call):
+            result = await loop.run_in_executor(
+                None, lambda: self.server.call_tool(call["tool"], **(call.get("parameters") or {})))
+            return {"id": call.get("id", index), "tool": call["tool"], "result": result}
+        
+        for finished in asyncio.as_completed([call_one(index, call) for index, call in enumerate(calls)]):
+            yield await finished
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+MCP HTTP服务
+把 LocalMCPServer 的工具以 MCPClient 使用的接口提供出来，多个露尼西亚实例或脚本可以共用一个已预热的工具进程：
+    POST /tools/call          {"tool": 工具名, "parameters": {...}} -> {"result": ...}
+    POST /tools/batch         {"calls": [{"id": ..., "tool": ..., "parameters": {...}, "timeout": 秒}, ...]}
+                              -> 按完成顺序逐行返回 {"id": ..., "result": ...} 或 {"id": ..., "error": ...}（NDJSON）
+    GET  /tools/list          -> {"tools": [...]}
+    GET  /tools/{name}        -> 工具信息
+    GET  /tools/{name}/info   -> 工具信息
+
+工具函数是阻塞调用，在线程池中执行；每个工具有并发上限，每次调用有超时（包括排队等待的时间，排队超时返回503）；连接默认保持（keep-alive）
+
+用法:
+    python mcp_http_server.py --port 8000
+默认只监听 127.0.0.1（工具可以读写文件、执行命令，不要暴露到局域网）
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import json
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from mcp_server import LocalMCPServer
+
+MAX_BATCH_CALLS = 64
+
+
+class MCPHttpServer:
+    """LocalMCPServer 的 HTTP 包装"""
+
+    def __init__(self, server: Optional[LocalMCPServer] = None, max_concurrency_per_tool: int = 4,
+                 request_timeout: float = 120.0, max_workers: int = 8):
+        self.server = server or LocalMCPServer()
+        self.max_concurrency_per_tool = max_concurrency_per_tool
+        self.request_timeout = request_timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="MCPTool")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.post("/tools/call", self.handle_call),
+            web.post("/tools/batch", self.handle_batch),
+            web.get("/tools/list", self.handle_list),
+            web.get("/tools/{name}/info", self.handle_info),
+            web.get("/tools/{name}", self.handle_info),
+        ])
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(tool_name)
+        if semaphore is None:
+            semaphore = self._semaphores[tool_name] = asyncio.Semaphore(self.max_concurrency_per_tool)
+        return semaphore
+
+    def _submit(self, semaphore: asyncio.Semaphore, tool_name: str, parameters: Dict):
+        """在线程池中执行工具；名额在线程中的调用真正结束后才归还
+        
+        超时只是不再等待，调用仍然占用线程，不能让新的调用因此超过并发上限
+        """
+        loop = asyncio.get_running_loop()
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                pass  # 服务已关闭，事件循环不再运行
+
+        try:
+            future = self.executor.submit(functools.partial(self.server.call_tool, tool_name, **parameters))
+        except Exception:
+            semaphore.release()
+            raise
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    async def _invoke(self, tool_name: str, parameters: Dict, timeout: Optional[float] = None):
+        """执行一次工具调用，返回 (HTTP状态码, 响应内容)"""
+        if tool_name not in self.server.tools:
+            return 404, {"error": f"工具不存在: {tool_name}"}
+        timeout = min(timeout or self.request_timeout, self.request_timeout)
+        semaphore = self._semaphore(tool_name)
+        loop = asyncio.get_running_loop()
+        # 排队等待名额和执行共用同一个截止时间，卡住的调用不会让排在后面的请求无限等待
+        deadline = loop.time() + timeout
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ 工具 {tool_name} 排队超过 {timeout} 秒，同时进行的调用已达上限")
+            return 503, {"error": f"工具繁忙，排队超时: {tool_name}"}
+        try:
+            call = self._submit(semaphore, tool_name, parameters)
+            result = await asyncio.wait_for(asyncio.shield(call), timeout=max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            # 线程中的调用无法中断，只是不再等待；标记了sandbox的工具由沙箱按自己的超时终止进程
+            print(f"⚠️ 工具 {tool_name} 调用超过 {timeout} 秒")
+            return 504, {"error": f"调用超时: {tool_name}"}
+        except Exception as e:
+            # 单个调用出错只影响这一个结果（批量调用的响应此时已经开始发送）
+            print(f"⚠️ 工具 {tool_name} 调用出错: {str(e)}")
+            return 500, {"error": f"调用工具失败: {str(e)}"}
+        return 200, {"result": result}
+
+    @staticmethod
+    def _parse_call(item: Dict):
+        tool_name = item["tool"]
+        if not isinstance(tool_name, str):
+            raise ValueError("tool必须是字符串")
+        parameters = item.get("parameters") or {}
+        if not isinstance(parameters, dict):
+            raise ValueError("parameters必须是对象")
+        return tool_name, parameters
+
+    async def handle_call(self, request: web.Request) -> web.Response:
+        try:
+            tool_name, parameters = self._parse_call(await request.json())
+        except (ValueError, KeyError, TypeError) as e:
+            return web.json_response({"error": f"请求格式错误: {str(e)}"}, status=400)
+
+        # 自定义工具文件有变化时才重新加载（未变化时只有一次stat）
+        self.server.reload_custom_tools()
+        status, body = await self._invoke(tool_name, parameters)
+        return web.json_response(body, status=status)
+
+    async def handle_batch(self, request: web.Request) -> web.StreamResponse:
+        """一次请求执行多个工具调用，结果按完成顺序逐行写回"""
+        try:
+            calls = (await request.json())["calls"]
+            if not isinstance(calls, list) or len(calls) > MAX_BATCH_CALLS:
+                raise ValueError(f"calls必须是不超过{MAX_BATCH_CALLS}项的列表")
+            parsed = [(item.get("id", index), *self._parse_call(item), item.get("timeout"))
+                      for index, item in enumerate(calls)]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return web.json_response({"error": f"请求格式错误: {str(e)}"}, status=400)
+
+        self.server.reload_custom_tools()
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+
+        async def run(call_id, tool_name, parameters, timeout):
+            _, body = await self._invoke(tool_name, parameters, timeout)
+            return dict(body, id=call_id)
+
+        for finished in asyncio.as_completed([run(*call) for call in parsed]):
+            body = await finished
+            await response.write((json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def handle_list(self, request: web.Request) -> web.Response:
+        self.server.reload_custom_tools()
+        return web.json_response({"tools": self.server.list_tools()})
+
+    async def handle_info(self, request: web.Request) -> web.Response:
+        self.server.reload_custom_tools()
+        info = self.server.get_tool_info(request.match_info["name"])
+        if not info:
+            return web.json_response({}, status=404)
+        return web.json_response(info)
+
+    async def _on_cleanup(self, app):
+        self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="露尼西亚MCP HTTP服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, default=4, help="每个工具同时执行的调用数上限")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单次调用超时（秒）")
+    parser.add_argument("--workers", type=int, default=8, help="执行工具的线程数")
+    parser.add_argument("--keepalive", type=float, default=75.0, help="空闲连接保持时间（秒）")
+    args = parser.parse_args()
+
+    http_server = MCPHttpServer(max_concurrency_per_tool=args.concurrency,
+                                request_timeout=args.timeout, max_workers=args.workers)
+    print(f"✅ MCP HTTP服务已启动: http://{args.host}:{args.port}（{len(http_server.server.list_tools())} 个工具）")
+    web.run_app(http_server.create_app(), host=args.host, port=args.port,
+                keepalive_timeout=args.keepalive, print=None)
+
+
+if __name__ == "__main__":
+    main()
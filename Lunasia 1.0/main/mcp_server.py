@@ -10,7 +10,23 @@ import sys
 import subprocess
 import platform
 import datetime
+import hashlib
+import threading
 from typing import Dict, List, Any, Optional
+from tool_loader import compile_tool_source, dispatch_custom_tool, exec_tool_module
+from tool_sandbox import get_default_sandbox
+from tool_cache import CachePolicy, ToolResultCache, file_stamp, is_json_object
+from command_runner import iter_command, run_command
+from file_lister import DEFAULT_PAGE_SIZE, EntryFilter, list_directory, parse_bool, parse_time
+from file_reader import DEFAULT_MAX_CHARS as READ_DEFAULT_MAX_CHARS, read_text
+
+CUSTOM_TOOLS_FILE = "custom_tools.json"
+NOTES_DIR = "notes"
+# 自定义工具的策略字段："sandbox": true 表示在进程池中运行，"cache_ttl" 为结果缓存秒数，其余字段可选
+TOOL_POLICY_KEYS = ("sandbox", "timeout", "memory_limit_mb", "max_result_chars", "cache_ttl")
+# execute_command 的超时（秒）和 stdout/stderr 各自保留的最大字符数（超出时保留开头和结尾）
+COMMAND_TIMEOUT = 30
+COMMAND_MAX_OUTPUT_CHARS = 100000
 
 class LocalMCPServer:
     """本地MCP服务器 - 简化版本"""
@@ -29,53 +45,138 @@ class LocalMCPServer:
             "search_notes": self.search_notes,
             "get_weather_info": self.get_weather_info,
             "calculate": self.calculate,
-            "get_memory_stats": self.get_memory_stats
+            "get_memory_stats": self.get_memory_stats,
+            "get_tool_cache_stats": self.get_tool_cache_stats
+        }
+        
+        # 工具结果缓存：纯函数或变化缓慢的工具在有效期内直接返回上次结果
+        self.result_cache = ToolResultCache()
+        self.builtin_cache_policies = {
+            # 只缓存返回的天气JSON；密钥未配置等说明文字不缓存，配置密钥后立即生效
+            "get_weather_info": CachePolicy(600, key=lambda kwargs: kwargs.get("city", "北京"), cacheable=is_json_object),
+            "list_notes": CachePolicy(300, key=lambda kwargs: (), stamp=lambda kwargs: file_stamp(NOTES_DIR)),
+            "search_notes": CachePolicy(60, key=lambda kwargs: kwargs.get("keyword"), stamp=lambda kwargs: file_stamp(NOTES_DIR)),
+        }
+        self.cache_policies = dict(self.builtin_cache_policies)
+        # 写入类工具执行后清除受影响工具的缓存
+        self.cache_invalidations = {
+            "create_note": ("list_notes", "search_notes"),
+            "write_file": ("list_notes", "search_notes"),
         }
+        self._static_system_info = None
+        
+        # 自定义工具热重载状态：文件 (mtime, 大小)、内容摘要、各工具代码摘要
+        self._custom_tools_stamp = None
+        self._custom_tools_digest = None
+        self._custom_tool_digests = {}  # 工具名 -> 代码摘要
+        self._custom_tools_lock = threading.Lock()
         
         # 加载自定义工具
         self.load_custom_tools()
     
     def get_system_info(self) -> str:
         """获取系统信息"""
-        info = {
-            "platform": platform.system(),
-            "platform_version": platform.version(),
-            "architecture": platform.architecture()[0],
-            "processor": platform.processor(),
-            "python_version": sys.version,
-            "current_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+        # 平台信息不会变化（platform.processor()在部分系统上需要启动子进程），只查询一次；当前时间每次重新获取
+        if self._static_system_info is None:
+            self._static_system_info = {
+                "platform": platform.system(),
+                "platform_version": platform.version(),
+                "architecture": platform.architecture()[0],
+                "processor": platform.processor(),
+                "python_version": sys.version
+            }
+        info = dict(self._static_system_info, current_time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         return json.dumps(info, ensure_ascii=False, indent=2)
     
-    def list_files(self, directory: str = ".") -> str:
-        """列出指定目录的文件"""
+    def list_files(self, directory: str = ".", recursive: bool = False, max_depth: int = None,
+                   pattern: str = None, file_type: str = "all", min_size: int = None, max_size: int = None,
+                   modified_after: str = None, modified_before: str = None, sort_by: str = "name",
+                   descending: bool = False, limit: int = 200, cursor: str = None) -> str:
+        """列出指定目录的文件（JSON，分页）
+        
+        可选参数: recursive 是否递归, max_depth 递归深度, pattern 文件名通配符（多个用;分隔，如 *.py;*.txt）,
+        file_type all/file/dir, min_size/max_size 字节数, modified_after/modified_before 日期（2024-01-01）,
+        sort_by name/size/mtime, descending 是否倒序, limit 每页条数, cursor 上一页返回的 next_cursor
+        """
         try:
             if not os.path.exists(directory):
                 return f"目录不存在: {directory}"
-            
-            files = []
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                if os.path.isfile(item_path):
-                    size = os.path.getsize(item_path)
-                    files.append(f"文件: {item} ({size} bytes)")
-                elif os.path.isdir(item_path):
-                    files.append(f"目录: {item}/")
-            
-            return f"目录 {directory} 的内容:\n" + "\n".join(files)
+            if not os.path.isdir(directory):
+                return f"不是目录: {directory}"
+            
+            entry_filter = EntryFilter(
+                pattern=pattern,
+                file_type=file_type or "all",
+                min_size=int(min_size) if min_size not in (None, "") else None,
+                max_size=int(max_size) if max_size not in (None, "") else None,
+                modified_after=parse_time(modified_after),
+                modified_before=parse_time(modified_before)
+            )
+            result = list_directory(
+                directory,
+                recursive=parse_bool(recursive),
+                max_depth=int(max_depth) if max_depth not in (None, "") else None,
+                entry_filter=entry_filter,
+                sort_by=sort_by or "name",
+                descending=parse_bool(descending),
+                limit=int(limit) if limit not in (None, "") else DEFAULT_PAGE_SIZE,
+                cursor=cursor or None
+            )
+            # 紧凑格式：大目录的结果会放进对话上下文
+            return json.dumps(result, ensure_ascii=False)
+        except ValueError as e:
+            return f"列出文件失败: 参数错误 {str(e)}"
         except Exception as e:
             return f"列出文件失败: {str(e)}"
     
-    def read_file(self, file_path: str) -> str:
-        """读取文件内容"""
+    def read_file(self, file_path: str, mode: str = "auto", lines: int = None, start_line: int = None,
+                  end_line: int = None, offset: int = None, length: int = None, pattern: str = None,
+                  regex: bool = False, ignore_case: bool = False, context: int = 0,
+                  max_chars: int = READ_DEFAULT_MAX_CHARS, encoding: str = None) -> str:
+        """读取文件内容（自动识别UTF-8/GBK编码，内容过长时截断）
+        
+        可选参数: mode auto/head/tail/lines/bytes/grep, lines 开头或结尾的行数, start_line/end_line 行号范围,
+        offset/length 字节范围（截断时结果会给出继续读取的offset）, pattern 查找的文字（grep模式，regex 是否为正则，
+        ignore_case 忽略大小写，context 上下文行数）, max_chars 最多返回的字符数, encoding 指定编码
+        """
+        def to_int(value):
+            return int(value) if value not in (None, "") else None
+        
         try:
             if not os.path.exists(file_path):
                 return f"文件不存在: {file_path}"
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            return f"文件 {file_path} 的内容:\n{content}"
+            if os.path.isdir(file_path):
+                return f"不是文件: {file_path}"
+            
+            result = read_text(
+                file_path,
+                mode=mode or "auto",
+                lines=to_int(lines),
+                start_line=to_int(start_line),
+                end_line=to_int(end_line),
+                offset=to_int(offset),
+                length=to_int(length),
+                pattern=pattern,
+                regex=parse_bool(regex),
+                ignore_case=parse_bool(ignore_case),
+                context=to_int(context) or 0,
+                max_chars=to_int(max_chars) or READ_DEFAULT_MAX_CHARS,
+                encoding=encoding or None
+            )
+            if result["binary"]:
+                return f"无法读取文件: {file_path} 是二进制文件（{result['size']} bytes）"
+            
+            content = result["text"]
+            if result["truncated"]:
+                hint = f"，可用 mode=bytes offset={result['next_offset']} 继续读取" if result["next_offset"] is not None else ""
+                content += f"\n...（内容已截断，文件共 {result['size']} bytes，编码 {result['encoding']}{hint}）"
+            if mode in (None, "", "auto") and not result["truncated"]:
+                return f"文件 {file_path} 的内容:\n{content}"
+            if mode == "grep":
+                return f"文件 {file_path} 中匹配 {pattern} 的行（{result['matches']} 处）:\n{content}"
+            return f"文件 {file_path} 的内容（{mode or 'auto'}，第 {result['start']}-{result['end']} 字节）:\n{content}"
+        except ValueError as e:
+            return f"读取文件失败: 参数错误 {str(e)}"
         except Exception as e:
             return f"读取文件失败: {str(e)}"
     
@@ -112,27 +213,34 @@ class LocalMCPServer:
     def execute_command(self, command: str) -> str:
         """执行系统命令"""
         try:
-            result = subprocess.run(
-                command, 
-                shell=True, 
-                capture_output=True, 
-                text=True, 
-                timeout=30
-            )
+            result = run_command(command, timeout=COMMAND_TIMEOUT, max_output_chars=COMMAND_MAX_OUTPUT_CHARS)
+            if result["timed_out"]:
+                return f"命令执行超时: {command}"
             
             output = {
                 "command": command,
-                "return_code": result.returncode,
-                "stdout": result.stdout,
-                "stderr": result.stderr
+                "return_code": result["return_code"],
+                "stdout": result["stdout"],
+                "stderr": result["stderr"],
+                "elapsed": result["elapsed"],
+                "cpu_user": result["cpu_user"],
+                "cpu_system": result["cpu_system"]
             }
+            if result["truncated"]:
+                output["truncated"] = True
             
             return json.dumps(output, ensure_ascii=False, indent=2)
-        except subprocess.TimeoutExpired:
-            return f"命令执行超时: {command}"
         except Exception as e:
             return f"执行命令失败: {str(e)}"
     
+    def execute_command_stream(self, command: str, timeout: Optional[float] = None,
+                               cancel_event: Optional[threading.Event] = None):
+        """流式执行系统命令：逐块产出输出，最后产出退出信息（见 command_runner.stream_command）
+        
+        不注册为工具（工具调用需要一次性返回文字），供界面边运行边显示；timeout为None时不限时，可通过cancel_event取消
+        """
+        return iter_command(command, timeout=timeout, cancel_event=cancel_event)
+    
     def get_process_list(self) -> str:
         """获取进程列表"""
         try:
@@ -412,37 +520,60 @@ class LocalMCPServer:
     def get_memory_stats(self) -> str:
         """获取记忆系统统计信息"""
         try:
-            memory_file = "memory_lake.json"
-            if os.path.exists(memory_file):
-                with open(memory_file, 'r', encoding='utf-8') as f:
+            from memory_stats import published_stats
+            
+            # 与记忆湖在同一进程中运行时，直接读取其增量维护的统计快照
+            stats = published_stats()
+            if stats is not None:
+                return json.dumps(stats.snapshot(), ensure_ascii=False, indent=2)
+            
+            # 独立运行（没有记忆湖实例）时从磁盘统计
+            from memory_store import MANIFEST_FILE
+            
+            # 识底深湖按月分片存储，清单文件中只有主题头信息
+            shard_dir = "memory_lake_shards"
+            manifest_file = os.path.join(shard_dir, MANIFEST_FILE)
+            if os.path.exists(manifest_file):
+                with open(manifest_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    if isinstance(data, list):
-                        total_topics = len(data)
-                    elif isinstance(data, dict):
-                        total_topics = len(data.get("topics", []))
-                    else:
-                        total_topics = 0
+                    total_topics = len(data.get("topics", [])) + data.get("archived_count", 0) + len(data.get("archive", []))
             else:
                 total_topics = 0
             
             chat_logs_dir = "chat_logs"
-            total_log_files = len([f for f in os.listdir(chat_logs_dir) if f.endswith('.json')]) if os.path.exists(chat_logs_dir) else 0
+            total_log_files = len([f for f in os.listdir(chat_logs_dir) if f.endswith(('.json', '.jsonl.gz'))]) if os.path.exists(chat_logs_dir) else 0
+            
+            memory_file_size = 0
+            if os.path.isdir(shard_dir):
+                memory_file_size = sum(os.path.getsize(os.path.join(shard_dir, f)) for f in os.listdir(shard_dir) if f.endswith('.json'))
             
             stats = {
                 "total_topics": total_topics,
                 "total_log_files": total_log_files,
-                "memory_file_size": os.path.getsize(memory_file) if os.path.exists(memory_file) else 0
+                "memory_file_size": memory_file_size
             }
             
             return json.dumps(stats, ensure_ascii=False, indent=2)
         except Exception as e:
             return f"获取记忆统计失败: {str(e)}"
     
+    def get_tool_cache_stats(self) -> str:
+        """获取工具结果缓存统计（条目数、各工具命中率）"""
+        return json.dumps(self.result_cache.stats(), ensure_ascii=False, indent=2)
+    
     def call_tool(self, tool_name: str, **kwargs) -> str:
-        """调用工具"""
-        if tool_name in self.tools:
+        """调用工具（声明了缓存策略的工具先查结果缓存）"""
+        tool = self.tools.get(tool_name)
+        if tool is not None:
             try:
-                return self.tools[tool_name](**kwargs)
+                policy = self.cache_policies.get(tool_name)
+                if policy is not None:
+                    result = self.result_cache.call(tool_name, policy, kwargs, lambda: tool(**kwargs))
+                else:
+                    result = tool(**kwargs)
+                for dependent in self.cache_invalidations.get(tool_name, ()):
+                    self.result_cache.invalidate(dependent)
+                return result
             except Exception as e:
                 return f"调用工具失败: {str(e)}"
         else:
@@ -462,80 +593,125 @@ class LocalMCPServer:
         return {}
     
     def load_custom_tools(self):
-        """加载自定义工具"""
-        try:
-            if os.path.exists("custom_tools.json"):
-                with open("custom_tools.json", "r", encoding="utf-8") as f:
-                    custom_tools = json.load(f)
-                    for tool_name, tool_info in custom_tools.items():
-                        if tool_info.get("type") == "custom":
-                            # 动态创建工具函数
-                            self.create_custom_tool(tool_name, tool_info)
-        except Exception as e:
-            print(f"加载自定义工具失败: {str(e)}")
+        """加载自定义工具
+        
+        只重新编译代码有变化的工具，未变化的沿用已编译的版本；
+        新的工具表整体替换 self.tools，调用方不会看到加载了一半的工具表
+        """
+        with self._custom_tools_lock:
+            try:
+                stamp = self._custom_tools_file_stamp()
+                if stamp is None:
+                    raw = b"{}"
+                else:
+                    with open(CUSTOM_TOOLS_FILE, "rb") as f:
+                        raw = f.read()
+                
+                digest = hashlib.sha256(raw).hexdigest()
+                if digest == self._custom_tools_digest:
+                    self._custom_tools_stamp = stamp
+                    return  # 文件被重新保存但内容没有变化
+                custom_tools = json.loads(raw.decode("utf-8"))
+                
+                tools = dict(self.tools)
+                tool_digests = {}
+                cache_policies = dict(self.builtin_cache_policies)
+                for tool_name, tool_info in custom_tools.items():
+                    if tool_info.get("type") != "custom":
+                        continue
+                    if tool_info.get("cache_ttl"):
+                        # 带file_path参数的调用以文件修改时间作为失效标记
+                        cache_policies[tool_name] = CachePolicy(
+                            tool_info["cache_ttl"], stamp=lambda kwargs: file_stamp(kwargs.get("file_path")))
+                    policy = {key: tool_info.get(key) for key in TOOL_POLICY_KEYS}
+                    code_digest = hashlib.sha256(
+                        (tool_info.get("code", "") + json.dumps(policy, sort_keys=True)).encode("utf-8")).hexdigest()
+                    if self._custom_tool_digests.get(tool_name) == code_digest and tool_name in tools:
+                        tool_digests[tool_name] = code_digest
+                        continue
+                    # 动态创建工具函数（标记了sandbox的工具在进程池中运行）
+                    if tool_info.get("sandbox"):
+                        wrapper = self.create_sandboxed_tool(tool_name, tool_info)
+                    else:
+                        wrapper = self.create_custom_tool(tool_name, tool_info)
+                    if wrapper is not None:
+                        tools[tool_name] = wrapper
+                        tool_digests[tool_name] = code_digest
+                        self.result_cache.invalidate(tool_name)
+                        print(f"🔄 已加载自定义工具: {tool_name}")
+                    elif tool_name in self._custom_tool_digests and tool_name in tools:
+                        # 新代码编译失败时保留上一个可用版本
+                        tool_digests[tool_name] = self._custom_tool_digests[tool_name]
+                
+                # 移除已从配置中删除的自定义工具
+                for tool_name in self._custom_tool_digests:
+                    if tool_name not in tool_digests:
+                        tools.pop(tool_name, None)
+                        self.result_cache.invalidate(tool_name)
+                
+                self.tools = tools
+                self.cache_policies = cache_policies
+                self._custom_tool_digests = tool_digests
+                self._custom_tools_digest = digest
+                # 加载成功后才记录文件状态，写了一半的文件解析失败时下次调用会重试
+                self._custom_tools_stamp = stamp
+            except Exception as e:
+                print(f"加载自定义工具失败: {str(e)}")
     
     def create_custom_tool(self, tool_name, tool_info):
-        """创建自定义工具"""
+        """创建自定义工具，返回包装函数（失败时返回None）"""
         try:
-            # 创建工具函数的命名空间
-            namespace = {}
-            
-            # 执行工具代码
-            exec(tool_info["code"], namespace)
+            # 编译结果按源码摘要缓存；执行时第三方模块延迟到第一次使用才导入
+            code = compile_tool_source(tool_name, tool_info["code"])
+            namespace = exec_tool_module(code)
             
-            # 创建包装函数
+            # 创建包装函数（按工具名称和参数选择调用的函数）
             def tool_wrapper(**kwargs):
-                # 根据工具名称和参数判断调用哪个函数
-                if tool_name == "智能文件分析":
-                    # 文件分析工具
-                    if 'file_path' in kwargs:
-                        if 'analyze_file_content' in namespace:
-                            # 直接调用analyze_file_content返回JSON格式
-                            return namespace['analyze_file_content'](kwargs['file_path'])
-                        elif 'upload_and_analyze_file' in namespace:
-                            return namespace['upload_and_analyze_file'](kwargs['file_path'])
-                        else:
-                            return "文件分析功能未找到"
-                    else:
-                        return "请提供file_path参数"
-                elif 'location1' in kwargs and 'location2' in kwargs:
-                    # 调用距离计算函数
-                    if 'calculate_distance' in namespace:
-                        return namespace['calculate_distance'](kwargs['location1'], kwargs['location2'])
-                elif 'keyword' in kwargs:
-                    # 调用兴趣点搜索函数
-                    if 'search_poi' in namespace:
-                        city = kwargs.get('city', '北京')
-                        return namespace['search_poi'](kwargs['keyword'], city)
-                elif 'city' in kwargs and 'keyword' not in kwargs:
-                    # 调用天气预报函数
-                    if 'get_weather_forecast' in namespace:
-                        return namespace['get_weather_forecast'](kwargs['city'])
-                else:
-                    return f"参数错误，请提供正确的参数。可用功能：距离计算(location1, location2)、兴趣点搜索(keyword, city)、天气预报(city)、文件分析(file_path)"
+                return dispatch_custom_tool(tool_name, namespace, kwargs)
             
-            # 将包装函数添加到工具列表
-            self.tools[tool_name] = tool_wrapper
+            return tool_wrapper
             
         except Exception as e:
             print(f"创建自定义工具 {tool_name} 失败: {str(e)}")
+            return None
+    
+    def create_sandboxed_tool(self, tool_name, tool_info):
+        """创建在沙箱进程池中运行的自定义工具（主进程不执行工具代码）"""
+        try:
+            source = tool_info["code"]
+            compile_tool_source(tool_name, source)  # 提前检查语法并写入编译缓存，工作进程直接读取
+            sandbox = get_default_sandbox()
+            sandbox.warm_up()
+            
+            def sandboxed_tool(**kwargs):
+                return sandbox.call(tool_name, source, kwargs,
+                                    timeout=tool_info.get("timeout"),
+                                    memory_limit_mb=tool_info.get("memory_limit_mb"),
+                                    max_result_chars=tool_info.get("max_result_chars"))
+            
+            sandboxed_tool.__doc__ = tool_info.get("description")
+            return sandboxed_tool
+        except Exception as e:
+            print(f"创建沙箱工具 {tool_name} 失败: {str(e)}")
+            return None
+    
+    def _custom_tools_file_stamp(self):
+        try:
+            stat = os.stat(CUSTOM_TOOLS_FILE)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
     
     def reload_custom_tools(self):
-        """重新加载自定义工具"""
-        # 移除现有的自定义工具
-        custom_tools = self.get_custom_tools_config()
-        for tool_name in custom_tools.keys():
-            if tool_name in self.tools:
-                del self.tools[tool_name]
-        
-        # 重新加载
-        self.load_custom_tools()
+        """自定义工具文件变化时重新加载（未变化时只需一次stat）"""
+        if self._custom_tools_file_stamp() != self._custom_tools_stamp:
+            self.load_custom_tools()
     
     def get_custom_tools_config(self):
         """获取自定义工具配置"""
         try:
-            if os.path.exists("custom_tools.json"):
-                with open("custom_tools.json", "r", encoding="utf-8") as f:
+            if os.path.exists(CUSTOM_TOOLS_FILE):
+                with open(CUSTOM_TOOLS_FILE, "r", encoding="utf-8") as f:
                     return json.load(f)
         except:
             pass
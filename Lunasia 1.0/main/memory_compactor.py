@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖分层归档
+将超过保留期限的旧主题逐级汇总为日/周/月摘要，摘要保留指向原始主题的指针
+原始主题移入按月的归档分片，常驻的主题清单只包含未归档的主题和摘要
+"""
+
+import datetime
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+# 各层级摘要的归档倍数：主题超过horizon天汇总为日摘要，
+# 日摘要超过horizon*4天汇总为周摘要，周摘要超过horizon*12天汇总为月摘要
+LEVEL_HORIZON_FACTORS = {
+    "daily": 1,
+    "weekly": 4,
+    "monthly": 12,
+}
+
+
+def ensure_topic_id(entry: Dict) -> str:
+    """确保主题/摘要带有唯一ID，返回该ID"""
+    if not entry.get("id"):
+        entry["id"] = uuid.uuid4().hex[:12]
+    return entry["id"]
+
+
+def _parse_date(date_str: str) -> Optional[datetime.date]:
+    try:
+        return datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+class MemoryCompactor:
+    """分层归档任务 - 增量执行，每个层级每次最多生成max_per_run条摘要"""
+
+    def __init__(self, memory_lake, horizon_days: int = 30, max_per_run: int = 500):
+        self.memory_lake = memory_lake
+        self.horizon_days = max(1, int(horizon_days))
+        self.max_per_run = max_per_run
+        self._running = threading.Lock()
+
+    def run_in_background(self):
+        """在后台线程中执行一次归档（已有归档在运行时直接跳过）"""
+        if self._running.locked():
+            return
+        threading.Thread(target=self.run, name="MemoryCompactor", daemon=True).start()
+
+    def run(self, today: Optional[datetime.date] = None) -> int:
+        """执行一次增量归档，返回本次生成的摘要数量"""
+        if not self._running.acquire(blocking=False):
+            return 0
+        try:
+            today = today or datetime.date.today()
+            created = 0
+            created += self._roll_up_topics(today)
+            created += self._roll_up_digests("daily", "weekly", today)
+            created += self._roll_up_digests("weekly", "monthly", today)
+            if created:
+                print(f"🗜️ 识底深湖归档完成: 新增 {created} 条摘要")
+            return created
+        except Exception as e:
+            print(f"⚠️ 识底深湖归档失败: {str(e)}")
+            return 0
+        finally:
+            self._running.release()
+
+    def _cutoff(self, level: str, today: datetime.date) -> datetime.date:
+        return today - datetime.timedelta(days=self.horizon_days * LEVEL_HORIZON_FACTORS[level])
+
+    @staticmethod
+    def _period_of(level: str, date: datetime.date) -> str:
+        if level == "daily":
+            return date.strftime("%Y-%m-%d")
+        if level == "weekly":
+            year, week, _ = date.isocalendar()
+            return f"{year}-W{week:02d}"
+        return date.strftime("%Y-%m")
+
+    def _roll_up_topics(self, today: datetime.date) -> int:
+        """将超过保留期限的普通主题汇总为日摘要，重点记忆原样保留"""
+        lake = self.memory_lake
+        cutoff = self._cutoff("daily", today)
+
+        with lake._write_lock:
+            topics = lake.memory_index.get("topics", [])
+            groups = OrderedDict()
+            for entry in topics:
+                if len(groups) >= self.max_per_run:
+                    break
+                if entry.get("is_important", False):
+                    continue
+                date = _parse_date(entry.get("date", ""))
+                if date is None or date >= cutoff:
+                    continue
+                groups.setdefault(self._period_of("daily", date), []).append(entry)
+
+            if not groups:
+                return 0
+
+            rolled_ids = set()
+            new_digests = []
+            for period, entries in groups.items():
+                for entry in entries:
+                    rolled_ids.add(ensure_topic_id(entry))
+                new_digests.append(self._build_digest("daily", period, entries))
+
+            # 被汇总的主题移入按月的归档分片（不留在常驻清单中，只在摘要下钻时加载）；
+            # 先放入归档再发布新索引，读取方任何时刻都能从摘要找到原始主题
+            archived = [e for e in topics if e.get("id") in rolled_ids]
+            lake.store.add_archived(archived)
+
+            # 生成新列表后一次性发布新索引，读取方持有的旧快照不受影响
+            digests = lake.memory_index.get("digests", [])
+            merged, _ = self._merge_digests(digests, new_digests)
+            lake._publish_index(
+                topics=[e for e in topics if e.get("id") not in rolled_ids],
+                archived_count=lake.memory_index.get("archived_count", 0) + len(archived),
+                digests=merged
+            )
+            # 主题总数不变（移入归档），重点记忆不归档；新增的摘要计入顶层摘要数
+            lake.stats.adjust(digest_count=len(merged) - len(digests))
+            lake.save_memory()
+            return len(new_digests)
+
+    def _roll_up_digests(self, source_level: str, target_level: str, today: datetime.date) -> int:
+        """将较低层级的摘要汇总为更高层级的摘要"""
+        lake = self.memory_lake
+        cutoff = self._cutoff(target_level, today)
+
+        with lake._write_lock:
+            digests = lake.memory_index.get("digests", [])
+            groups = OrderedDict()
+            for digest in digests:
+                if len(groups) >= self.max_per_run:
+                    break
+                if digest.get("level") != source_level or digest.get("rolled_into"):
+                    continue
+                end_date = _parse_date(digest.get("end_date", ""))
+                if end_date is None or end_date >= cutoff:
+                    continue
+                groups.setdefault(self._period_of(target_level, end_date), []).append(digest)
+
+            if not groups:
+                return 0
+
+            new_digests = [self._build_digest(target_level, period, entries) for period, entries in groups.items()]
+            merged, id_map = self._merge_digests(digests, new_digests)
+            rolled_into = {}
+            for digest in new_digests:
+                for source in groups[digest["period"]]:
+                    rolled_into[id(source)] = id_map[digest["id"]]
+            # 被汇总的摘要复制后再标记，不修改读取方快照中的摘要
+            merged = [dict(d, rolled_into=rolled_into[id(d)]) if id(d) in rolled_into else d for d in merged]
+
+            # 被汇总的摘要不再是顶层摘要，新增的摘要计入顶层摘要数
+            lake.stats.adjust(digest_count=len(merged) - len(digests) - len(rolled_into))
+            lake._publish_index(digests=merged)
+            lake.save_memory()
+            return len(new_digests)
+
+    def _merge_digests(self, digests: List[Dict], new_digests: List[Dict]):
+        """合并新摘要；同一层级同一周期已存在摘要时（增量归档补充的旧记录），合并到已有摘要中
+        
+        返回 (合并后的摘要列表, 新摘要ID -> 最终摘要ID)
+        """
+        merged = list(digests)
+        id_map = {}
+        index = {(d.get("level"), d.get("period")): position for position, d in enumerate(merged)
+                 if not d.get("rolled_into")}
+        for digest in new_digests:
+            position = index.get((digest["level"], digest["period"]))
+            if position is None:
+                index[(digest["level"], digest["period"])] = len(merged)
+                merged.append(digest)
+                id_map[digest["id"]] = digest["id"]
+                continue
+            # 复制后再合并（写时复制），读取方快照中的摘要保持不变
+            existing = merged[position] = dict(merged[position])
+            id_map[digest["id"]] = existing["id"]
+            existing["source_ids"] = existing.get("source_ids", []) + digest["source_ids"]
+            existing["conversation_count"] = existing.get("conversation_count", 0) + digest["conversation_count"]
+            existing["start_date"] = min(existing.get("start_date", digest["start_date"]), digest["start_date"])
+            existing["end_date"] = max(existing.get("end_date", digest["end_date"]), digest["end_date"])
+            existing["subtopics"] = self._unique(existing.get("subtopics", []) + digest["subtopics"])
+            existing["topic"] = self._merge_topic_text(existing["period"], existing["subtopics"])
+            existing["keywords"] = self._unique(existing.get("keywords", []) + digest["keywords"])[:12]
+        return merged, id_map
+
+    def _build_digest(self, level: str, period: str, entries: List[Dict]) -> Dict:
+        """由一组主题或低层级摘要生成摘要条目"""
+        dates = [entry.get("start_date") or entry.get("date", "") for entry in entries]
+        end_dates = [entry.get("end_date") or entry.get("date", "") for entry in entries]
+        subtopics = []
+        for entry in entries:
+            subtopics.extend(entry.get("subtopics", [entry.get("topic", "")]))
+        subtopics = self._unique(subtopics)
+
+        keyword_counter = Counter()
+        for entry in entries:
+            keyword_counter.update(entry.get("keywords", []))
+
+        return {
+            "id": f"{level}-{period}-{uuid.uuid4().hex[:6]}",
+            "level": level,
+            "period": period,
+            "date": min(dates) if dates else "",
+            "timestamp": "",
+            "start_date": min(dates) if dates else "",
+            "end_date": max(end_dates) if end_dates else "",
+            "topic": self._merge_topic_text(period, subtopics),
+            "subtopics": subtopics,
+            "keywords": [keyword for keyword, _ in keyword_counter.most_common(12)],
+            "conversation_count": sum(entry.get("conversation_count", 0) for entry in entries),
+            "source_ids": [ensure_topic_id(entry) for entry in entries],
+            "is_important": False
+        }
+
+    @staticmethod
+    def _merge_topic_text(period: str, subtopics: List[str]) -> str:
+        shown = "、".join(subtopics[:5])
+        if len(subtopics) > 5:
+            shown += f"等{len(subtopics)}个主题"
+        return f"{period}：{shown}"
+
+    @staticmethod
+    def _unique(items: List[str]) -> List[str]:
+        seen = set()
+        result = []
+        for item in items:
+            if item and item not in seen:
+                seen.add(item)
+                result.append(item)
+        return result
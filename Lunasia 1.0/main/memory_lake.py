@@ -4,13 +4,24 @@
 处理对话记忆、主题总结和上下文回忆
 """
 
+import copy
 import json
 import os
 import datetime
 import re
+import threading
+import time
 import openai
 from config import load_config
 from memory_summary_agent import MemorySummaryAgent
+from memory_summary_queue import MemorySummaryQueue
+from memory_compactor import MemoryCompactor, ensure_topic_id
+from memory_store import ShardedMemoryStore
+from memory_topic import KEYWORDS, MemoryTopic, TopicTextIndex
+from session_store import conversation_key
+from chat_log_writer import ChatLogWriter
+from memory_stats import MemoryStats, publish_stats
+import extractive_summarizer
 
 class MemoryLake:
     """记忆系统 - 识底深湖"""
@@ -18,45 +29,121 @@ class MemoryLake:
     def __init__(self, memory_file="memory_lake.json", chat_logs_dir="chat_logs"):
         self.memory_file = memory_file
         self.chat_logs_dir = chat_logs_dir
+        self.config = load_config()
+        
+        # 按月分片存储：启动时只加载主题清单，对话详情按需加载（旧版单文件首次启动时自动迁移）
+        shard_dir = os.path.splitext(memory_file)[0] + "_shards"
+        self.store = ShardedMemoryStore(shard_dir, legacy_file=memory_file,
+                                        cache_size=self.config.get("memory_shard_cache_size", 6))
         self.memory_index = self.load_memory()
         self.current_conversation = []
+        self._current_keys = set()  # 当前会话对话的去重键
         self.last_save_date = None
-        self.config = load_config()
         
         # 初始化记忆总结AI代理
-        self.summary_agent = MemorySummaryAgent(self.config)
+        self.summary_agent = MemorySummaryAgent(
+            self.config, cache_file=os.path.join(os.path.dirname(self.memory_file), "memory_summary_cache.json"))
         
         # 🚀 修复：初始化mark_saved_callback属性
         self.mark_saved_callback = None
         
+        # 记忆索引写锁（后台总结线程、归档线程与界面线程共用，只有写入方需要持有）
+        # 写入方不原地修改列表，而是生成新列表后通过_publish_index整体替换索引，
+        # 读取方拿到的 memory_index / snapshot() 始终是一份完整、不再变化的快照，无需加锁
+        self._write_lock = threading.RLock()
+        
+        # 记忆对话框过滤用的文字索引，记忆湖每次保存后失效，下次过滤时重建
+        self._version = 0
+        self._browse_index = None
+        self._browse_index_lock = threading.Lock()
+        # 摘要下钻用的 ID -> 节点映射，与构建它的索引快照一起缓存，索引发布新版本后重建
+        self._source_nodes_cache = None
+        
         # 确保目录存在
         if not os.path.exists(self.chat_logs_dir):
             os.makedirs(self.chat_logs_dir)
         
+        # 统计计数器：启动时完整统计一次，之后随每次修改增量更新
+        self.stats = MemoryStats()
+        self._recount_stats()
+        publish_stats(self.stats)
+        
+        # 完整聊天记录：后台线程按天压缩写入chat_logs目录
+        self.chat_log = None
+        if self.config.get("chat_log_enabled", True):
+            self.chat_log = ChatLogWriter(self.chat_logs_dir,
+                                          retention_days=self.config.get("chat_log_retention_days", 90),
+                                          max_queue=self.config.get("chat_log_queue_size", 1000),
+                                          stats=self.stats)
+        
         # 确保第一条记忆是重点记忆
         self.ensure_first_memory_important()
+        
+        # 分层归档：超过保留期限的旧主题汇总为日/周/月摘要，控制提示词和活跃主题数量
+        self.compactor = MemoryCompactor(self, self.config.get("memory_compaction_horizon_days", 30))
+        
+        # 后台总结队列：对话批次先持久化，再由后台线程调用AI总结
+        pending_file = os.path.join(os.path.dirname(self.memory_file), "memory_pending.json")
+        self.summary_queue = MemorySummaryQueue(self, pending_file)
+        self.summary_queue.start()
+        
+        self.compact_memories()
+
+    def _recount_stats(self):
+        """完整统计一次（仅启动时调用）"""
+        topics = self.memory_index.get("topics", [])
+        total_log_files = len([f for f in os.listdir(self.chat_logs_dir) if f.endswith(('.json', '.jsonl.gz'))]) if os.path.exists(self.chat_logs_dir) else 0
+        self.stats.set(
+            total_topics=len(topics) + self.memory_index.get("archived_count", 0),
+            important_topics=sum(1 for topic in topics if topic.is_important),
+            total_log_files=total_log_files,
+            memory_file_size=self.store.disk_size(),
+            current_conversation_count=len(self.current_conversation),
+            digest_count=len([d for d in self.memory_index.get("digests", []) if not d.get("rolled_into")])
+        )
+
+    def get_stats_snapshot(self):
+        """获取统计快照（不扫描主题列表和目录）"""
+        return self.stats.snapshot()
+
+    def compact_memories(self):
+        """在后台执行一次增量归档"""
+        if self.config.get("memory_compaction_enabled", True):
+            self.compactor.run_in_background()
 
     def load_memory(self):
-        """加载记忆索引"""
-        if os.path.exists(self.memory_file):
-            try:
-                with open(self.memory_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # 兼容旧格式：如果是数组，转换为新格式
-                    if isinstance(data, list):
-                        return {"topics": data, "conversations": {}, "contexts": {}}
-                    elif isinstance(data, dict):
-                        return data
-                    else:
-                        return {"topics": [], "conversations": {}, "contexts": {}}
-            except:
-                return {"topics": [], "conversations": {}, "contexts": {}}
-        return {"topics": [], "conversations": {}, "contexts": {}}
+        """加载记忆索引（主题清单，不含对话详情）"""
+        try:
+            return self.store.load()
+        except Exception as e:
+            print(f"⚠️ 加载记忆索引失败: {str(e)}")
+            return {"topics": [], "conversations": {}, "contexts": {}}
+
+    def snapshot(self):
+        """当前记忆索引的只读快照（写入方只会整体替换，读取方不要修改其中的列表）"""
+        return self.memory_index
+
+    def _publish_index(self, **changes):
+        """写入方发布新的记忆索引（复制字典并替换指定列表，需持有写锁）"""
+        with self._write_lock:
+            memory_index = dict(self.memory_index)
+            memory_index.update(changes)
+            self.memory_index = memory_index
 
     def save_memory(self):
         """保存记忆索引"""
-        with open(self.memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.memory_index, f, ensure_ascii=False, indent=2)
+        with self._write_lock:
+            self.store.save(self.memory_index)
+            self._version += 1
+            self.stats.set(memory_file_size=self.store.disk_size())
+
+    def get_topic_details(self, entry):
+        """获取主题的具体聊天记录（首次访问时从月份分片加载）"""
+        try:
+            return self.store.get_details(entry)
+        except Exception as e:
+            print(f"⚠️ 读取聊天记录失败: {str(e)}")
+            return ""
 
     def add_conversation(self, user_input, ai_response, developer_mode=False, mark_saved_callback=None):
         """添加对话到当前会话"""
@@ -65,13 +152,12 @@ class MemoryLake:
             print("🔧 开发者模式已开启，跳过对话记录到记忆系统")
             return
         
-        # 🚀 修复：防重复添加机制
-        # 检查是否已经存在相同的对话
-        for existing_conv in self.current_conversation:
-            if (existing_conv.get('user_input') == user_input and 
-                existing_conv.get('ai_response') == ai_response):
-                print(f"⚠️ 检测到重复对话，跳过添加: {user_input[:30]}...")
-                return
+        # 🚀 修复：防重复添加机制（按对话内容哈希去重）
+        key = conversation_key(user_input, ai_response)
+        if key in self._current_keys:
+            print(f"⚠️ 检测到重复对话，跳过添加: {user_input[:30]}...")
+            return
+        self._current_keys.add(key)
         
         timestamp = datetime.datetime.now().strftime("%H:%M:%S")
         self.current_conversation.append({
@@ -81,67 +167,156 @@ class MemoryLake:
             "full_text": f"指挥官: {user_input}\n露尼西亚: {ai_response}"
         })
         
+        self.stats.set(current_conversation_count=len(self.current_conversation))
         print(f"✅ 添加对话到记忆系统: {user_input[:30]}... (当前共{len(self.current_conversation)}条)")
         
         # 🚀 修复：保存回调函数，在对话真正保存到识底深湖后调用
         if mark_saved_callback:
             self.mark_saved_callback = mark_saved_callback
 
+    def record_transcript(self, user_input, ai_response):
+        """记录完整对话到聊天记录归档（只入队，不阻塞聊天流程）"""
+        if self.chat_log:
+            self.chat_log.write(user_input, ai_response)
+
     def should_summarize(self):
         """判断是否应该总结"""
         # 每3条对话总结一次，或者当前对话超过5条
         return len(self.current_conversation) >= 3
 
     def summarize_and_save_topic(self, ai_client=None, force_save=False):
-        """总结并保存主题"""
+        """总结并保存主题（同步执行，会等待AI总结完成）"""
         if not self.current_conversation:
             return None
         
         # 如果不是强制保存，检查是否满足保存条件
         if not force_save and not self.should_summarize():
             return None
-            
+        
+        topic = self.save_topic_from_conversations(self.current_conversation)
+        if topic:
+            # 清空当前会话
+            self.current_conversation = []
+            self._current_keys = set()
+            self.stats.set(current_conversation_count=0)
+        return topic
+
+    def enqueue_current_conversation(self, is_important=False):
+        """将当前会话交给后台总结队列，立即返回批次ID，不等待AI总结"""
+        if not self.current_conversation:
+            return None
+        
+        batch_id = self.summary_queue.enqueue(self.current_conversation, is_important=is_important)
+        if batch_id:
+            # 批次已持久化到待总结队列，即视为已保存，避免退出时重复加入
+            if self.mark_saved_callback:
+                for conv in self.current_conversation:
+                    self.mark_saved_callback(conv['user_input'], conv['ai_response'])
+            self.current_conversation = []
+            self._current_keys = set()
+            self.stats.set(current_conversation_count=0)
+        return batch_id
+
+    def save_topic_from_conversations(self, conversations, is_important=False, notify_saved=True, batch_id=None):
+        """总结一批对话并保存为主题（后台总结线程和同步保存共用）"""
+        if not conversations:
+            return None
+        
+        # 同一批次已经写入过（例如写入后、出队前程序崩溃），不再重复总结
+        if batch_id:
+            for existing in self.memory_index.get("topics", []):
+                if existing.batch_id == batch_id:
+                    return existing.topic
+        
         try:
             # 构建对话文本
             conversation_text = "\n".join([
-                conv["full_text"] for conv in self.current_conversation
+                conv["full_text"] for conv in conversations
             ])
+            keywords = self._extract_keywords(conversation_text)
             
-            # 使用AI总结主题
-            topic = self._ai_summarize_topic(conversation_text)
+            # 第0层：简单会话在本地抽取式总结，不调用AI
+            local = self._local_summarize(conversations, conversation_text)
+            if local:
+                topic, conversation_details = local
+            else:
+                topic, conversation_details = self._ai_summarize_session(conversations, conversation_text, keywords)
+            self._report_summary_split()
             
             # 保存到记忆索引
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
             date_str = datetime.datetime.now().strftime("%Y-%m-%d")
             
-            entry = {
-                "topic": topic,
-                "timestamp": timestamp,
-                "date": date_str,
-                "conversation_count": len(self.current_conversation),
-                "keywords": self._extract_keywords(conversation_text),
-                "conversation_details": self._extract_conversation_details(),
-                "is_important": False  # 重点记忆标签
-            }
+            entry = MemoryTopic(
+                topic=topic,
+                date=date_str,
+                timestamp=timestamp,
+                keywords=keywords,
+                conversation_count=len(conversations),
+                is_important=is_important,  # 重点记忆标签
+                batch_id=batch_id,
+                details=conversation_details
+            )
+            ensure_topic_id(entry)
             
-            self.memory_index["topics"].append(entry)
-            self.save_memory()
+            with self._write_lock:
+                self._publish_index(topics=self.memory_index.get("topics", []) + [entry])
+                self.stats.adjust(total_topics=1, important_topics=1 if is_important else 0)
+                self.save_memory()
             
             # 🚀 修复：在成功保存到识底深湖后，标记所有已保存的对话为已保存
             # 获取AI代理的mark_saved_callback函数
-            if hasattr(self, 'mark_saved_callback') and self.mark_saved_callback:
-                for conv in self.current_conversation:
+            if notify_saved and hasattr(self, 'mark_saved_callback') and self.mark_saved_callback:
+                for conv in conversations:
                     self.mark_saved_callback(conv['user_input'], conv['ai_response'])
             
-            # 清空当前会话
-            self.current_conversation = []
-            
             return topic
             
         except Exception as e:
             print(f"总结主题失败: {str(e)}")
             return None
 
+    def _local_summarize(self, conversations, conversation_text):
+        """第0层本地抽取式总结：会话在复杂度阈值以内且NumPy可用时返回 (主题, 对话记录)，否则返回None"""
+        if not self.config.get("memory_local_summary_enabled", True) or not extractive_summarizer.NUMPY_AVAILABLE:
+            return None
+        if not extractive_summarizer.is_simple_session(
+                conversations,
+                max_rounds=self.config.get("memory_local_summary_max_rounds", 3),
+                max_chars=self.config.get("memory_local_summary_max_chars", 1200)):
+            return None
+        try:
+            start = time.perf_counter()
+            details = extractive_summarizer.summarize_conversations(conversations)
+            if not details:
+                return None
+            topic = self._simple_summarize_topic(conversation_text)
+            print(f"🗜️ 简单会话本地总结完成 ({len(conversations)}轮, {(time.perf_counter() - start) * 1000:.1f}ms)")
+            self.stats.adjust(local_summaries=1)
+            return topic, details
+        except Exception as e:
+            print(f"⚠️ 本地总结失败，改用AI总结: {str(e)}")
+            return None
+
+    def _ai_summarize_session(self, conversations, conversation_text, keywords):
+        """AI总结：优先一次调用完成结构化总结（主题、关键词、每轮记录），返回 (主题, 对话记录)"""
+        self.stats.adjust(ai_summaries=1)
+        structured = self.summary_agent.summarize_structured(self._build_details_text(conversations))
+        if structured:
+            for keyword in structured["keywords"]:
+                if keyword not in keywords:
+                    keywords.append(keyword)
+            # 全部命中缓存且缓存中没有主题时，用本地方式补充主题
+            topic = structured["topic"] or self._simple_summarize_topic(conversation_text)
+            return topic, "\n\n".join(structured["details"])
+        # 对话过长或结构化结果无效时，退回主题总结 + 逐轮总结
+        return self._ai_summarize_topic(conversation_text), self._extract_conversation_details(conversations)
+
+    def _report_summary_split(self):
+        stats = self.stats.snapshot()
+        local, ai = stats.get("local_summaries", 0), stats.get("ai_summaries", 0)
+        print(f"📊 本次运行总结分布: 本地 {local} 次 / AI {ai} 次 (本地占比 {local / max(1, local + ai):.0%})")
+
     def _ai_summarize_topic(self, conversation_text):
         """使用AI总结主题"""
         max_retries = 3
@@ -513,14 +688,28 @@ class MemoryLake:
         
         return keywords
 
-    def _extract_conversation_details(self):
+    def _extract_conversation_details(self, conversations=None):
         """提取对话详情，生成精简的对话记录"""
-        if not self.current_conversation:
+        if conversations is None:
+            conversations = self.current_conversation
+        if not conversations:
             return ""
         
         # 使用AI智能总结整个对话，而不是逐条关键词识别
+        conversation_text = self._build_details_text(conversations)
+        
+        # 强制使用AI总结，不启用后备方案（_ai_summarize_conversation_details内部已有重试）
+        try:
+            ai_result = self._ai_summarize_conversation_details(conversation_text)
+            return ai_result if ai_result and len(ai_result.strip()) > 10 else "AI总结失败"
+        except Exception as e:
+            print(f"⚠️ AI总结失败: {str(e)}")
+            return "AI总结失败，请检查API配置"
+    
+    def _build_details_text(self, conversations):
+        """构建用于对话记录总结的问答文本"""
         conversation_text = ""
-        for conv in self.current_conversation:
+        for conv in conversations:
             user_input = conv.get("user_input", "")
             ai_response = conv.get("ai_response", "")
             
@@ -528,20 +717,7 @@ class MemoryLake:
                 conversation_text += f"露尼西亚: {ai_response}\n"
             else:
                 conversation_text += f"指挥官: {user_input}\n露尼西亚: {ai_response}\n"
-        
-        # 强制使用AI总结，不启用后备方案
-        try:
-            ai_result = self._ai_summarize_conversation_details(conversation_text)
-            if ai_result and len(ai_result.strip()) > 10:  # 确保AI返回了有效结果
-                return ai_result
-            else:
-                print("⚠️ AI总结返回空结果，尝试重新生成")
-                # 再次尝试AI总结
-                ai_result = self._ai_summarize_conversation_details(conversation_text)
-                return ai_result if ai_result and len(ai_result.strip()) > 10 else "AI总结失败"
-        except Exception as e:
-            print(f"⚠️ AI总结失败: {str(e)}")
-            return "AI总结失败，请检查API配置"
+        return conversation_text
     
     def _ai_summarize_conversation_details(self, conversation_text):
         """使用AI总结对话详情"""
@@ -797,26 +973,112 @@ class MemoryLake:
             else:
                 return ai_response
 
-    def search_relevant_memories(self, user_input, current_context=""):
-        """搜索相关记忆"""
+    def search_relevant_memories(self, user_input, current_context="", limit=3):
+        """搜索相关记忆（先检索归档摘要，命中后再下钻到原始主题）
+        
+        返回记录的浅拷贝，relevance_score 为本次搜索的相关度（快照中的记录不修改，并发搜索互不影响）
+        """
+        results = []
+        for score, memory in self._search_scored(user_input, current_context, limit):
+            if isinstance(memory, MemoryTopic):
+                memory = copy.copy(memory)
+                memory.relevance_score = score
+            else:
+                memory = dict(memory, relevance_score=score)
+            results.append(memory)
+        return results
+
+    def _search_scored(self, user_input, current_context="", limit=3):
+        """搜索相关记忆，返回 [(相关度, 快照中的记录)]，按相关度和时间倒序"""
         try:
-            relevant_memories = []
+            scored = []
             user_keywords = self._extract_keywords(user_input)
+            # 关键词转为驻留ID、当天日期转为序数，逐条比较时不再做字符串查找和日期解析
+            user_keyword_ids = [KEYWORDS.lookup(keyword) for keyword in user_keywords]
+            today_ordinal = datetime.date.today().toordinal()
             
-            for entry in self.memory_index["topics"]:
-                relevance_score = self._calculate_relevance(entry, user_keywords, current_context)
+            snapshot = self.snapshot()
+            candidates = list(snapshot.get("topics", []))
+            matched_digests = []
+            for digest in snapshot.get("digests", []):
+                if digest.get("rolled_into"):
+                    continue
+                digest_score = self._calculate_relevance(digest, user_keywords, current_context)
+                if digest_score > 0.3:
+                    matched_digests.append((digest_score, digest))
+                    candidates.extend(self.get_digest_sources(digest, snapshot))
+            
+            for entry in candidates:
+                relevance_score = self._calculate_topic_relevance(entry, user_keywords, user_keyword_ids, today_ordinal)
                 if relevance_score > 0.3:  # 相关性阈值
-                    entry["relevance_score"] = relevance_score
-                    relevant_memories.append(entry)
+                    scored.append((relevance_score, entry))
+            
+            # 摘要命中但原始主题都未达到阈值时，返回摘要本身
+            if matched_digests and not scored:
+                scored = matched_digests
             
             # 按相关性排序，然后按时间排序（最新的优先）
-            relevant_memories.sort(key=lambda x: (x["relevance_score"], x.get("timestamp", "")), reverse=True)
-            return relevant_memories[:3]  # 返回最相关的3个记忆
+            scored.sort(key=lambda item: (item[0], item[1].get("timestamp", "")), reverse=True)
+            return scored[:limit]  # 默认返回最相关的3个记忆
             
         except Exception as e:
             print(f"搜索记忆失败: {str(e)}")
             return []
 
+    def _source_nodes(self, snapshot):
+        """快照中 ID -> 摘要 的映射（每个发布的索引只构建一次）"""
+        cached = self._source_nodes_cache
+        if cached is not None and cached[0] is snapshot:
+            return cached[1]
+        nodes = {d.get("id"): d for d in snapshot.get("digests", [])}
+        self._source_nodes_cache = (snapshot, nodes)
+        return nodes
+
+    def get_digest_sources(self, digest, snapshot=None):
+        """获取摘要对应的原始主题（逐级下钻，日摘要的原始主题从所在月份的归档分片加载）
+        
+        snapshot 为调用方正在使用的快照，保证读取同一版本的索引
+        """
+        nodes = self._source_nodes(snapshot if snapshot is not None else self.snapshot())
+        
+        sources = []
+        pending = [digest]
+        while pending:
+            node = pending.pop(0)
+            if node.get("level") == "daily":
+                # 日摘要的周期是日期，其原始主题都在该月的归档分片中
+                sources.extend(self.store.get_archived(node.get("period", "")[:7], node.get("source_ids", [])))
+            else:
+                pending.extend(nodes[source_id] for source_id in node.get("source_ids", []) if source_id in nodes)
+        return sources
+
+    def get_browse_rows(self):
+        """记忆对话框的行：主题（最新的在前），之后是顶层归档摘要"""
+        return list(reversed(self.memory_index.get("topics", []))) + self.get_digests()
+
+    @staticmethod
+    def browse_text(row):
+        """记忆对话框中一行显示的文字"""
+        if row.get("level"):
+            return f"📦 [{row.get('start_date', '')} ~ {row.get('end_date', '')}] {row.get('topic', '')}"
+        important_icon = "⭐ " if row.get("is_important", False) else ""
+        return f"{important_icon}[{row.get('date', '')} {row.get('timestamp', '')}] {row.get('topic', '')}"
+
+    def search_browse_rows(self, text):
+        """按文字过滤记忆对话框的行（可在后台线程调用），返回匹配的行对象"""
+        with self._browse_index_lock:
+            index = self._browse_index
+            if index is None or index[0] != self._version:
+                version = self._version
+                index = (version, TopicTextIndex(self.get_browse_rows(), self.browse_text))
+                self._browse_index = index
+        return index[1].search(text)
+
+    def get_digests(self):
+        """获取顶层归档摘要（未再被更高层级汇总的摘要），最新的在前"""
+        digests = [d for d in self.memory_index.get("digests", []) if not d.get("rolled_into")]
+        return sorted(digests, key=lambda d: d.get("end_date", ""), reverse=True)
+
     def _calculate_relevance(self, memory_entry, user_keywords, current_context):
         """计算相关性分数"""
         score = 0.0
@@ -847,6 +1109,33 @@ class MemoryLake:
         
         return min(score, 1.0)
 
+    @staticmethod
+    def _calculate_topic_relevance(topic, user_keywords, user_keyword_ids, today_ordinal):
+        """计算主题记录的相关性分数（与_calculate_relevance规则相同，使用关键词ID和日期序数）"""
+        score = 0.0
+        
+        # 关键词匹配
+        keyword_ids = topic.keyword_ids
+        for keyword_id in user_keyword_ids:
+            if keyword_id is not None and keyword_id in keyword_ids:
+                score += 0.4
+        
+        # 主题匹配
+        memory_topic = topic.topic
+        for keyword in user_keywords:
+            if keyword in memory_topic:
+                score += 0.3
+        
+        # 时间相关性（最近7天的记忆权重更高）
+        if topic.date_ordinal:
+            days_diff = today_ordinal - topic.date_ordinal
+            if days_diff <= 7:
+                score += 0.2
+            elif days_diff <= 30:
+                score += 0.1
+        
+        return min(score, 1.0)
+
     def should_recall_memory(self, user_input):
         """判断是否需要回忆"""
         # 关键词触发 - 更精确的关键词
@@ -884,12 +1173,41 @@ class MemoryLake:
             print(f"生成记忆上下文失败: {str(e)}")
             return ""
 
+    def select_context_memories(self, user_input, top_k=5, recent_count=5, max_total=15):
+        """挑选注入提示词的历史记忆：与当前输入最相关的top_k条 + 重点记忆 + 最近recent_count条，总数不超过max_total
+        
+        返回 [(记忆, 入选原因)]，按相关、重点、最近的优先级去重
+        """
+        selected = []
+        seen = set()
+        
+        def add(memory, reason):
+            if len(selected) >= max_total or id(memory) in seen:
+                return
+            seen.add(id(memory))
+            selected.append((memory, reason))
+        
+        try:
+            # 使用快照中的记录本身（而不是带分数的拷贝），与重点记忆、最近记忆按对象去重
+            for score, memory in self._search_scored(user_input, limit=top_k):
+                add(memory, f"相关度{score:.2f}")
+            
+            important = sorted(self.get_important_memories(), key=lambda x: (x.date_ordinal, x.timestamp), reverse=True)
+            for memory in important:
+                add(memory, "重点记忆")
+            
+            for memory in self.get_recent_memories(recent_count):
+                add(memory, "最近记忆")
+        except Exception as e:
+            print(f"挑选历史记忆失败: {str(e)}")
+        return selected
+
     def get_recent_memories(self, limit=100):
         """获取最近的历史记忆"""
         try:
             topics = self.memory_index.get("topics", [])
             # 按日期和时间倒序排列，获取最近的记忆
-            sorted_topics = sorted(topics, key=lambda x: (x.get("date", ""), x.get("timestamp", "")), reverse=True)
+            sorted_topics = sorted(topics, key=lambda x: (x.date_ordinal, x.timestamp), reverse=True)
             return sorted_topics[:limit]
         except Exception as e:
             print(f"获取最近记忆失败: {str(e)}")
@@ -898,22 +1216,20 @@ class MemoryLake:
     def get_first_memory(self):
         """获取第一条记忆"""
         try:
-            topics = self.memory_index.get("topics", [])
+            topics = list(self.memory_index.get("topics", []))
+            # 归档主题只需要看最早的一个月份
+            archived_shards = self.store.archived_shards()
+            if archived_shards:
+                topics.extend(self.store.get_archived(archived_shards[0]))
             if not topics:
                 return None
             
-            # 按日期和时间正序排列，获取最早的记忆
-            # 确保日期格式正确，处理可能的空值
+            # 按日期和时间取最早的记忆
+            # 日期为空或无效（序数为0）时排在最后
             def sort_key(topic):
-                date = topic.get("date", "")
-                timestamp = topic.get("timestamp", "")
-                # 如果日期为空，使用一个很大的日期确保排在最后
-                if not date:
-                    return ("9999-12-31", timestamp)
-                return (date, timestamp)
+                return (topic.date_ordinal or float("inf"), topic.timestamp)
             
-            sorted_topics = sorted(topics, key=sort_key)
-            first_memory = sorted_topics[0]
+            first_memory = min(topics, key=sort_key)
             
             # 添加调试信息
             print(f"🔍 找到第一条记忆: {first_memory.get('date', '未知')} {first_memory.get('timestamp', '未知')} - {first_memory.get('topic', '未知主题')}")
@@ -926,55 +1242,58 @@ class MemoryLake:
     def get_memory_stats(self):
         """获取记忆统计信息"""
         try:
-            topics = self.memory_index.get("topics", [])
-            total_topics = len(topics)
-            important_topics = len([topic for topic in topics if topic.get("is_important", False)])
-            total_log_files = len([f for f in os.listdir(self.chat_logs_dir) if f.endswith('.json')]) if os.path.exists(self.chat_logs_dir) else 0
-            
-            stats = {
-                "total_topics": total_topics,
-                "important_topics": important_topics,
-                "total_log_files": total_log_files,
-                "memory_file_size": os.path.getsize(self.memory_file) if os.path.exists(self.memory_file) else 0,
-                "current_conversation_count": len(self.current_conversation)
-            }
-            
-            return stats
+            return self.get_stats_snapshot()
         except Exception as e:
             print(f"获取记忆统计失败: {str(e)}")
-            return {"total_topics": 0, "important_topics": 0, "total_log_files": 0, "memory_file_size": 0, "current_conversation_count": 0}
+            return {"total_topics": 0, "important_topics": 0, "total_log_files": 0, "memory_file_size": 0, "current_conversation_count": 0, "digest_count": 0}
+
+    def _find_topic(self, topic):
+        """按主题记录或其ID在当前主题列表中查找（后台整理可能已移动或归档该主题，不能使用列表位置）"""
+        topic_id = topic if isinstance(topic, str) else ensure_topic_id(topic)
+        for entry in self.memory_index.get("topics", []):
+            if entry is topic or entry.get("id") == topic_id:
+                return entry
+        return None
 
-    def mark_as_important(self, topic_index):
-        """标记为重点记忆"""
+    def mark_as_important(self, topic):
+        """标记为重点记忆（topic为主题记录或主题ID；主题已被归档时返回False）"""
         try:
-            topics = self.memory_index.get("topics", [])
-            if 0 <= topic_index < len(topics):
-                topics[topic_index]["is_important"] = True
-                self.save_memory()
-                return True
+            with self._write_lock:
+                entry = self._find_topic(topic)
+                if entry is not None:
+                    self._set_important(entry, True)
+                    self.save_memory()
+                    return True
             return False
         except Exception as e:
             print(f"标记重点记忆失败: {str(e)}")
             return False
 
-    def unmark_as_important(self, topic_index):
-        """取消重点记忆标记"""
+    def unmark_as_important(self, topic):
+        """取消重点记忆标记（topic为主题记录或主题ID；主题已被归档时返回False）"""
         try:
-            topics = self.memory_index.get("topics", [])
-            if 0 <= topic_index < len(topics):
-                topics[topic_index]["is_important"] = False
-                self.save_memory()
-                return True
+            with self._write_lock:
+                entry = self._find_topic(topic)
+                if entry is not None:
+                    self._set_important(entry, False)
+                    self.save_memory()
+                    return True
             return False
         except Exception as e:
             print(f"取消重点记忆标记失败: {str(e)}")
             return False
 
+    def _set_important(self, topic, is_important):
+        """修改重点记忆标记并更新统计"""
+        if topic.is_important != is_important:
+            topic.is_important = is_important
+            self.stats.adjust(important_topics=1 if is_important else -1)
+
     def get_important_memories(self):
         """获取所有重点记忆"""
         try:
             topics = self.memory_index.get("topics", [])
-            important_memories = [topic for topic in topics if topic.get("is_important", False)]
+            important_memories = [topic for topic in topics if topic.is_important]
             return important_memories
         except Exception as e:
             print(f"获取重点记忆失败: {str(e)}")
@@ -983,11 +1302,12 @@ class MemoryLake:
     def mark_first_memory_as_important(self):
         """将第一条记忆标记为重点记忆"""
         try:
-            topics = self.memory_index.get("topics", [])
-            if topics:
-                topics[0]["is_important"] = True
-                self.save_memory()
-                return True
+            with self._write_lock:
+                topics = self.memory_index.get("topics", [])
+                if topics:
+                    self._set_important(topics[0], True)
+                    self.save_memory()
+                    return True
             return False
         except Exception as e:
             print(f"标记第一条记忆为重点记忆失败: {str(e)}")
@@ -996,11 +1316,12 @@ class MemoryLake:
     def ensure_first_memory_important(self):
         """确保第一条记忆是重点记忆"""
         try:
-            topics = self.memory_index.get("topics", [])
-            if topics and not topics[0].get("is_important", False):
-                topics[0]["is_important"] = True
-                self.save_memory()
-                return True
+            with self._write_lock:
+                topics = self.memory_index.get("topics", [])
+                if topics and not topics[0].is_important:
+                    self._set_important(topics[0], True)
+                    self.save_memory()
+                    return True
             return False
         except Exception as e:
             print(f"确保第一条记忆为重点记忆失败: {str(e)}")
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖统计计数器
+记忆湖在每次修改时增量更新计数，读取方拿到的是一份快照，不需要重新扫描主题列表和目录
+"""
+
+import threading
+from typing import Dict, Optional
+
+STAT_FIELDS = ("total_topics", "important_topics", "total_log_files", "memory_file_size",
+               "current_conversation_count", "digest_count",
+               "local_summaries", "ai_summaries")  # 最后两项为本次运行中本地/AI总结的会话数
+
+
+class MemoryStats:
+    """统计计数器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {field: 0 for field in STAT_FIELDS}
+
+    def set(self, **values):
+        with self._lock:
+            self._counters.update(values)
+
+    def adjust(self, **deltas):
+        with self._lock:
+            for field, delta in deltas.items():
+                self._counters[field] = self._counters.get(field, 0) + delta
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+_published: Optional[MemoryStats] = None
+
+
+def publish_stats(stats: MemoryStats):
+    """发布本进程记忆湖的统计计数器，供MCP工具等读取"""
+    global _published
+    _published = stats
+
+
+def published_stats() -> Optional[MemoryStats]:
+    """本进程已发布的统计计数器（独立运行的MCP服务中没有记忆湖时为None）"""
+    return _published
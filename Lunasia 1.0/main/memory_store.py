@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖分片存储
+按月份分片保存对话详情，启动时只加载记录主题头信息的清单文件，详情在首次访问时按需加载
+已汇总为摘要的归档主题按月份单独保存（archive-YYYY-MM.json），不进入清单，只在摘要下钻时加载
+写入：单写入方（保存锁 + 跨进程建议锁），先写临时文件再os.replace，读取方不会看到写了一半的文件
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from memory_compactor import ensure_topic_id
+from memory_topic import DETAILS_FIELD, MemoryTopic, topics_from_dicts
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "manifest.lock"
+ARCHIVE_PREFIX = "archive-"
+
+
+@contextmanager
+def advisory_lock(path: str, exclusive: bool = True):
+    """跨进程建议锁（Windows使用msvcrt，只支持独占锁；其他平台使用fcntl）
+    
+    加锁失败时只打印警告，不阻止读写（写入本身是原子替换）
+    """
+    f = open(path, 'a+b')
+    locked = False
+    try:
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            locked = True
+        except OSError as e:
+            print(f"⚠️ 获取记忆文件锁失败: {str(e)}")
+        yield
+    finally:
+        if locked:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            except OSError:
+                pass
+        f.close()
+
+
+def _empty_index() -> Dict:
+    return {"topics": [], "conversations": {}, "contexts": {}}
+
+
+class ShardedMemoryStore:
+    """按月分片的记忆存储 - 清单常驻内存，详情分片通过LRU缓存按需加载"""
+
+    def __init__(self, shard_dir: str, legacy_file: Optional[str] = None, cache_size: int = 6):
+        self.shard_dir = shard_dir
+        self.legacy_file = legacy_file
+        self.cache_size = max(1, cache_size)
+        self.manifest_path = os.path.join(shard_dir, MANIFEST_FILE)
+        self.lock_path = os.path.join(shard_dir, LOCK_FILE)
+        self._shards = OrderedDict()  # 月份 -> {主题ID: 对话详情}
+        self._dirty = set()
+        self._archives = OrderedDict()  # 月份 -> {主题ID: 归档主题}
+        self._archive_dirty = set()
+        self._file_sizes = None  # 文件名 -> 字节数，首次统计时扫描一次，之后随写入更新
+        self._lock = threading.RLock()  # 分片缓存锁（只在内存操作期间持有）
+        self._save_lock = threading.Lock()  # 保存锁：同一时间只有一个写入方写盘
+
+    def load(self) -> Dict:
+        """加载清单；首次运行时从旧版单文件记忆迁移"""
+        if not os.path.exists(self.manifest_path):
+            legacy = self._load_legacy()
+            if legacy is None:
+                return _empty_index()
+            self.save(legacy)
+            backup_file = f"{self.legacy_file}.migrated"
+            try:
+                os.replace(self.legacy_file, backup_file)
+                print(f"📦 识底深湖已迁移为分片存储，旧文件备份为 {backup_file}")
+            except OSError as e:
+                print(f"⚠️ 备份旧记忆文件失败: {str(e)}")
+            return self._to_records(legacy)
+
+        try:
+            with advisory_lock(self.lock_path, exclusive=False):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            if isinstance(data, dict):
+                data.setdefault("topics", [])
+                data = self._to_records(data)
+                if "archive" in data:
+                    self._migrate_archive(data)
+                return data
+        except Exception as e:
+            print(f"⚠️ 加载识底深湖清单失败: {str(e)}")
+        return _empty_index()
+
+    def _migrate_archive(self, memory_index: Dict):
+        """旧版清单中的归档主题移入按月的归档分片，清单只保留数量"""
+        archive = memory_index.pop("archive")
+        self.add_archived(archive)
+        memory_index["archived_count"] = memory_index.get("archived_count", 0) + len(archive)
+        self.save(memory_index)
+        print(f"📦 已将 {len(archive)} 条归档主题移出识底深湖清单")
+
+    def _to_records(self, memory_index: Dict) -> Dict:
+        """主题（以及旧版清单中的归档主题）转换为MemoryTopic，详情通过本存储按需加载（摘要保持字典）"""
+        for key in ("topics", "archive"):
+            if key in memory_index:
+                records = topics_from_dicts(memory_index[key])
+                for record in records:
+                    record.set_details_loader(self.get_details)
+                memory_index[key] = records
+        return memory_index
+
+    def _load_legacy(self) -> Optional[Dict]:
+        """读取旧版 memory_lake.json（兼容数组格式）"""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return None
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            return None
+        if isinstance(data, list):
+            return {"topics": data, "conversations": {}, "contexts": {}}
+        if isinstance(data, dict):
+            data.setdefault("topics", [])
+            return data
+        return None
+
+    @staticmethod
+    def shard_of(entry: Dict) -> str:
+        """主题所属的月份分片"""
+        date = entry.get("date", "")
+        return date[:7] if len(date) >= 7 else "unknown"
+
+    def _shard_path(self, shard: str) -> str:
+        return os.path.join(self.shard_dir, f"{shard}.json")
+
+    def _get_shard(self, shard: str) -> Dict:
+        """获取分片（命中缓存时移到最近使用位置，未命中时从磁盘加载）"""
+        with self._lock:
+            if shard in self._shards:
+                self._shards.move_to_end(shard)
+                return self._shards[shard]
+
+            data = {}
+            path = self._shard_path(shard)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                except Exception as e:
+                    print(f"⚠️ 加载记忆分片 {shard} 失败: {str(e)}")
+            self._shards[shard] = data
+            self._evict(keep=shard)
+            return data
+
+    def _evict(self, keep: Optional[str] = None):
+        """超出缓存容量时淘汰最久未使用的分片（未写盘的分片和刚加载的分片不淘汰）"""
+        for shard in list(self._shards.keys()):
+            if len(self._shards) <= self.cache_size:
+                break
+            if shard not in self._dirty and shard != keep:
+                del self._shards[shard]
+
+    def get_details(self, entry) -> str:
+        """获取主题的对话详情（按需加载分片）"""
+        if isinstance(entry, MemoryTopic):
+            if entry.has_pending_details():
+                return entry.details
+        elif DETAILS_FIELD in entry:
+            return entry.get(DETAILS_FIELD, "")
+        topic_id = entry.get("id")
+        if not topic_id:
+            return ""
+        shard = entry.get("shard") or self.shard_of(entry)
+        return self._get_shard(shard).get(topic_id, "")
+
+    def save(self, memory_index: Dict):
+        """保存：新写入的详情移入对应分片，只重写有变化的分片和清单
+        
+        分片缓存锁只在整理内存数据时持有，写盘期间读取详情不会被阻塞
+        """
+        os.makedirs(self.shard_dir, exist_ok=True)
+        with self._save_lock, advisory_lock(self.lock_path):
+            with self._lock:
+                manifest = dict(memory_index)
+                manifest.pop("archive", None)  # 归档主题保存在归档分片中
+                headers = []
+                for entry in memory_index.get("topics", []):
+                    headers.append(self._take_details(entry))
+                manifest["topics"] = headers
+                dirty = sorted(self._dirty)
+                archives = {shard: {topic_id: entry.to_dict() for topic_id, entry in self._archives.get(shard, {}).items()}
+                            for shard in self._archive_dirty}
+
+            # 未写盘的分片不会被淘汰，写盘期间只有本写入方修改分片内容
+            for shard in dirty:
+                self._write_json(self._shard_path(shard), self._shards.get(shard, {}))
+            for shard, headers in sorted(archives.items()):
+                self._write_json(self._archive_path(shard), headers)
+            self._write_json(self.manifest_path, manifest)
+
+            with self._lock:
+                self._dirty.difference_update(dirty)
+                self._archive_dirty.difference_update(archives)
+                self._evict()
+                self._evict_archives()
+
+    def _take_details(self, entry) -> Dict:
+        """新写入的详情移入分片，返回主题头信息"""
+        if isinstance(entry, MemoryTopic):
+            if entry.has_pending_details():
+                # 先放入分片缓存、设置加载器，再取走内存中的详情，读取方任何时刻都能拿到详情
+                self._move_to_shard(entry, entry.details)
+                entry.set_details_loader(self.get_details)
+                entry.take_pending_details()
+            return entry.to_dict()
+        if DETAILS_FIELD in entry:
+            self._move_to_shard(entry, entry.pop(DETAILS_FIELD))
+        return entry
+
+    # ---- 归档主题 ----
+
+    def _archive_path(self, shard: str) -> str:
+        return os.path.join(self.shard_dir, f"{ARCHIVE_PREFIX}{shard}.json")
+
+    def _get_archive(self, shard: str) -> Dict[str, MemoryTopic]:
+        """获取某月的归档主题（LRU缓存，未命中时从磁盘加载）"""
+        with self._lock:
+            if shard in self._archives:
+                self._archives.move_to_end(shard)
+                return self._archives[shard]
+
+            records = {}
+            path = self._archive_path(shard)
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    for record in topics_from_dicts(data.values()):
+                        record.set_details_loader(self.get_details)
+                        records[record.id] = record
+                except Exception as e:
+                    print(f"⚠️ 加载归档分片 {shard} 失败: {str(e)}")
+            self._archives[shard] = records
+            self._evict_archives(keep=shard)
+            return records
+
+    def _evict_archives(self, keep: Optional[str] = None):
+        for shard in list(self._archives.keys()):
+            if len(self._archives) <= self.cache_size:
+                break
+            if shard not in self._archive_dirty and shard != keep:
+                del self._archives[shard]
+
+    def add_archived(self, entries: Iterable):
+        """把已汇总为摘要的主题放入所属月份的归档分片（下次保存时写盘）"""
+        with self._lock:
+            for entry in topics_from_dicts(entries):
+                self._take_details(entry)
+                entry.set_details_loader(self.get_details)
+                # 按日期所在月份归档，与日摘要的周期（日期）对应
+                shard = self.shard_of(entry)
+                self._archive_dirty.add(shard)
+                self._get_archive(shard)[ensure_topic_id(entry)] = entry
+
+    def get_archived(self, shard: str, topic_ids: Optional[Iterable[str]] = None) -> List[MemoryTopic]:
+        """读取某月的归档主题；topic_ids 为空时返回该月全部归档主题"""
+        with self._lock:
+            archive = self._get_archive(shard)
+            if topic_ids is None:
+                return list(archive.values())
+            return [archive[topic_id] for topic_id in topic_ids if topic_id in archive]
+
+    def archived_shards(self) -> List[str]:
+        """有归档主题的月份（按文件名判断，不读取文件内容）"""
+        with self._lock:
+            shards = set(self._archive_dirty)
+        if os.path.isdir(self.shard_dir):
+            for name in os.listdir(self.shard_dir):
+                if name.startswith(ARCHIVE_PREFIX) and name.endswith(".json"):
+                    shards.add(name[len(ARCHIVE_PREFIX):-len(".json")])
+        return sorted(shards)
+
+    def _move_to_shard(self, entry, details: str):
+        """把新写入的对话详情放入主题所属的月份分片（写盘前标记为未写盘，避免被淘汰）"""
+        topic_id = ensure_topic_id(entry)
+        shard = self.shard_of(entry)
+        self._dirty.add(shard)
+        self._get_shard(shard)[topic_id] = details
+        entry["shard"] = shard
+
+    def _write_json(self, path: str, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        if self._file_sizes is not None:
+            self._file_sizes[os.path.basename(path)] = os.path.getsize(path)
+
+    def disk_size(self) -> int:
+        """清单和所有分片占用的磁盘大小（字节）"""
+        with self._lock:
+            if self._file_sizes is None:
+                self._file_sizes = {}
+                if os.path.isdir(self.shard_dir):
+                    with os.scandir(self.shard_dir) as entries:
+                        for entry in entries:
+                            if entry.is_file() and entry.name.endswith('.json'):
+                                self._file_sizes[entry.name] = entry.stat().st_size
+            return sum(self._file_sizes.values())
@@ -10,16 +10,194 @@ import re
 from typing import List, Dict, Optional
 import concurrent.futures
 
+from summary_cache import SummaryCache
+
+# 逐轮总结提示词版本，修改提示词后递增，旧版本的缓存结果不再命中
+SINGLE_ROUND_PROMPT_VERSION = 1
+# 结构化总结中每轮对应的主题和关键词（JSON）的缓存版本；每轮记录与逐轮总结共用缓存
+STRUCTURED_META_VERSION = "structured-1"
+
 class MemorySummaryAgent:
     """记忆总结AI代理 - 纯AI版本"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, cache_file: str = "memory_summary_cache.json"):
         self.config = config
         # 优先使用识底深湖专用模型，如果没有则使用通用模型
         self.model = config.get("memory_summary_model", config.get("selected_model", "deepseek-chat"))
         # 修复模型名称检查，支持所有deepseek模型
         self.api_key = config.get("deepseek_key", "") if "deepseek" in self.model.lower() else config.get("openai_key", "")
+        # 一次结构化总结允许的对话文本长度（字符），超出后退回逐轮总结
+        self.context_budget = config.get("memory_summary_context_budget", 12000)
+        # 逐轮总结缓存：相同的问答只总结一次
+        self.summary_cache = SummaryCache(cache_file, config.get("memory_summary_cache_size", 5000))
+        
+    def _get_client(self):
+        """创建API客户端"""
+        if "deepseek" in self.model.lower():
+            return openai.OpenAI(
+                api_key=self.api_key,
+                base_url="https://api.deepseek.com/v1"
+            )
+        return openai.OpenAI(api_key=self.api_key)
+    
+    def summarize_structured(self, conversation_text: str) -> Optional[Dict]:
+        """🚀 一次调用完成结构化总结：主题、关键词、每轮对话记录
+        
+        返回 {"topic": str, "keywords": [str], "details": [str]}；
+        对话超出上下文预算或多次返回无效JSON时返回None，由调用方退回逐轮总结
+        """
+        conversations = self._smart_split_conversations(conversation_text)
+        if not conversations:
+            return None
+        
+        # 每一轮都总结过时直接使用缓存，不调用AI
+        cached = self._cached_structured_summary(conversations)
+        if cached:
+            return cached
+        
+        if len(conversation_text) > self.context_budget:
+            print(f"🔧 对话长度 {len(conversation_text)} 超出结构化总结预算 {self.context_budget}，使用逐轮总结")
+            return None
         
+        rounds_text = "\n\n".join(
+            f"【第{i}轮】\n{conv}" for i, conv in enumerate(conversations, 1)
+        )
+        
+        prompt = f"""请分析以下{len(conversations)}轮对话，只输出一个JSON对象，不要输出其他内容。格式：
+{{"topic": "主题", "keywords": ["关键词1", "关键词2"], "details": ["第1轮精简记录", "第2轮精简记录"]}}
+
+要求：
+1. topic：识别所有主要话题类型（如音乐推荐、国家介绍、天气查询、编程代码、出行建议、文件保存、技术解释等），多主题用顿号分隔，具体准确，最多40字
+2. keywords：3-8个关键词，保留具体名称（歌曲名、国家、城市、编程语言等）
+3. details：必须恰好{len(conversations)}项，与对话轮次一一对应
+4. 每项保持问答格式"指挥官: xxx\n露尼西亚: xxx"，使用缩写句子，保留具体数据、名称、地点等关键信息，每项300字以内
+5. 要准确反映实际对话内容，不要添加不存在的信息
+
+对话内容：
+{rounds_text}"""
+        
+        max_retries = 3
+        retry_delay = 2
+        
+        for attempt in range(max_retries):
+            try:
+                print(f"🔧 开始AI结构化总结，模型: {self.model} (第{attempt + 1}次尝试)")
+                client = self._get_client()
+                
+                request_kwargs = {
+                    "model": self.model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    "max_tokens": 4000,
+                    "temperature": 0.3,
+                    "timeout": 240
+                }
+                # 推理模型不支持JSON输出模式，只依赖提示词约束
+                if "reasoner" not in self.model.lower():
+                    request_kwargs["response_format"] = {"type": "json_object"}
+                
+                response = client.chat.completions.create(**request_kwargs)
+                
+                if not response.choices:
+                    print(f"⚠️ 结构化总结API响应没有选择")
+                    continue
+                
+                content = (response.choices[0].message.content or "").strip()
+                result = self._parse_structured_summary(content, len(conversations))
+                if result:
+                    print(f"✅ AI结构化总结成功: {result['topic']} ({len(result['details'])}轮)")
+                    self._store_structured_summary(conversations, result)
+                    return result
+                
+                print(f"⚠️ 结构化总结返回无效JSON: '{content[:100]}'，重新调用AI...")
+                
+            except Exception as e:
+                print(f"⚠️ AI结构化总结失败 (第{attempt + 1}次): {str(e)}")
+                if attempt < max_retries - 1:
+                    print(f"🔄 等待{retry_delay}秒后重试...")
+                    import time
+                    time.sleep(retry_delay)
+                    retry_delay *= 2  # 指数退避
+        
+        print(f"❌ AI结构化总结最终失败，退回逐轮总结")
+        return None
+    
+    def _cached_structured_summary(self, conversations: List[str]) -> Optional[Dict]:
+        """所有轮次都有缓存的记录时组合出结构化总结，否则返回None
+        
+        主题和关键词取自各轮缓存的结构化总结；只有逐轮总结缓存的轮次没有主题，主题全部缺失时为None，由调用方补充
+        """
+        details = []
+        metas = []
+        for conv in conversations:
+            detail = self.summary_cache.get(SummaryCache.key(self.model, SINGLE_ROUND_PROMPT_VERSION, conv))
+            if not detail:
+                return None
+            details.append(detail)
+            meta = self.summary_cache.get(SummaryCache.key(self.model, STRUCTURED_META_VERSION, conv))
+            if meta:
+                try:
+                    metas.append(json.loads(meta))
+                except ValueError:
+                    pass
+        
+        topics = []
+        keywords = []
+        for meta in metas:
+            for part in str(meta.get("topic", "")).split("、"):
+                if part.strip() and part.strip() not in topics:
+                    topics.append(part.strip())
+            for keyword in meta.get("keywords", []):
+                if keyword not in keywords:
+                    keywords.append(keyword)
+        topic = "、".join(topics)[:40] or None
+        print(f"📦 {len(conversations)}轮对话全部命中总结缓存，跳过AI结构化总结")
+        return {"topic": topic, "keywords": keywords, "details": details}
+    
+    def _store_structured_summary(self, conversations: List[str], result: Dict):
+        """按轮缓存结构化总结：每轮记录与逐轮总结共用缓存键，另存本次的主题和关键词"""
+        meta = json.dumps({"topic": result["topic"], "keywords": result["keywords"]}, ensure_ascii=False)
+        for conv, detail in zip(conversations, result["details"]):
+            self.summary_cache.put(SummaryCache.key(self.model, SINGLE_ROUND_PROMPT_VERSION, conv), detail)
+            self.summary_cache.put(SummaryCache.key(self.model, STRUCTURED_META_VERSION, conv), meta)
+        self.summary_cache.flush()
+    
+    def _parse_structured_summary(self, content: str, expected_rounds: int) -> Optional[Dict]:
+        """解析并校验结构化总结结果"""
+        if not content:
+            return None
+        
+        # 兼容模型用```json代码块包裹的情况
+        json_match = re.search(r'\{.*\}', content, re.DOTALL)
+        if not json_match:
+            return None
+        
+        try:
+            data = json.loads(json_match.group())
+        except (ValueError, TypeError):
+            return None
+        
+        if not isinstance(data, dict):
+            return None
+        
+        topic = data.get("topic")
+        keywords = data.get("keywords", [])
+        details = data.get("details")
+        
+        if not isinstance(topic, str) or not (2 <= len(topic.strip()) <= 40):
+            return None
+        if not isinstance(keywords, list):
+            return None
+        if not isinstance(details, list) or len(details) != expected_rounds:
+            return None
+        if not all(isinstance(item, str) and len(item.strip()) > 5 for item in details):
+            return None
+        
+        return {
+            "topic": topic.strip(),
+            "keywords": [str(k).strip() for k in keywords if str(k).strip()],
+            "details": [item.strip() for item in details]
+        }
+    
     def summarize_topic(self, conversation_text: str) -> str:
         """🚀 总结对话主题 - 纯AI方式"""
         max_retries = 5  # 增加重试次数，确保AI能够成功
@@ -338,6 +516,8 @@ class MemorySummaryAgent:
         except Exception as e:
             print(f"⚠️ AI对话记录总结失败: {str(e)}")
             return self._fallback_conversation_summary(conversation_text)
+        finally:
+            self.summary_cache.flush()
     
     def _smart_split_conversations(self, conversation_text: str) -> List[str]:
         """🚀 智能分割对话内容，识别完整的问答对"""
@@ -383,7 +563,22 @@ class MemorySummaryAgent:
             return [conversation_text]
     
     def _summarize_single_conversation(self, conversation_text: str, round_num: int) -> str:
-        """🚀 总结单轮对话 - 纯AI方式"""
+        """🚀 总结单轮对话 - 相同的问答已总结过时直接使用缓存结果"""
+        key = SummaryCache.key(self.model, SINGLE_ROUND_PROMPT_VERSION, conversation_text)
+        cached = self.summary_cache.get(key)
+        if cached:
+            print(f"📦 第{round_num}轮对话命中总结缓存，跳过AI调用")
+            return cached
+        
+        result = self._request_single_conversation_summary(conversation_text, round_num)
+        if result:
+            # 只缓存AI生成的结果，备用方案的结果下次仍会重新调用AI
+            self.summary_cache.put(key, result)
+            return result
+        return self._fallback_single_conversation_summary(conversation_text, round_num)
+    
+    def _request_single_conversation_summary(self, conversation_text: str, round_num: int) -> Optional[str]:
+        """🚀 调用AI总结单轮对话 - 纯AI方式，最终失败时返回None"""
         max_retries = 3  # 单轮对话增加重试次数
         retry_delay = 1
         
@@ -477,11 +672,9 @@ class MemorySummaryAgent:
                     retry_delay *= 2  # 指数退避
                 else:
                     print(f"❌ 第{round_num}轮对话总结最终失败")
-                    # 🚀 修复：使用智能备用方案
-                    return self._fallback_single_conversation_summary(conversation_text, round_num)
+                    return None
         
-        # 🚀 修复：确保永远不返回None
-        return self._fallback_single_conversation_summary(conversation_text, round_num)
+        return None
     
     def _extract_single_conversation_from_reasoning(self, reasoning: str, round_num: int) -> str:
         """🚀 从推理内容中提取单轮对话记录 - 纯AI方式"""
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖后台总结队列
+将待总结的对话批次持久化到磁盘，由后台线程调用AI总结，不阻塞聊天主流程
+"""
+
+import json
+import os
+import threading
+import datetime
+import uuid
+from typing import Dict, List, Optional
+
+
+class MemorySummaryQueue:
+    """后台总结队列 - 待处理批次持久化，程序崩溃或退出后下次启动继续处理"""
+
+    def __init__(self, memory_lake, pending_file: str = "memory_pending.json", retry_delay: float = 30.0):
+        self.memory_lake = memory_lake
+        self.pending_file = pending_file
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._worker = None
+        self.pending = self._load_pending()
+
+    def _load_pending(self) -> List[Dict]:
+        """加载上次未完成的待总结批次"""
+        if os.path.exists(self.pending_file):
+            try:
+                with open(self.pending_file, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if isinstance(data, list):
+                        if data:
+                            print(f"📥 发现 {len(data)} 个未完成的总结批次，将在后台继续处理")
+                        return data
+            except Exception as e:
+                print(f"⚠️ 加载待总结队列失败: {str(e)}")
+        return []
+
+    def _persist(self):
+        """持久化待总结批次（先写临时文件再替换，避免写到一半崩溃）"""
+        tmp_file = f"{self.pending_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.pending, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.pending_file)
+
+    def start(self):
+        """启动后台总结线程"""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="MemorySummaryWorker", daemon=True)
+        self._worker.start()
+        if self.pending:
+            self._wakeup.set()
+
+    def stop(self):
+        """通知后台线程停止（不等待正在进行的AI调用，未完成批次保留在磁盘上）"""
+        self._stopped = True
+        self._wakeup.set()
+
+    def enqueue(self, conversations: List[Dict], is_important: bool = False) -> Optional[str]:
+        """加入一个待总结批次，立即返回批次ID"""
+        if not conversations:
+            return None
+
+        batch = {
+            "id": uuid.uuid4().hex,
+            "created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "is_important": is_important,
+            "conversations": [
+                {
+                    "timestamp": conv.get("timestamp", ""),
+                    "user_input": conv.get("user_input", ""),
+                    "ai_response": conv.get("ai_response", ""),
+                    "full_text": conv.get("full_text", "")
+                }
+                for conv in conversations
+            ]
+        }
+
+        with self._lock:
+            self.pending.append(batch)
+            try:
+                self._persist()
+            except Exception as e:
+                print(f"⚠️ 持久化待总结队列失败: {str(e)}")
+
+        print(f"📤 已加入后台总结队列: {len(conversations)}条对话 (待处理批次: {len(self.pending)})")
+        self._wakeup.set()
+        return batch["id"]
+
+    def pending_count(self) -> int:
+        """待处理批次数量"""
+        with self._lock:
+            return len(self.pending)
+
+    def _next_batch(self) -> Optional[Dict]:
+        with self._lock:
+            return self.pending[0] if self.pending else None
+
+    def _finish_batch(self, batch_id: str):
+        with self._lock:
+            self.pending = [batch for batch in self.pending if batch.get("id") != batch_id]
+            try:
+                self._persist()
+            except Exception as e:
+                print(f"⚠️ 更新待总结队列失败: {str(e)}")
+
+    def _run(self):
+        """后台线程主循环：逐个处理批次，成功后才从队列中移除"""
+        while not self._stopped:
+            batch = self._next_batch()
+            if batch is None:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            try:
+                topic = self.memory_lake.save_topic_from_conversations(
+                    batch.get("conversations", []),
+                    is_important=batch.get("is_important", False),
+                    notify_saved=False,
+                    batch_id=batch.get("id")
+                )
+            except Exception as e:
+                print(f"⚠️ 后台总结批次失败: {str(e)}")
+                topic = None
+
+            if topic:
+                print(f"✅ 后台总结完成: {topic}")
+                self._finish_batch(batch["id"])
+                self.memory_lake.compact_memories()
+            else:
+                # 保留批次，稍后重试
+                print(f"🔄 后台总结未成功，{self.retry_delay}秒后重试")
+                self._wakeup.wait(self.retry_delay)
+                self._wakeup.clear()
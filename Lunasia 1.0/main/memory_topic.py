@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖主题记录
+使用__slots__的紧凑主题对象：关键词驻留为整数ID，日期保存为整数序数，对话详情按需加载
+"""
+
+import datetime
+import threading
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+DETAILS_FIELD = "conversation_details"
+
+# 直接映射到槽位的字段，其余字段（summary、context等）保存在extra中原样往返
+_SLOT_FIELDS = ("id", "topic", "timestamp", "conversation_count", "is_important", "shard", "batch_id")
+
+
+class KeywordTable:
+    """关键词驻留表 - 同一关键词在所有主题间共享一个整数ID"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        self._lock = threading.Lock()
+
+    def intern(self, word: str) -> int:
+        word_id = self._ids.get(word)
+        if word_id is not None:
+            return word_id
+        with self._lock:
+            word_id = self._ids.get(word)
+            if word_id is None:
+                word_id = len(self._words)
+                self._words.append(word)
+                self._ids[word] = word_id
+            return word_id
+
+    def intern_all(self, words: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self.intern(word) for word in words)
+
+    def lookup(self, word: str) -> Optional[int]:
+        """查找关键词ID（不存在时返回None，不新增）"""
+        return self._ids.get(word)
+
+    def words(self, word_ids: Iterable[int]) -> List[str]:
+        return [self._words[word_id] for word_id in word_ids]
+
+
+KEYWORDS = KeywordTable()
+
+
+def date_to_ordinal(date_str: str) -> int:
+    """'YYYY-MM-DD' -> 日期序数，无效日期返回0"""
+    try:
+        return datetime.date(int(date_str[0:4]), int(date_str[5:7]), int(date_str[8:10])).toordinal()
+    except (TypeError, ValueError, IndexError):
+        return 0
+
+
+def ordinal_to_date(ordinal: int) -> str:
+    return datetime.date.fromordinal(ordinal).isoformat() if ordinal > 0 else ""
+
+
+class MemoryTopic:
+    """识底深湖主题记录，兼容原有字典式访问（get / [] / in）"""
+
+    __slots__ = ("id", "topic", "date_ordinal", "timestamp", "keyword_ids", "conversation_count",
+                 "is_important", "shard", "batch_id", "extra", "relevance_score",
+                 "_details", "_details_loader")
+
+    def __init__(self, topic: str = "", date: str = "", timestamp: str = "", keywords: Iterable[str] = (),
+                 conversation_count: int = 0, is_important: bool = False, id: Optional[str] = None,
+                 shard: Optional[str] = None, batch_id: Optional[str] = None, details: Optional[str] = None,
+                 extra: Optional[Dict] = None):
+        self.id = id
+        self.topic = topic
+        self.date_ordinal = date_to_ordinal(date)
+        self.timestamp = timestamp
+        self.keyword_ids = KEYWORDS.intern_all(keywords)
+        self.conversation_count = conversation_count
+        self.is_important = is_important
+        self.shard = shard
+        self.batch_id = batch_id
+        self.extra = extra
+        self.relevance_score = 0.0
+        self._details = details
+        self._details_loader: Optional[Callable[["MemoryTopic"], str]] = None
+
+    # ---- 派生字段 ----
+
+    @property
+    def date(self) -> str:
+        return ordinal_to_date(self.date_ordinal)
+
+    @property
+    def keywords(self) -> List[str]:
+        return KEYWORDS.words(self.keyword_ids)
+
+    @property
+    def details(self) -> str:
+        """对话详情：已在内存中则直接返回，否则通过加载器从分片读取（不常驻）"""
+        if self._details is not None:
+            return self._details
+        if self._details_loader is not None:
+            return self._details_loader(self) or ""
+        return ""
+
+    def set_details_loader(self, loader: Callable[["MemoryTopic"], str]):
+        self._details_loader = loader
+
+    def has_pending_details(self) -> bool:
+        """是否有尚未写入分片的对话详情"""
+        return self._details is not None
+
+    def take_pending_details(self) -> Optional[str]:
+        """取出尚未写入分片的对话详情（写入后由分片缓存负责）"""
+        details, self._details = self._details, None
+        return details
+
+    # ---- JSON互转 ----
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MemoryTopic":
+        extra = {key: value for key, value in data.items()
+                 if key not in _SLOT_FIELDS and key not in ("date", "keywords", DETAILS_FIELD, "relevance_score")}
+        return cls(
+            topic=data.get("topic", ""),
+            date=data.get("date", ""),
+            timestamp=data.get("timestamp", ""),
+            keywords=data.get("keywords", []) or [],
+            conversation_count=data.get("conversation_count", 0),
+            is_important=data.get("is_important", False),
+            id=data.get("id"),
+            shard=data.get("shard"),
+            batch_id=data.get("batch_id"),
+            details=data.get(DETAILS_FIELD),
+            extra=extra or None
+        )
+
+    def to_dict(self, include_details: bool = False) -> Dict:
+        data = {
+            "topic": self.topic,
+            "timestamp": self.timestamp,
+            "date": self.date,
+            "conversation_count": self.conversation_count,
+            "keywords": self.keywords,
+            "is_important": self.is_important
+        }
+        for key in ("id", "shard", "batch_id"):
+            value = getattr(self, key)
+            if value:
+                data[key] = value
+        if self.extra:
+            data.update(self.extra)
+        if include_details:
+            data[DETAILS_FIELD] = self.details
+        return data
+
+    # ---- 字典式访问兼容 ----
+
+    def get(self, key: str, default=None):
+        if key in _SLOT_FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        if key == "date":
+            return self.date
+        if key == "keywords":
+            return self.keywords
+        if key == DETAILS_FIELD:
+            return self.details
+        if key == "relevance_score":
+            return self.relevance_score
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        if key in _SLOT_FIELDS or key == "relevance_score":
+            setattr(self, key, value)
+        elif key == "date":
+            self.date_ordinal = date_to_ordinal(value)
+        elif key == "keywords":
+            self.keyword_ids = KEYWORDS.intern_all(value)
+        elif key == DETAILS_FIELD:
+            self._details = value
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __repr__(self):
+        return f"MemoryTopic({self.date} {self.timestamp} {self.topic!r})"
+
+
+_MISSING = object()
+
+
+def topics_from_dicts(items: Iterable) -> List[MemoryTopic]:
+    """把JSON中的主题列表转换为MemoryTopic列表（已是MemoryTopic的保持不变）"""
+    return [item if isinstance(item, MemoryTopic) else MemoryTopic.from_dict(item)
+            for item in items if isinstance(item, (dict, MemoryTopic))]
+
+
+class TopicTextIndex:
+    """主题文字索引 - 字符二元组 -> 行号，按子串过滤时只核对候选行"""
+
+    def __init__(self, rows: List, text_of: Callable):
+        self.rows = rows
+        self.texts = [text_of(row).lower() for row in rows]
+        self._grams: Dict[str, array] = {}
+        for position, text in enumerate(self.texts):
+            for gram in {text[i:i + 2] for i in range(len(text) - 1)}:
+                postings = self._grams.get(gram)
+                if postings is None:
+                    postings = self._grams[gram] = array('I')
+                postings.append(position)
+
+    def search(self, query: str) -> List:
+        """返回文字中包含query的行（保持原有顺序）"""
+        query = query.lower()
+        if not query:
+            return list(self.rows)
+        if len(query) < 2:
+            positions = range(len(self.texts))
+        else:
+            grams = {query[i:i + 2] for i in range(len(query) - 1)}
+            postings = sorted((self._grams.get(gram, ()) for gram in grams), key=len)
+            candidates = set(postings[0])
+            for other in postings[1:]:
+                candidates.intersection_update(other)
+                if not candidates:
+                    break
+            positions = sorted(candidates)
+        return [self.rows[position] for position in positions if query in self.texts[position]]
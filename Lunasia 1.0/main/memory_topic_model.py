@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+识底深湖主题列表模型
+QAbstractListModel只持有主题记录的引用，显示文字在视图请求可见行时才生成；
+过滤在后台线程通过记忆湖的文字索引完成，代理模型只按结果集合判断行是否可见
+"""
+
+import threading
+
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, QObject, QSortFilterProxyModel, Qt, QTimer, pyqtSignal
+
+
+class MemoryTopicListModel(QAbstractListModel):
+    """主题/归档摘要列表模型"""
+
+    def __init__(self, memory_lake, parent=None):
+        super().__init__(parent)
+        self.memory_lake = memory_lake
+        self._rows = []
+
+    def reload(self):
+        """重新读取记忆湖的行（只复制引用）"""
+        self.beginResetModel()
+        self._rows = self.memory_lake.get_browse_rows()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def row_object(self, row):
+        return self._rows[row]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return self.memory_lake.browse_text(row)
+        if role == Qt.UserRole:
+            return row
+        return None
+
+
+class MemoryTopicFilterProxy(QSortFilterProxyModel):
+    """按后台过滤结果显示行；结果为None时显示全部"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._accepted = None
+
+    def set_accepted(self, rows):
+        self._accepted = None if rows is None else {id(row) for row in rows}
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._accepted is None:
+            return True
+        return id(self.sourceModel().row_object(source_row)) in self._accepted
+
+
+class MemoryTopicFilter(QObject):
+    """防抖过滤：输入停止一段时间后在后台线程检索，结果通过信号回到界面线程"""
+
+    results_ready = pyqtSignal(int, object)
+
+    def __init__(self, memory_lake, proxy, delay_ms=200, parent=None):
+        super().__init__(parent)
+        self.memory_lake = memory_lake
+        self.proxy = proxy
+        self._text = ""
+        self._generation = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self._start_search)
+        self.results_ready.connect(self._apply_results)
+
+    def set_text(self, text):
+        """输入变化时调用，重新开始计时"""
+        self._text = text
+        self._timer.start()
+
+    def refresh(self):
+        """数据重新加载后按当前文字立即重新过滤"""
+        self._timer.stop()
+        self._start_search()
+
+    def _start_search(self):
+        self._generation += 1
+        generation, text = self._generation, self._text
+        if not text:
+            self.proxy.set_accepted(None)
+            return
+        threading.Thread(target=self._search, args=(generation, text), name="MemoryTopicFilter", daemon=True).start()
+
+    def _search(self, generation, text):
+        try:
+            rows = self.memory_lake.search_browse_rows(text)
+        except Exception as e:
+            print(f"过滤主题失败: {str(e)}")
+            return
+        self.results_ready.emit(generation, rows)
+
+    def _apply_results(self, generation, rows):
+        # 只应用最新一次输入的结果，较早的后台检索结果直接丢弃
+        if generation == self._generation:
+            self.proxy.set_accepted(rows)
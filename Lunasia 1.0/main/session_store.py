@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+本次会话对话记录存储
+哈希去重、已保存位图、内存环形缓冲；超出缓冲的较早对话追加写入磁盘分段文件，仍可按需读取
+每轮对话写入时同步更新会话索引，按关键词检索时只访问命中的对话
+"""
+
+import bisect
+import datetime
+import hashlib
+import heapq
+import json
+import os
+import threading
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# 溢出写盘失败的对话在偏移表中的占位值
+_LOST_OFFSET = 2 ** 64 - 1
+
+
+def conversation_key(user_input: str, ai_response: str) -> bytes:
+    """对话去重键（定长摘要，不常驻原文）"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(user_input.encode('utf-8'))
+    digest.update(b"\0")
+    digest.update(ai_response.encode('utf-8'))
+    return digest.digest()
+
+
+class SessionIndex:
+    """会话增量索引
+    
+    - 登记的关键词：关键词 -> 包含该词的对话序号（升序），覆盖整个会话
+    - 二元组：字符二元组 -> 对话序号，只覆盖内存中的对话，用于检索未登记的任意词
+    """
+
+    NGRAM = 2
+
+    def __init__(self, terms: Iterable[str] = ()):
+        self.terms = frozenset(term.lower() for term in terms if term)
+        self.clear()
+
+    def clear(self):
+        self._postings: Dict[str, array] = {}
+        self._grams: Dict[str, deque] = {}
+
+    @classmethod
+    def _grams_of(cls, text: str) -> set:
+        return {text[i:i + cls.NGRAM] for i in range(len(text) - cls.NGRAM + 1)}
+
+    def add(self, seq: int, text: str):
+        """索引一轮对话（text为小写文本）"""
+        for term in self.terms:
+            if term in text:
+                self._postings.setdefault(term, array('I')).append(seq)
+        for gram in self._grams_of(text):
+            self._grams.setdefault(gram, deque()).append(seq)
+
+    def drop_grams(self, seq: int, text: str):
+        """对话溢出到磁盘后移除其二元组（溢出的总是最早的对话，位于倒排表头部）"""
+        for gram in self._grams_of(text):
+            postings = self._grams.get(gram)
+            if postings and postings[0] == seq:
+                postings.popleft()
+                if not postings:
+                    del self._grams[gram]
+
+    def is_term(self, term: str) -> bool:
+        return term in self.terms
+
+    def contains(self, seq: int, term: str) -> bool:
+        """登记的关键词是否出现在指定对话中"""
+        postings = self._postings.get(term)
+        if not postings:
+            return False
+        i = bisect.bisect_left(postings, seq)
+        return i < len(postings) and postings[i] == seq
+
+    def term_postings(self, term: str) -> Iterator[int]:
+        """登记关键词的命中对话，最新的在前"""
+        return reversed(self._postings.get(term, ()))
+
+    def gram_candidates(self, word: str) -> Iterator[int]:
+        """未登记词的候选对话（各二元组倒排表求交集，需调用方再核对原文），最新的在前"""
+        grams = self._grams_of(word)
+        if not grams:
+            return iter(())
+        postings = sorted((self._grams.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                break
+        return iter(sorted(candidates, reverse=True))
+
+
+class SessionConversationStore:
+    """会话对话记录 - 可像列表一样读取（len / 迭代 / 下标 / 切片），只包含内存中的最近对话"""
+
+    def __init__(self, max_in_memory: int = 200, spill_file: str = "session_spill.jsonl",
+                 index_terms: Iterable[str] = ()):
+        self.max_in_memory = max(1, int(max_in_memory))
+        self.spill_file = spill_file
+        self.index = SessionIndex(index_terms)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._ring = deque()            # 内存中的最近对话
+        self._keys = {}                 # 去重键 -> 序号
+        self._saved = bytearray()       # 已保存位图，第seq位表示第seq条对话
+        self._spill_offsets = array('Q')  # 已溢出对话在分段文件中的偏移，下标即序号
+        self._next_seq = 0
+        self.index.clear()
+        # 新会话开始时清空上一次的溢出分段
+        try:
+            if os.path.exists(self.spill_file):
+                os.remove(self.spill_file)
+        except OSError as e:
+            print(f"⚠️ 清理会话溢出文件失败: {str(e)}")
+
+    # ---- 写入 ----
+
+    def add(self, user_input: str, ai_response: str) -> Optional[Dict]:
+        """添加一轮对话；相同的对话已存在时返回None"""
+        key = conversation_key(user_input, ai_response)
+        with self._lock:
+            if key in self._keys:
+                return None
+
+            seq = self._next_seq
+            self._next_seq += 1
+            conv = {
+                "seq": seq,
+                "timestamp": datetime.datetime.now().strftime("%H:%M:%S"),
+                "user_input": user_input,
+                "ai_response": ai_response,
+                "full_text": f"指挥官: {user_input}\n露尼西亚: {ai_response}"
+            }
+            self._keys[key] = seq
+            if seq // 8 >= len(self._saved):
+                self._saved.append(0)
+            self._ring.append(conv)
+            self.index.add(seq, conv["full_text"].lower())
+
+            while len(self._ring) > self.max_in_memory:
+                spilled = self._ring.popleft()
+                self.index.drop_grams(spilled["seq"], spilled["full_text"].lower())
+                self._spill(spilled)
+            return conv
+
+    def _spill(self, conv: Dict):
+        """把最早的对话追加写入磁盘分段，并记录偏移以便随机读取"""
+        try:
+            with open(self.spill_file, 'ab') as f:
+                offset = f.tell()
+                f.write(json.dumps(conv, ensure_ascii=False).encode('utf-8') + b"\n")
+            self._spill_offsets.append(offset)
+        except OSError as e:
+            # 溢出失败时只丢失原文，已保存位图和去重键保留
+            print(f"⚠️ 会话记录溢出写盘失败: {str(e)}")
+            self._spill_offsets.append(_LOST_OFFSET)
+
+    def clear(self):
+        """清空本次会话记录（包括磁盘分段）"""
+        with self._lock:
+            self._reset()
+
+    # ---- 已保存状态 ----
+
+    def mark_saved(self, user_input: str, ai_response: str) -> bool:
+        """按对话内容标记为已保存"""
+        with self._lock:
+            seq = self._keys.get(conversation_key(user_input, ai_response))
+            if seq is None or self.is_saved(seq):
+                return False
+            self.mark_seq_saved(seq)
+            return True
+
+    def mark_seq_saved(self, seq: int):
+        with self._lock:
+            self._saved[seq >> 3] |= 1 << (seq & 7)
+
+    def is_saved(self, seq: int) -> bool:
+        return bool(self._saved[seq >> 3] & (1 << (seq & 7)))
+
+    def unsaved(self) -> List[Dict]:
+        """所有未保存的对话（包括已溢出到磁盘的），按时间顺序"""
+        with self._lock:
+            result = [conv for conv in self.read_spilled() if not self.is_saved(conv["seq"])]
+            result.extend(conv for conv in self._ring if not self.is_saved(conv["seq"]))
+            return result
+
+    # ---- 读取 ----
+
+    def total_count(self) -> int:
+        """本次会话的对话总数（包括已溢出到磁盘的）"""
+        return self._next_seq
+
+    def spilled_count(self) -> int:
+        return len(self._spill_offsets)
+
+    def read_spilled(self, start: int = 0, limit: Optional[int] = None) -> Iterator[Dict]:
+        """按序号读取已溢出到磁盘的对话"""
+        with self._lock:
+            end = len(self._spill_offsets) if limit is None else min(len(self._spill_offsets), start + limit)
+            if start >= end or not os.path.exists(self.spill_file):
+                return iter(())
+            offsets = self._spill_offsets[start:end]
+            try:
+                with open(self.spill_file, 'rb') as f:
+                    result = []
+                    for offset in offsets:
+                        if offset == _LOST_OFFSET:
+                            continue
+                        f.seek(offset)
+                        result.append(json.loads(f.readline().decode('utf-8')))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取会话溢出记录失败: {str(e)}")
+                return iter(())
+            return iter(result)
+
+    def get(self, seq: int) -> Optional[Dict]:
+        """按序号获取对话（内存中没有时从磁盘分段读取）"""
+        with self._lock:
+            if self._ring and seq >= self._ring[0]["seq"]:
+                offset = seq - self._ring[0]["seq"]
+                return self._ring[offset] if offset < len(self._ring) else None
+            return next(self.read_spilled(seq, 1), None)
+
+    # ---- 检索 ----
+
+    def _matches(self, word: str) -> Iterator[int]:
+        """包含某个词的对话序号，最新的在前"""
+        if self.index.is_term(word):
+            return self.index.term_postings(word)
+        if len(word) < SessionIndex.NGRAM:
+            candidates = (conv["seq"] for conv in reversed(self._ring))
+        else:
+            candidates = self.index.gram_candidates(word)
+        return (seq for seq in candidates if word in self.get(seq)["full_text"].lower())
+
+    def latest(self, words: Iterable[str], exclude: Iterable[str] = (), since: int = 0, limit: int = 1) -> List[Dict]:
+        """包含任一检索词、且不包含任何排除词的最近limit轮对话，最新的在前
+        
+        登记的关键词覆盖整个会话（包括已溢出的对话）；未登记的词通过二元组检索内存中的对话
+        """
+        words = [word.lower() for word in words if word]
+        exclude = [word.lower() for word in exclude if word]
+        result = []
+        with self._lock:
+            streams = [self._matches(word) for word in dict.fromkeys(words)]
+            previous = None
+            for seq in heapq.merge(*streams, reverse=True):
+                if seq < since or len(result) >= limit:
+                    break
+                if seq == previous:
+                    continue
+                previous = seq
+                if any(self._contains(seq, word) for word in exclude):
+                    continue
+                conv = self.get(seq)
+                if conv is not None:
+                    result.append(conv)
+        return result
+
+    def _contains(self, seq: int, word: str) -> bool:
+        if self.index.is_term(word):
+            return self.index.contains(seq, word)
+        conv = self.get(seq)
+        return conv is not None and word in conv["full_text"].lower()
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+    def __bool__(self) -> bool:
+        return bool(self._ring)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(list(self._ring))
+
+    def __reversed__(self) -> Iterator[Dict]:
+        return iter(list(reversed(self._ring)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self._ring)[index]
+        return self._ring[index]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+对话总结缓存
+按 (模型, 提示词版本, 对话原文摘要) 寻址保存逐轮总结结果，重试、重复保存同一批对话时不再调用AI
+缓存持久化在磁盘上（先写临时文件再替换），超出容量时淘汰最久未使用的条目
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class SummaryCache:
+    """内容寻址的总结缓存（线程安全）"""
+
+    def __init__(self, cache_file: str = "memory_summary_cache.json", max_entries: int = 5000):
+        self.cache_file = cache_file
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()  # 键 -> 总结
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def key(model: str, prompt_version, text: str) -> str:
+        """缓存键：模型、提示词版本和去除首尾空白后的原文共同决定"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (model, str(prompt_version), text.strip()):
+            digest.update(part.encode('utf-8'))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # 文件中按使用先后保存，最后的是最近使用的
+            for key, summary in data.get("entries", []):
+                self._entries[key] = summary
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"⚠️ 加载总结缓存失败: {str(e)}")
+            self._entries.clear()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key: str, summary: str):
+        if not summary:
+            return
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def flush(self):
+        """有新条目时写入磁盘"""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"entries": list(self._entries.items())}
+            self._dirty = False
+        try:
+            directory = os.path.dirname(self.cache_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = f"{self.cache_file}.{threading.get_ident()}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            print(f"⚠️ 保存总结缓存失败: {str(e)}")
+            with self._lock:
+                self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
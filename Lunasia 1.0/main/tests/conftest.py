@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+测试配置
+模块都在 main 目录下平铺存放（与 benchmarks 相同），测试时把 main 目录加入导入路径
+"""
+
+import os
+import sys
+
+MAIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if MAIN_DIR not in sys.path:
+    sys.path.insert(0, MAIN_DIR)
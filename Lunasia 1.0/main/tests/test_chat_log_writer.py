@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""chat_log_writer：按天压缩写入和按时间范围读取"""
+
+import datetime
+import os
+
+import pytest
+
+from chat_log_writer import ChatLogWriter
+
+
+def at(day, hour, minute=0):
+    return datetime.datetime(2024, 5, day, hour, minute)
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = ChatLogWriter(str(tmp_path / "logs"), retention_days=0, flush_interval=0.05, batch_size=2)
+    yield writer
+    writer.close()
+
+
+def fill(writer, times):
+    for index, timestamp in enumerate(times):
+        assert writer.write(f"问题{index}", f"回答{index}", timestamp=timestamp)
+    writer.close()
+
+
+def test_read_range_across_days_and_batches(writer):
+    times = [at(1, 9), at(1, 12), at(1, 23, 59), at(2, 0, 30), at(2, 8), at(3, 10)]
+    fill(writer, times)
+
+    assert writer.count_log_files() == 3
+    records = writer.read_range(at(1, 12), at(2, 8))
+    assert [record["user_input"] for record in records] == ["问题1", "问题2", "问题3", "问题4"]
+    assert records[0] == {"time": "2024-05-01 12:00:00", "user_input": "问题1", "ai_response": "回答1"}
+
+
+def test_read_range_inside_one_day_and_empty_ranges(writer):
+    fill(writer, [at(1, hour) for hour in range(8, 14)])
+
+    assert [r["time"][11:16] for r in writer.read_range(at(1, 9, 30), at(1, 11))] == ["10:00", "11:00"]
+    assert writer.read_range(at(1, 14), at(1, 20)) == []
+    assert writer.read_range(at(4, 0), at(5, 0)) == []
+
+
+def test_reads_only_members_overlapping_the_range(writer, tmp_path):
+    fill(writer, [at(1, hour) for hour in range(8, 14)])
+    log_path = tmp_path / "logs" / "chat_2024-05-01.jsonl.gz"
+    index_path = tmp_path / "logs" / "chat_2024-05-01.idx"
+    members = index_path.read_text(encoding="utf-8").splitlines()
+    assert len(members) == 3  # batch_size=2，每批一个gzip成员
+
+    # 破坏第一个成员后，不与其时间范围重叠的读取不受影响
+    data = bytearray(log_path.read_bytes())
+    data[10:20] = b"\x00" * 10
+    log_path.write_bytes(bytes(data))
+    assert [r["time"][11:13] for r in writer.read_range(at(1, 12), at(1, 13))] == ["12", "13"]
+
+
+def test_retention_removes_old_days(tmp_path):
+    log_dir = tmp_path / "logs"
+    old = ChatLogWriter(str(log_dir), retention_days=0, flush_interval=0.05)
+    fill(old, [datetime.datetime(2000, 1, 1, 9)])
+    assert os.path.exists(log_dir / "chat_2000-01-01.jsonl.gz")
+
+    writer = ChatLogWriter(str(log_dir), retention_days=30, flush_interval=0.05)
+    fill(writer, [datetime.datetime.now()])
+    assert not os.path.exists(log_dir / "chat_2000-01-01.jsonl.gz")
+    assert not os.path.exists(log_dir / "chat_2000-01-01.idx")
+    assert writer.count_log_files() == 1
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""file_lister：过滤、排序和游标分页"""
+
+import os
+
+import pytest
+
+from file_lister import EntryFilter, list_directory, parse_bool
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """a.txt b.log c.txt sub/{d.txt, e.txt} empty/，文件大小各不相同"""
+    for index, name in enumerate(["a.txt", "b.log", "c.txt", "sub/d.txt", "sub/e.txt"]):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * (index + 1) * 10)
+        os.utime(path, (1000 + index, 1000 + index))
+    (tmp_path / "empty").mkdir()
+    return str(tmp_path)
+
+
+def all_pages(directory, **kwargs):
+    paths = []
+    cursor = None
+    while True:
+        page = list_directory(directory, cursor=cursor, **kwargs)
+        paths.extend(item["path"] for item in page["entries"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return paths
+
+
+def test_name_pagination_visits_every_entry_once(tree):
+    expected = ["a.txt", "b.log", "c.txt", "empty", "sub", "sub/d.txt", "sub/e.txt"]
+    for limit in (1, 2, 3, 100):
+        assert all_pages(tree, recursive=True, limit=limit) == expected
+    assert all_pages(tree, recursive=True, limit=2, descending=True) == [
+        "sub", "sub/e.txt", "sub/d.txt", "empty", "c.txt", "b.log", "a.txt"]
+
+
+def test_size_pagination_with_cursor(tree):
+    pages = all_pages(tree, recursive=True, entry_filter=EntryFilter(file_type="file"),
+                      sort_by="size", descending=True, limit=2)
+    assert pages == ["sub/e.txt", "sub/d.txt", "c.txt", "b.log", "a.txt"]
+
+
+def test_filters(tree):
+    result = list_directory(tree, recursive=True, entry_filter=EntryFilter(pattern="*.txt", min_size=30))
+    assert [item["path"] for item in result["entries"]] == ["c.txt", "sub/d.txt", "sub/e.txt"]
+    result = list_directory(tree, entry_filter=EntryFilter(file_type="dir"))
+    assert [item["path"] for item in result["entries"]] == ["empty", "sub"]
+    result = list_directory(tree, recursive=True, entry_filter=EntryFilter(modified_before=1001))
+    assert [item["path"] for item in result["entries"]] == ["a.txt", "b.log"]
+
+
+def test_cursor_must_match_sort_order(tree):
+    page = list_directory(tree, limit=1)
+    with pytest.raises(ValueError):
+        list_directory(tree, limit=1, cursor=page["next_cursor"], sort_by="size")
+    with pytest.raises(ValueError):
+        list_directory(tree, cursor="不是游标")
+
+
+def test_parse_bool():
+    assert parse_bool("是") and parse_bool("True") and parse_bool(1)
+    assert not parse_bool("false") and not parse_bool("")
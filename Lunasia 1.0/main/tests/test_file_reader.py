@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""file_reader：编码检测、按行/结尾读取和 grep"""
+
+import file_reader
+from file_reader import FileReader, detect_encoding, read_text
+
+
+def write(path, text, encoding="utf-8"):
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+
+def test_detect_encoding():
+    assert detect_encoding("你好".encode("utf-8")) == "utf-8"
+    assert detect_encoding("你好".encode("gbk")) == "gbk"
+    assert detect_encoding(b"\xef\xbb\xbfabc") == "utf-8-sig"
+    assert detect_encoding(b"abc\x00def") is None
+
+
+def test_grep_regex_character_class_matches_whole_characters(tmp_path):
+    # 字节正则会把 [天晴] 拆成单个字节，与 “你好” 共用的首字节误匹配
+    path = write(tmp_path / "a.txt", "你好\n今天天晴\nabc\n")
+    result = read_text(path, mode="grep", pattern="[天晴]", regex=True)
+    assert result["text"] == "2: 今天天晴"
+    assert result["matches"] == 1
+
+
+def test_grep_gbk_trail_bytes_do_not_match_ascii(tmp_path):
+    # “表” 的GBK编码第二个字节是 0x5C（反斜杠）
+    path = write(tmp_path / "gbk.txt", "表\nxyz\n", encoding="gbk")
+    assert read_text(path, mode="grep", pattern="\\")["matches"] == 0
+    assert read_text(path, mode="grep", pattern="xyz")["text"] == "2: xyz"
+
+
+def test_grep_literal_ignore_case_with_context(tmp_path):
+    path = write(tmp_path / "log.txt", "one\ntwo\nERROR here\nthree\nfour\n")
+    result = read_text(path, mode="grep", pattern="error", ignore_case=True, context=1)
+    assert result["text"] == "2: two\n3: ERROR here\n4: three"
+
+
+def test_grep_max_matches_reports_truncation(tmp_path):
+    path = write(tmp_path / "many.txt", "".join(f"hit {i}\n" for i in range(10)))
+    result = read_text(path, mode="grep", pattern="hit", max_matches=3)
+    assert result["matches"] == 3
+    assert result["truncated"]
+
+
+def test_head_tail_and_lines(tmp_path):
+    path = write(tmp_path / "n.txt", "".join(f"line {i}\n" for i in range(1, 11)))
+    assert read_text(path, mode="head", lines=2)["text"] == "line 1\nline 2\n"
+    assert read_text(path, mode="tail", lines=2)["text"] == "line 9\nline 10\n"
+    assert read_text(path, mode="lines", start_line=4, end_line=5)["text"] == "line 4\nline 5\n"
+
+
+def test_tail_on_mmap_file_without_trailing_newline(tmp_path, monkeypatch):
+    monkeypatch.setattr(file_reader, "MMAP_THRESHOLD", 16)
+    path = write(tmp_path / "big.txt", "".join(f"行{i}\n" for i in range(1000)) + "最后一行")
+    with FileReader(path) as reader:
+        assert reader._mmap is not None
+        assert reader.read_tail(2, 1000)["text"] == "行999\n最后一行"
+
+
+def test_auto_mode_truncates_and_continues_from_next_offset(tmp_path):
+    path = write(tmp_path / "long.txt", "汉字" * 50)
+    first = read_text(path, max_chars=30)
+    assert first["truncated"] and len(first["text"]) == 30
+    rest = read_text(path, mode="bytes", offset=first["next_offset"], max_chars=1000)
+    assert first["text"] + rest["text"] == "汉字" * 50
+
+
+def test_binary_file(tmp_path):
+    path = tmp_path / "bin.dat"
+    path.write_bytes(b"\x00\x01\x02")
+    assert read_text(str(path))["binary"]
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""memory_compactor：主题汇总为日摘要、逐级汇总、归档主题移出清单"""
+
+import datetime
+import json
+import os
+import threading
+
+import pytest
+
+from memory_compactor import MemoryCompactor
+from memory_stats import MemoryStats
+from memory_store import ARCHIVE_PREFIX, MANIFEST_FILE, ShardedMemoryStore
+from memory_topic import MemoryTopic
+
+TODAY = datetime.date(2024, 6, 30)
+
+
+class Lake:
+    """MemoryLake 中归档任务用到的部分：写锁、索引发布、统计和分片存储"""
+
+    def __init__(self, shard_dir, topics):
+        self.store = ShardedMemoryStore(shard_dir)
+        self.memory_index = {"topics": topics, "conversations": {}, "contexts": {}}
+        self._write_lock = threading.RLock()
+        self.stats = MemoryStats()
+
+    def _publish_index(self, **changes):
+        memory_index = dict(self.memory_index)
+        memory_index.update(changes)
+        self.memory_index = memory_index
+
+    def save_memory(self):
+        self.store.save(self.memory_index)
+
+
+def topic(date, name, important=False):
+    return MemoryTopic(topic=name, date=date, timestamp="10:00:00", keywords=[name],
+                       conversation_count=2, is_important=important, details=f"指挥官: {name}")
+
+
+@pytest.fixture
+def lake(tmp_path):
+    topics = [
+        topic("2024-04-01", "天气"), topic("2024-04-01", "音乐"), topic("2024-04-02", "编程"),
+        topic("2024-04-03", "重要的事", important=True), topic("2024-06-20", "最近的事"),
+    ]
+    lake = Lake(str(tmp_path / "shards"), topics)
+    lake.save_memory()
+    return lake
+
+
+def test_old_topics_roll_up_into_daily_digests(lake):
+    created = MemoryCompactor(lake, horizon_days=30)._roll_up_topics(TODAY)
+
+    assert created == 2
+    assert [t.topic for t in lake.memory_index["topics"]] == ["重要的事", "最近的事"]
+    digests = lake.memory_index["digests"]
+    assert [(d["level"], d["period"], d["conversation_count"]) for d in digests] == [
+        ("daily", "2024-04-01", 4), ("daily", "2024-04-02", 2)]
+    assert digests[0]["subtopics"] == ["天气", "音乐"]
+    assert lake.memory_index["archived_count"] == 3
+
+    # 原始主题可以从日摘要下钻找回，详情仍可读取
+    sources = lake.store.get_archived("2024-04", digests[0]["source_ids"])
+    assert [t.topic for t in sources] == ["天气", "音乐"]
+    assert sources[0].details == "指挥官: 天气"
+
+
+def test_archived_topics_stay_out_of_the_manifest(lake, tmp_path):
+    MemoryCompactor(lake, horizon_days=30)._roll_up_topics(TODAY)
+    shard_dir = tmp_path / "shards"
+
+    manifest = json.loads((shard_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    assert "archive" not in manifest
+    assert [t["topic"] for t in manifest["topics"]] == ["重要的事", "最近的事"]
+    assert os.path.exists(shard_dir / f"{ARCHIVE_PREFIX}2024-04.json")
+
+    # 重新加载时只读取清单，归档分片在下钻时才加载
+    store = ShardedMemoryStore(str(shard_dir))
+    assert len(store.load()["topics"]) == 2
+    assert store._archives == {}
+    assert store.archived_shards() == ["2024-04"]
+    assert len(store.get_archived("2024-04")) == 3
+
+
+def test_legacy_archive_list_is_migrated(lake, tmp_path):
+    shard_dir = tmp_path / "shards"
+    manifest_path = shard_dir / MANIFEST_FILE
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["archive"] = [manifest["topics"].pop(0)]
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+
+    store = ShardedMemoryStore(str(shard_dir))
+    memory_index = store.load()
+    assert "archive" not in memory_index
+    assert memory_index["archived_count"] == 1
+    assert "archive" not in json.loads(manifest_path.read_text(encoding="utf-8"))
+    assert [t.topic for t in store.get_archived("2024-04")] == ["天气"]
+
+
+def test_daily_digests_roll_up_to_weekly_and_monthly(lake):
+    # 保留1天：日摘要超过4天汇总为周摘要，周摘要超过12天汇总为月摘要
+    compactor = MemoryCompactor(lake, horizon_days=1)
+    assert compactor.run(TODAY) == 3 + 2 + 1
+
+    digests = lake.memory_index["digests"]
+    top = [d for d in digests if not d.get("rolled_into")]
+    assert [(d["level"], d["period"]) for d in top] == [("weekly", "2024-W25"), ("monthly", "2024-04")]
+    april_weekly = next(d for d in digests if d["period"] == "2024-W14")
+    assert april_weekly["rolled_into"] == top[1]["id"]
+    april_daily = [d for d in digests if d["level"] == "daily" and d["period"].startswith("2024-04")]
+    assert all(d["rolled_into"] == april_weekly["id"] for d in april_daily)
+    assert [t.topic for t in lake.memory_index["topics"]] == ["重要的事"]
+    # 已经归档过的内容不会重复汇总
+    assert compactor.run(TODAY) == 0
+
+
+def test_new_old_topics_merge_into_the_existing_digest(lake):
+    compactor = MemoryCompactor(lake, horizon_days=30)
+    compactor._roll_up_topics(TODAY)
+    lake._publish_index(topics=lake.memory_index["topics"] + [topic("2024-04-01", "补充")])
+    compactor._roll_up_topics(TODAY)
+
+    daily = [d for d in lake.memory_index["digests"] if d["period"] == "2024-04-01"]
+    assert len(daily) == 1
+    assert daily[0]["subtopics"] == ["天气", "音乐", "补充"]
+    assert len(lake.store.get_archived("2024-04", daily[0]["source_ids"])) == 3
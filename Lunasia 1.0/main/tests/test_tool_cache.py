@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""tool_cache：有效期、失效标记、LRU淘汰和失败结果"""
+
+import tool_cache
+from tool_cache import CachePolicy, ToolResultCache, is_json_object, looks_successful
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class Counter:
+    """记录被调用的次数，每次返回新的结果"""
+
+    def __init__(self, result="结果"):
+        self.calls = 0
+        self.result = result
+
+    def __call__(self):
+        self.calls += 1
+        return f"{self.result}{self.calls}" if isinstance(self.result, str) else self.result
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tool_cache.time, "monotonic", clock)
+    cache = ToolResultCache()
+    policy = CachePolicy(10)
+    run = Counter()
+
+    assert cache.call("tool", policy, {"a": 1}, run) == "结果1"
+    clock.now += 9
+    assert cache.call("tool", policy, {"a": 1}, run) == "结果1"
+    clock.now += 2
+    assert cache.call("tool", policy, {"a": 1}, run) == "结果2"
+    assert cache.stats()["tools"]["tool"]["hits"] == 1
+
+
+def test_different_parameters_are_separate_entries():
+    cache = ToolResultCache()
+    run = Counter()
+    cache.call("tool", CachePolicy(60), {"city": "北京"}, run)
+    cache.call("tool", CachePolicy(60), {"city": "上海"}, run)
+    assert run.calls == 2
+
+
+def test_lru_eviction():
+    cache = ToolResultCache(max_entries=2)
+    policy = CachePolicy(60)
+    runs = {name: Counter(name) for name in "abc"}
+    cache.call("tool", policy, {"k": "a"}, runs["a"])
+    cache.call("tool", policy, {"k": "b"}, runs["b"])
+    cache.call("tool", policy, {"k": "a"}, runs["a"])  # a 变为最近使用
+    cache.call("tool", policy, {"k": "c"}, runs["c"])  # 淘汰 b
+
+    cache.call("tool", policy, {"k": "a"}, runs["a"])
+    cache.call("tool", policy, {"k": "b"}, runs["b"])
+    assert runs["a"].calls == 1
+    assert runs["b"].calls == 2
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["tools"]["tool"]["evictions"] == 2
+
+
+def test_stamp_change_invalidates():
+    stamp = {"value": 1}
+    policy = CachePolicy(60, stamp=lambda kwargs: stamp["value"])
+    cache = ToolResultCache()
+    run = Counter()
+    cache.call("read", policy, {}, run)
+    cache.call("read", policy, {}, run)
+    stamp["value"] = 2
+    cache.call("read", policy, {}, run)
+    assert run.calls == 2
+
+
+def test_failures_and_uncacheable_keys_are_not_cached():
+    cache = ToolResultCache()
+    failing = Counter("调用失败: 网络错误")
+    cache.call("tool", CachePolicy(60), {}, failing)
+    cache.call("tool", CachePolicy(60), {}, failing)
+    assert failing.calls == 2
+
+    run = Counter()
+    skip = CachePolicy(60, key=lambda kwargs: None)
+    cache.call("tool", skip, {}, run)
+    cache.call("tool", skip, {}, run)
+    assert run.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate():
+    cache = ToolResultCache()
+    run = Counter()
+    cache.call("tool", CachePolicy(60), {}, run)
+    cache.invalidate("tool")
+    cache.call("tool", CachePolicy(60), {}, run)
+    assert run.calls == 2
+
+
+def test_result_predicates():
+    assert looks_successful("北京 晴 25度")
+    assert not looks_successful("和风天气API密钥未配置，无法获取天气信息")
+    assert not looks_successful(None)
+    assert is_json_object('{"city": "北京"}')
+    assert not is_json_object("获取天气失败")
+    assert not is_json_object("[1, 2]")
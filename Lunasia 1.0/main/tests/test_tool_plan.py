@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""tool_plan：依赖顺序、参数占位符、部分失败和并发执行"""
+
+import threading
+import time
+
+import pytest
+
+from tool_plan import run_plan
+
+
+class FakeServer:
+    """只提供 call_tool 的工具服务，记录调用顺序和同时执行的数量"""
+
+    def __init__(self, tools):
+        self.tools = tools
+        self.calls = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def call_tool(self, tool_name, **kwargs):
+        with self._lock:
+            self.calls.append((tool_name, kwargs))
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return self.tools[tool_name](**kwargs)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def weather(city):
+    time.sleep(0.05)
+    return f"{city}晴"
+
+
+def test_dependencies_run_after_their_sources_and_fill_placeholders():
+    server = FakeServer({"weather": weather, "note": lambda content: f"已保存: {content}"})
+    steps = [
+        {"id": "note", "tool": "note", "depends_on": ["bj", "sh"], "parameters": {"content": "{{bj}} / {{ sh }}"}},
+        {"id": "bj", "tool": "weather", "parameters": {"city": "北京"}},
+        {"id": "sh", "tool": "weather", "parameters": {"city": "上海"}},
+    ]
+    results = list(run_plan(server, steps))
+
+    assert [item["id"] for item in results][-1] == "note"
+    assert results[-1]["result"] == "已保存: 北京晴 / 上海晴"
+    assert all(item["ok"] for item in results)
+
+
+def test_independent_steps_run_concurrently_within_the_cap():
+    server = FakeServer({"weather": weather})
+    steps = [{"id": i, "tool": "weather", "parameters": {"city": str(i)}} for i in range(6)]
+    start = time.perf_counter()
+    results = list(run_plan(server, steps, max_workers=3))
+    assert len(results) == 6
+    assert server.peak == 3
+    assert time.perf_counter() - start < 0.05 * 6
+
+
+def test_failure_skips_only_dependents():
+    def boom():
+        raise RuntimeError("坏了")
+
+    server = FakeServer({"weather": weather, "boom": boom, "error_text": lambda: "调用失败: 超时",
+                         "note": lambda content: content})
+    steps = [
+        {"id": "x", "tool": "boom"},
+        {"id": "after_x", "tool": "note", "depends_on": ["x"], "parameters": {"content": "{{x}}"}},
+        {"id": "e", "tool": "error_text"},
+        {"id": "after_e", "tool": "note", "depends_on": ["after_x", "e"], "parameters": {"content": "-"}},
+        {"id": "ok", "tool": "weather", "parameters": {"city": "北京"}},
+    ]
+    results = {item["id"]: item for item in run_plan(server, steps)}
+
+    assert not results["x"]["ok"] and "坏了" in results["x"]["result"]
+    assert not results["e"]["ok"]
+    assert results["after_x"]["result"].startswith("已跳过")
+    assert results["after_e"]["result"].startswith("已跳过")
+    assert results["ok"]["ok"] and results["ok"]["result"] == "北京晴"
+    assert [name for name, _ in server.calls].count("note") == 0
+
+
+def test_invalid_plans_are_rejected():
+    server = FakeServer({})
+    with pytest.raises(ValueError):
+        list(run_plan(server, [{"id": 1, "tool": "t", "depends_on": [2]}, {"id": 2, "tool": "t", "depends_on": [1]}]))
+    with pytest.raises(ValueError):
+        list(run_plan(server, [{"id": 1, "tool": "t", "depends_on": ["missing"]}]))
+    with pytest.raises(ValueError):
+        list(run_plan(server, [{"id": 1, "tool": "t"}, {"id": 1, "tool": "t"}]))
+    assert server.calls == []
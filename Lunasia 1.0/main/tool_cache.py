@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+工具结果缓存
+按工具声明缓存策略：有效期（TTL）、缓存键、失效标记（例如文件的修改时间），
+调用参数相同且未过期、失效标记未变化时直接返回上次的结果；整体按LRU限制条目数，并统计每个工具的命中率
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+def file_stamp(path: Optional[str]):
+    """文件/目录的失效标记：(修改时间, 大小)，不存在时为None"""
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+FAILURE_MARKERS = ("失败", "不存在", "错误", "超时", "无法", "未配置")
+
+
+def looks_successful(result: Any) -> bool:
+    """默认只缓存成功的结果：工具出错时返回的是开头带有“失败/无法/未配置”等说明的文字"""
+    if not isinstance(result, str):
+        return result is not None
+    head = result[:40]
+    return not any(marker in head for marker in FAILURE_MARKERS)
+
+
+def is_json_object(result: Any) -> bool:
+    """结果是JSON对象（返回JSON表示成功、返回文字说明表示失败的工具使用）"""
+    if not isinstance(result, str) or not result.lstrip().startswith("{"):
+        return False
+    try:
+        return isinstance(json.loads(result), dict)
+    except ValueError:
+        return False
+
+
+class CachePolicy:
+    """单个工具的缓存策略
+
+    - ttl: 有效期（秒）
+    - key: 参数 -> 缓存键（返回None表示本次调用不缓存），默认使用全部参数
+    - stamp: 参数 -> 失效标记，与缓存时不同则视为失效（例如文件修改时间）
+    - cacheable: 结果 -> 是否缓存
+    """
+
+    def __init__(self, ttl: float, key: Optional[Callable[[Dict], Any]] = None,
+                 stamp: Optional[Callable[[Dict], Any]] = None,
+                 cacheable: Callable[[Any], bool] = looks_successful):
+        self.ttl = ttl
+        self.key = key or (lambda kwargs: tuple(sorted((name, repr(value)) for name, value in kwargs.items())))
+        self.stamp = stamp
+        self.cacheable = cacheable
+
+
+class ToolResultCache:
+    """所有工具共用的LRU结果缓存（线程安全）"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()  # (工具名, 键) -> (过期时间, 失效标记, 结果)
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _count(self, tool_name: str, field: str):
+        counters = self._counters.setdefault(tool_name, {"hits": 0, "misses": 0, "evictions": 0})
+        counters[field] += 1
+
+    def call(self, tool_name: str, policy: CachePolicy, kwargs: Dict, run: Callable[[], Any]):
+        """按策略返回缓存结果，未命中时执行 run() 并缓存"""
+        key = policy.key(kwargs)
+        if key is None:
+            return run()
+        cache_key = (tool_name, key)
+        stamp = policy.stamp(kwargs) if policy.stamp else None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] > now and entry[1] == stamp:
+                self._entries.move_to_end(cache_key)
+                self._count(tool_name, "hits")
+                return entry[2]
+            self._count(tool_name, "misses")
+
+        result = run()
+        if policy.cacheable(result):
+            with self._lock:
+                self._entries[cache_key] = (now + policy.ttl, stamp, result)
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    (evicted_tool, _), _ = self._entries.popitem(last=False)
+                    self._count(evicted_tool, "evictions")
+        return result
+
+    def invalidate(self, tool_name: Optional[str] = None):
+        """清除某个工具（或全部）的缓存"""
+        with self._lock:
+            if tool_name is None:
+                self._entries.clear()
+                return
+            for cache_key in [cache_key for cache_key in self._entries if cache_key[0] == tool_name]:
+                del self._entries[cache_key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tools = {}
+            for tool_name, counters in self._counters.items():
+                lookups = counters["hits"] + counters["misses"]
+                tools[tool_name] = dict(counters, hit_rate=round(counters["hits"] / lookups, 3) if lookups else 0.0)
+            hits = sum(counters["hits"] for counters in self._counters.values())
+            misses = sum(counters["misses"] for counters in self._counters.values())
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "tools": tools
+            }
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+自定义工具加载
+工具源码只编译一次：编译结果按 (源码摘要, Python版本) 以marshal格式缓存在磁盘上，同一进程内的多个服务实例共用；
+执行工具模块代码时，尚未导入的第三方模块以延迟模块代替，第一次使用时才真正导入
+"""
+
+import builtins
+import hashlib
+import importlib
+import importlib.util
+import marshal
+import os
+import sys
+import threading
+import types
+
+CODE_CACHE_DIR = "custom_tools_cache"
+
+_compiled = {}  # 缓存键 -> 代码对象
+_compiled_lock = threading.Lock()
+
+
+def _cache_key(source: str) -> str:
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    return f"{digest}.{sys.implementation.cache_tag}"
+
+
+def compile_tool_source(tool_name: str, source: str) -> types.CodeType:
+    """编译工具源码（优先使用内存和磁盘缓存）"""
+    key = _cache_key(source)
+    with _compiled_lock:
+        code = _compiled.get(key)
+    if code is not None:
+        return code
+
+    path = os.path.join(CODE_CACHE_DIR, key + ".bin")
+    try:
+        with open(path, "rb") as f:
+            # 文件头是解释器的字节码版本号，版本不一致的缓存直接忽略
+            if f.read(len(importlib.util.MAGIC_NUMBER)) == importlib.util.MAGIC_NUMBER:
+                code = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        code = None
+
+    if not isinstance(code, types.CodeType):
+        code = compile(source, f"<custom_tool:{tool_name}>", "exec")
+        try:
+            os.makedirs(CODE_CACHE_DIR, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                f.write(marshal.dumps(code))
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ 保存工具编译缓存失败: {str(e)}")
+
+    with _compiled_lock:
+        _compiled[key] = code
+    return code
+
+
+def _is_submodule(spec, name: str) -> bool:
+    """不导入包的情况下判断 name 是否为包中的子模块"""
+    for location in spec.submodule_search_locations or ():
+        if os.path.isdir(os.path.join(location, name)) or os.path.exists(os.path.join(location, name + ".py")):
+            return True
+        try:
+            if any(entry.startswith(name + ".") and entry.endswith((".so", ".pyd")) for entry in os.listdir(location)):
+                return True
+        except OSError:
+            continue
+    return False
+
+
+class LazyModule(types.ModuleType):
+    """延迟模块：第一次访问属性时才导入真正的模块"""
+
+    def __init__(self, name: str, import_name: str = None):
+        super().__init__(name)
+        # import a.b 绑定的是顶层模块a，但需要导入的是a.b
+        self.__dict__["_lazy_import_name"] = import_name or name
+        self.__dict__["_lazy_target"] = None
+
+    def _resolve(self):
+        target = self.__dict__["_lazy_target"]
+        if target is None:
+            importlib.import_module(self.__dict__["_lazy_import_name"])
+            target = sys.modules[self.__name__]
+            self.__dict__["_lazy_target"] = target
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._resolve(), attr, value)
+
+    def __dir__(self):
+        return dir(self._resolve())
+
+
+class _FromImport:
+    """from 包 import 名称：子模块返回延迟模块，其他名称（类、函数）立即导入包后取值"""
+
+    def __init__(self, name: str, spec):
+        self._name = name
+        self._spec = spec
+
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        if _is_submodule(self._spec, attr):
+            return LazyModule(f"{self._name}.{attr}")
+        return getattr(importlib.import_module(self._name), attr)
+
+
+def _lazy_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """工具模块代码执行期间使用的 __import__"""
+    if level or name in sys.modules or (fromlist and "*" in fromlist):
+        return builtins.__import__(name, globals, locals, fromlist, level)
+    top = name.partition(".")[0]
+    if top in sys.modules:
+        return builtins.__import__(name, globals, locals, fromlist, level)
+    spec = importlib.util.find_spec(top)
+    if spec is None:
+        # 保持未安装模块的 ImportError，工具代码中的 try/except 可以照常检测可用性
+        raise ModuleNotFoundError(f"No module named '{top}'", name=top)
+    if fromlist:
+        if name != top:
+            return builtins.__import__(name, globals, locals, fromlist, level)
+        return _FromImport(name, spec)
+    return LazyModule(top, name)
+
+
+def exec_tool_module(code: types.CodeType) -> dict:
+    """执行工具模块代码，返回其命名空间"""
+    lazy_builtins = dict(vars(builtins))
+    lazy_builtins["__import__"] = _lazy_import
+    namespace = {"__builtins__": lazy_builtins}
+    try:
+        exec(code, namespace)
+    finally:
+        # 工具代码中定义的函数（包括类的方法、闭包）在创建时已经绑定了这份内置名称表，
+        # 替换 namespace["__builtins__"] 对它们无效；直接改回表中的 __import__，工具函数运行时的导入恢复为普通导入
+        lazy_builtins["__import__"] = builtins.__import__
+    return namespace
+
+
+def dispatch_custom_tool(tool_name: str, namespace: dict, kwargs: dict):
+    """根据工具名称和参数判断调用工具模块中的哪个函数（进程内和沙箱进程共用）"""
+    if tool_name == "智能文件分析":
+        # 文件分析工具
+        if 'file_path' in kwargs:
+            if 'analyze_file_content' in namespace:
+                # 直接调用analyze_file_content返回JSON格式
+                return namespace['analyze_file_content'](kwargs['file_path'])
+            elif 'upload_and_analyze_file' in namespace:
+                return namespace['upload_and_analyze_file'](kwargs['file_path'])
+            else:
+                return "文件分析功能未找到"
+        else:
+            return "请提供file_path参数"
+    elif 'location1' in kwargs and 'location2' in kwargs:
+        # 调用距离计算函数
+        if 'calculate_distance' in namespace:
+            return namespace['calculate_distance'](kwargs['location1'], kwargs['location2'])
+    elif 'keyword' in kwargs:
+        # 调用兴趣点搜索函数
+        if 'search_poi' in namespace:
+            city = kwargs.get('city', '北京')
+            return namespace['search_poi'](kwargs['keyword'], city)
+    elif 'city' in kwargs and 'keyword' not in kwargs:
+        # 调用天气预报函数
+        if 'get_weather_forecast' in namespace:
+            return namespace['get_weather_forecast'](kwargs['city'])
+    else:
+        return f"参数错误，请提供正确的参数。可用功能：距离计算(location1, location2)、兴趣点搜索(keyword, city)、天气预报(city)、文件分析(file_path)"
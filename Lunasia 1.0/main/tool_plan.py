@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+多工具执行计划
+一组工具调用按声明的依赖关系组成有向无环图：没有未完成依赖的调用在线程池中并发执行（有并发上限），
+结果按完成顺序逐个产出；某一步失败时只跳过依赖它的步骤，其余步骤照常执行
+
+步骤格式:
+    {"id": "weather_bj", "tool": "get_weather_info", "parameters": {"city": "北京"}}
+    {"id": "summary", "tool": "write_file", "depends_on": ["weather_bj"],
+     "parameters": {"file_path": "w.txt", "content": "{{weather_bj}}"}}
+参数中的 {{步骤id}} 会替换为该依赖步骤的结果文字
+"""
+
+import concurrent.futures
+import re
+import time
+from typing import Any, Dict, Iterator, List
+
+from tool_cache import looks_successful
+
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([^{}\s]+)\s*\}\}")
+
+
+def _normalize(steps: List[Dict]) -> Dict[Any, Dict]:
+    """补全步骤id并检查依赖（未知依赖、重复id、循环依赖时抛出ValueError）"""
+    plan = {}
+    for index, step in enumerate(steps):
+        step_id = step.get("id", index)
+        if step_id in plan:
+            raise ValueError(f"步骤id重复: {step_id}")
+        plan[step_id] = {
+            "id": step_id,
+            "tool": step["tool"],
+            "parameters": dict(step.get("parameters") or {}),
+            "depends_on": list(step.get("depends_on") or ())
+        }
+    for step in plan.values():
+        for dependency in step["depends_on"]:
+            if dependency not in plan:
+                raise ValueError(f"步骤 {step['id']} 依赖的步骤不存在: {dependency}")
+
+    # 拓扑排序检查循环依赖
+    remaining = {step_id: set(step["depends_on"]) for step_id, step in plan.items()}
+    while remaining:
+        ready = [step_id for step_id, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError(f"步骤之间存在循环依赖: {', '.join(map(str, remaining))}")
+        for step_id in ready:
+            del remaining[step_id]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    return plan
+
+
+def _fill_parameters(parameters: Dict, results: Dict) -> Dict:
+    def fill(value):
+        if isinstance(value, str):
+            return PLACEHOLDER_PATTERN.sub(
+                lambda match: str(results.get(match.group(1), match.group(0))), value)
+        return value
+    return {name: fill(value) for name, value in parameters.items()}
+
+
+def run_plan(server, steps: List[Dict], max_workers: int = 4) -> Iterator[Dict]:
+    """执行计划，按完成顺序产出 {"id", "tool", "ok", "result", "elapsed"}
+
+    server 为 LocalMCPServer（使用其 call_tool，因此会经过结果缓存和沙箱）
+    """
+    plan = _normalize(steps)
+    results = {}  # 成功步骤的结果（以字符串id索引，供参数占位符使用）
+    finished = {}  # 步骤id -> 是否成功
+    running = {}
+
+    def call(step):
+        start = time.perf_counter()
+        result = server.call_tool(step["tool"], **_fill_parameters(step["parameters"], results))
+        return result, time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ToolPlan") as executor:
+        while len(finished) < len(plan):
+            # 提交所有依赖已完成的步骤；依赖失败的步骤直接跳过
+            progressed = True
+            while progressed:
+                progressed = False
+                for step_id, step in plan.items():
+                    if step_id in finished or step_id in running:
+                        continue
+                    if not all(dependency in finished for dependency in step["depends_on"]):
+                        continue
+                    failed = [dependency for dependency in step["depends_on"] if not finished[dependency]]
+                    if failed:
+                        finished[step_id] = False
+                        progressed = True
+                        yield {"id": step_id, "tool": step["tool"], "ok": False, "elapsed": 0.0,
+                               "result": f"已跳过: 依赖的步骤 {', '.join(map(str, failed))} 失败"}
+                        continue
+                    running[step_id] = executor.submit(call, step)
+
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(running.values(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for step_id in [step_id for step_id, future in running.items() if future in done]:
+                future = running.pop(step_id)
+                try:
+                    result, elapsed = future.result()
+                    ok = looks_successful(result)
+                except Exception as e:
+                    result, elapsed, ok = f"调用工具失败: {str(e)}", 0.0, False
+                finished[step_id] = ok
+                if ok:
+                    results[str(step_id)] = result
+                yield {"id": step_id, "tool": plan[step_id]["tool"], "ok": ok,
+                       "result": result, "elapsed": round(elapsed, 3)}
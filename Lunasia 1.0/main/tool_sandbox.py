@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+自定义工具沙箱
+耗时的自定义工具（像素级分析、PDF解析、OCR）在常驻进程池中运行，不占用主进程的GIL，界面不会卡住
+- 超时：超时后只终止执行该调用的进程，之后按需新建
+- 内存上限：工作进程内通过 RLIMIT_AS 限制（仅POSIX，Windows上不限制）
+- 结果大小上限：超长结果在工作进程内截断后再传回
+- 崩溃隔离：每次调用独占一个工作进程，进程异常退出只影响本次调用
+- 进程回收：每个进程累计调用一定次数后更换，释放工具代码泄漏的内存
+"""
+
+import concurrent.futures
+import hashlib
+import multiprocessing
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+
+from tool_loader import compile_tool_source, dispatch_custom_tool, exec_tool_module
+
+# ---- 工作进程 ----
+
+_worker_namespaces = {}  # 源码摘要 -> 工具模块命名空间（工作进程内复用）
+_worker_memory_limit = None
+
+
+def _apply_memory_limit(memory_limit_mb: Optional[int]):
+    global _worker_memory_limit
+    if not memory_limit_mb or memory_limit_mb == _worker_memory_limit:
+        return
+    try:
+        import resource
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = memory_limit_mb * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        _worker_memory_limit = memory_limit_mb
+    except (ImportError, ValueError, OSError):
+        # Windows没有resource模块，不限制内存
+        _worker_memory_limit = memory_limit_mb
+
+
+def _run_tool(tool_name: str, source: str, kwargs: Dict, memory_limit_mb: Optional[int], max_result_chars: int):
+    """在工作进程中执行自定义工具"""
+    _apply_memory_limit(memory_limit_mb)
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    namespace = _worker_namespaces.get(key)
+    if namespace is None:
+        namespace = exec_tool_module(compile_tool_source(tool_name, source))
+        _worker_namespaces[key] = namespace
+    result = dispatch_custom_tool(tool_name, namespace, kwargs)
+    if isinstance(result, str) and max_result_chars and len(result) > max_result_chars:
+        result = result[:max_result_chars] + f"\n...（结果过长，已截断，原长度 {len(result)} 字符）"
+    return result
+
+
+def _noop():
+    return True
+
+
+# ---- 主进程 ----
+
+class _Worker:
+    """一个常驻工作进程（单进程的进程池），超时或崩溃时只影响在它上面执行的那一次调用"""
+
+    def __init__(self):
+        # 使用spawn启动：主进程有界面和后台线程，fork出的子进程不安全
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.calls = 0
+
+    def close(self, kill: bool = False):
+        """关闭进程；kill为True时立即终止（超时的调用无法单独取消）"""
+        if kill:
+            for process in list((getattr(self.executor, "_processes", None) or {}).values()):
+                try:
+                    process.kill()
+                except Exception:
+                    pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ToolSandbox:
+    """进程池工具执行器
+
+    每个工作进程各自是一个单进程的进程池，每次调用独占一个进程：
+    某个调用超时被终止或进程崩溃时，只更换这一个进程，同时在其他进程上执行的调用不受影响
+    """
+
+    def __init__(self, max_workers: int = 2, recycle_after: int = 50, timeout: float = 120.0,
+                 memory_limit_mb: int = 1024, max_result_chars: int = 200000):
+        self.max_workers = max_workers
+        self.recycle_after = recycle_after
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_result_chars = max_result_chars
+        self._workers = set()  # 当前所有工作进程（空闲 + 正在执行）
+        self._idle = []
+        self._condition = threading.Condition()
+
+    def _acquire(self, timeout: float) -> Optional[_Worker]:
+        """取一个空闲的工作进程，没有时在数量上限内新建，已达上限时等待；超时返回None"""
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._idle or len(self._workers) < self.max_workers, timeout=timeout):
+                return None
+            if self._idle:
+                worker = self._idle.pop()
+            else:
+                worker = _Worker()
+                self._workers.add(worker)
+            worker.calls += 1
+            return worker
+
+    def _release(self, worker: _Worker, discard: bool = False, kill: bool = False):
+        """归还工作进程；discard为True（超时、崩溃）或达到调用次数上限时更换"""
+        with self._condition:
+            retired = worker not in self._workers  # 沙箱已关闭
+            recycle = bool(self.recycle_after) and worker.calls >= self.recycle_after
+            if discard or recycle or retired:
+                self._workers.discard(worker)
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+        if discard or retired:
+            worker.close(kill=kill)
+        elif recycle:
+            # 释放工具代码泄漏的内存
+            print("🔄 工具沙箱进程已达到调用次数上限，更换新进程")
+            worker.close()
+
+    def warm_up(self):
+        """提前启动工作进程（不等待；已有工作进程时不重复预热）"""
+        try:
+            with self._condition:
+                if self._workers:
+                    return
+                workers = [_Worker() for _ in range(self.max_workers)]
+                self._workers.update(workers)
+                self._idle.extend(workers)
+            for worker in workers:
+                worker.executor.submit(_noop)
+        except Exception as e:
+            print(f"⚠️ 工具沙箱预热失败: {str(e)}")
+
+    def call(self, tool_name: str, source: str, kwargs: Dict, timeout: Optional[float] = None,
+             memory_limit_mb: Optional[int] = None, max_result_chars: Optional[int] = None):
+        """在沙箱进程中调用工具，失败时返回错误说明"""
+        timeout = timeout or self.timeout
+        worker = self._acquire(timeout)
+        if worker is None:
+            return f"调用工具失败: 沙箱进程全部繁忙，{tool_name} 等待超过 {timeout} 秒"
+        try:
+            future = worker.executor.submit(_run_tool, tool_name, source, kwargs,
+                                            memory_limit_mb or self.memory_limit_mb,
+                                            max_result_chars or self.max_result_chars)
+            result = future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            print(f"⚠️ 工具 {tool_name} 执行超过 {timeout} 秒，终止执行进程")
+            self._release(worker, discard=True, kill=True)
+            return f"调用工具失败: {tool_name} 执行超时（{timeout}秒）"
+        except BrokenProcessPool:
+            print(f"⚠️ 工具 {tool_name} 的执行进程异常退出，更换新进程")
+            self._release(worker, discard=True)
+            return f"调用工具失败: {tool_name} 的执行进程异常退出"
+        except MemoryError:
+            self._release(worker)
+            return f"调用工具失败: {tool_name} 超出内存上限（{memory_limit_mb or self.memory_limit_mb}MB）"
+        except Exception as e:
+            self._release(worker)
+            return f"调用工具失败: {str(e)}"
+        self._release(worker)
+        return result
+
+    def shutdown(self):
+        with self._condition:
+            workers = list(self._idle)
+            self._workers.clear()
+            self._idle.clear()
+            self._condition.notify_all()
+        # 正在执行的调用结束后由 _release 关闭其进程
+        for worker in workers:
+            worker.close()
+
+
+_default_sandbox = None
+_default_sandbox_lock = threading.Lock()
+
+
+def get_default_sandbox() -> ToolSandbox:
+    """本进程共用的工具沙箱（多个MCP服务实例共用一个进程池）"""
+    global _default_sandbox
+    with _default_sandbox_lock:
+        if _default_sandbox is None:
+            _default_sandbox = ToolSandbox()
+        return _default_sandbox
@@ -7,18 +7,22 @@ UI对话框模块
 import os
 import json
 import datetime
+import threading
+import time
 from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTextEdit, QLineEdit,
-                             QPushButton, QLabel, QComboBox, QSplitter, QListWidget,
+                             QPushButton, QLabel, QComboBox, QSplitter, QListWidget, QListView,
                              QGroupBox, QFormLayout, QMessageBox, QInputDialog, 
                              QFileDialog, QProgressBar, QListWidgetItem, QTabWidget,
-                             QSlider, QCheckBox)
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QIcon
+                             QSlider, QCheckBox, QAbstractItemView)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QIcon, QColor, QTextCursor
 
 from config import save_config
 from utils import scan_windows_apps
 from memory_lake import MemoryLake
+from memory_topic_model import MemoryTopicListModel, MemoryTopicFilterProxy, MemoryTopicFilter
 from mcp_server import LocalMCPServer
+from tool_cache import looks_successful
 
 class SettingsDialog(QDialog):
     """设置对话框"""
@@ -632,26 +636,33 @@ class MemoryLakeDialog(QDialog):
         # 添加一些间距，避免标题被遮挡
         topics_layout.addSpacing(10)
         
-        # 主题列表
-        self.topics_list = QListWidget()
+        # 主题列表：模型只持有主题引用，显示文字在滚动到可见时才生成；过滤在后台线程防抖执行
+        self.topics_model = MemoryTopicListModel(self.memory_lake, self)
+        self.topics_proxy = MemoryTopicFilterProxy(self)
+        self.topics_proxy.setSourceModel(self.topics_model)
+        self.topics_filter = MemoryTopicFilter(self.memory_lake, self.topics_proxy, parent=self)
+        
+        self.topics_list = QListView()
+        self.topics_list.setModel(self.topics_proxy)
+        self.topics_list.setUniformItemSizes(True)
         self.topics_list.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #313244;
                 color: #cdd6f4;
                 border-radius: 5px;
                 padding: 5px;
                 font-size: 12px;
             }
-            QListWidget::item {
+            QListView::item {
                 padding: 5px;
                 border-bottom: 1px solid #45475a;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #89b4fa;
                 color: #1e1e1e;
             }
         """)
-        self.topics_list.itemClicked.connect(self.show_topic_details)
+        self.topics_list.clicked.connect(self.show_topic_details)
         topics_layout.addWidget(self.topics_list)
         
         topics_group.setLayout(topics_layout)
@@ -742,48 +753,42 @@ class MemoryLakeDialog(QDialog):
     
     def refresh_data(self):
         """刷新记忆数据"""
-        stats = self.memory_lake.get_memory_stats()
+        stats = self.memory_lake.get_stats_snapshot()
         self.stats_label.setText(
             f"总主题数: {stats['total_topics']} | "
             f"重点记忆: {stats['important_topics']} | "
             f"日志文件数: {stats['total_log_files']} | "
-            f"记忆文件大小: {stats['memory_file_size']} bytes"
+            f"记忆文件大小: {stats['memory_file_size']} bytes | "
+            f"本地/AI总结: {stats.get('local_summaries', 0)}/{stats.get('ai_summaries', 0)}"
         )
         
         self.load_topics()
     
     def load_topics(self):
-        """加载主题列表"""
-        self.topics_list.clear()
+        """加载主题列表（最新的主题在前，归档摘要排在普通主题之后）"""
         try:
-            topics = self.memory_lake.memory_index.get("topics", [])
-            
-            for topic in reversed(topics):  # 最新的在前面
-                if isinstance(topic, dict) and 'date' in topic and 'timestamp' in topic and 'topic' in topic:
-                    # 添加重点记忆标识
-                    important_icon = "⭐ " if topic.get("is_important", False) else ""
-                    item_text = f"{important_icon}[{topic['date']} {topic['timestamp']}] {topic['topic']}"
-                    item = QListWidgetItem(item_text)
-                    item.setData(Qt.UserRole, topic)
-                    self.topics_list.addItem(item)
+            self.topics_model.reload()
+            self.topics_filter.refresh()
         except Exception as e:
             print(f"加载主题列表失败: {str(e)}")
     
     def filter_topics(self):
-        """过滤主题"""
-        search_text = self.search_edit.text().lower()
-        for i in range(self.topics_list.count()):
-            item = self.topics_list.item(i)
-            item.setHidden(search_text not in item.text().lower())
+        """过滤主题（防抖后在后台线程检索）"""
+        self.topics_filter.set_text(self.search_edit.text())
     
-    def show_topic_details(self, item):
+    def show_topic_details(self, index):
         """显示主题详情"""
-        topic_data = item.data(Qt.UserRole)
+        topic_data = index.data(Qt.UserRole)
         if not topic_data:
             return
         
+        # 归档摘要：显示汇总信息和原始主题，不支持重点记忆标记
+        if topic_data.get("level"):
+            self.show_digest_details(topic_data)
+            return
+        
         # 显示重点记忆标签
-        is_important = topic_data.get("is_important", False)
+        is_important = topic_data.is_important
         self.important_label.setVisible(is_important)
         self.important_btn.setVisible(True)
         
@@ -818,46 +823,59 @@ class MemoryLakeDialog(QDialog):
                 }
             """)
         
-        # 保存当前选中的主题索引
-        topics = self.memory_lake.memory_index.get("topics", [])
-        # 由于UI显示是倒序（最新在前），但存储是正序，需要转换索引
-        reversed_topics = list(reversed(topics))
-        ui_index = reversed_topics.index(topic_data)
-        self.current_topic_index = len(topics) - 1 - ui_index
+        # 保存当前选中的主题记录（后台整理会移动或归档主题，不保存列表位置）
+        self.current_topic = topic_data
         
-        details = f"主题: {topic_data['topic']}\n"
-        details += f"日期: {topic_data['date']}\n"
-        details += f"时间: {topic_data['timestamp']}\n"
+        details = f"主题: {topic_data.topic}\n"
+        details += f"日期: {topic_data.date}\n"
+        details += f"时间: {topic_data.timestamp}\n"
         details += f"日志文件: {topic_data.get('log_file', 'N/A')}\n"
         
         # 添加具体聊天记录
-        conversation_details = topic_data.get('conversation_details', '')
+        conversation_details = self.memory_lake.get_topic_details(topic_data)
         if conversation_details:
             details += f"\n具体聊天记录:\n{conversation_details}"
         
         self.details_text.setText(details)
 
+    def show_digest_details(self, digest):
+        """显示归档摘要详情"""
+        self.important_label.setVisible(False)
+        self.important_btn.setVisible(False)
+        if hasattr(self, 'current_topic'):
+            del self.current_topic
+        
+        level_names = {"daily": "日摘要", "weekly": "周摘要", "monthly": "月摘要"}
+        details = f"归档摘要: {digest.get('topic', '')}\n"
+        details += f"层级: {level_names.get(digest.get('level'), digest.get('level'))}\n"
+        details += f"时间范围: {digest.get('start_date', '')} ~ {digest.get('end_date', '')}\n"
+        details += f"对话数: {digest.get('conversation_count', 0)}\n"
+        details += f"关键词: {'、'.join(digest.get('keywords', []))}\n"
+        
+        sources = self.memory_lake.get_digest_sources(digest)
+        if sources:
+            details += f"\n原始主题（{len(sources)}条）:\n"
+            for source in sources:
+                details += f"[{source.get('date', '')} {source.get('timestamp', '')}] {source.get('topic', '')}\n"
+        
+        self.details_text.setText(details)
+
     def toggle_important_memory(self):
         """切换重点记忆标记"""
-        if not hasattr(self, 'current_topic_index'):
+        if not hasattr(self, 'current_topic'):
             return
         
         try:
-            topics = self.memory_lake.memory_index.get("topics", [])
-            if 0 <= self.current_topic_index < len(topics):
-                current_topic = topics[self.current_topic_index]
-                is_important = current_topic.get("is_important", False)
-                
-                if is_important:
-                    # 取消重点记忆标记
-                    if self.memory_lake.unmark_as_important(self.current_topic_index):
-                        self.refresh_data()
-                        print("✅ 已取消重点记忆标记")
-                else:
-                    # 添加重点记忆标记
-                    if self.memory_lake.mark_as_important(self.current_topic_index):
-                        self.refresh_data()
-                        print("✅ 已标记为重点记忆")
+            if self.current_topic.is_important:
+                # 取消重点记忆标记
+                changed = self.memory_lake.unmark_as_important(self.current_topic)
+                message = "✅ 已取消重点记忆标记"
+            else:
+                # 添加重点记忆标记
+                changed = self.memory_lake.mark_as_important(self.current_topic)
+                message = "✅ 已标记为重点记忆"
+            print(message if changed else "⚠️ 该主题已被归档整理，无法修改重点记忆标记")
+            self.refresh_data()
         except Exception as e:
             print(f"切换重点记忆标记失败: {str(e)}")
 
@@ -865,9 +883,13 @@ class MemoryLakeDialog(QDialog):
 class MCPToolsDialog(QDialog):
     """MCP工具管理对话框"""
     
+    test_result_received = pyqtSignal(object)
+    test_finished = pyqtSignal(object)
+    
     def __init__(self, mcp_tools, parent=None):
         super().__init__(parent)
         self.mcp_tools = mcp_tools
+        self.test_results = None  # 正在进行的测试已返回的结果，None 表示没有测试在运行
         self.setWindowTitle("MCP工具管理")
         self.setGeometry(200, 200, 1000, 800)  # 增加窗口高度
         
@@ -875,6 +897,9 @@ class MCPToolsDialog(QDialog):
         if os.path.exists("icon.ico"):
             self.setWindowIcon(QIcon("icon.ico"))
         
+        self.test_result_received.connect(self.on_test_result)
+        self.test_finished.connect(self.on_test_finished)
+        
         self.init_ui()
         self.refresh_tools()
     
@@ -975,6 +1000,7 @@ class MCPToolsDialog(QDialog):
                 color: #1e1e1e;
             }
         """)
+        self.tools_list.setSelectionMode(QAbstractItemView.ExtendedSelection)  # 可多选后一起测试
         self.tools_list.itemClicked.connect(self.show_tool_details)
         tools_layout.addWidget(self.tools_list)
         
@@ -1063,6 +1089,22 @@ class MCPToolsDialog(QDialog):
         self.delete_btn.clicked.connect(self.delete_tool)
         button_layout.addWidget(self.delete_btn)
         
+        self.command_btn = QPushButton("运行命令")
+        self.command_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #89b4fa;
+                color: #1e1e1e;
+                border-radius: 5px;
+                padding: 5px 10px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #74c7ec;
+            }
+        """)
+        self.command_btn.clicked.connect(self.open_command_dialog)
+        button_layout.addWidget(self.command_btn)
+        
         details_layout.addLayout(button_layout)
         details_group.setLayout(details_layout)
         
@@ -1143,25 +1185,77 @@ class MCPToolsDialog(QDialog):
             self.details_text.setText(f"获取工具信息失败: {str(e)}")
     
     def test_tool(self):
-        """测试选中的工具"""
-        current_item = self.tools_list.currentItem()
-        if not current_item:
+        """测试选中的工具（选中多个时并发测试）；在后台线程中执行，结果逐个显示在详情区域"""
+        tool_names = [item.data(Qt.UserRole) for item in self.tools_list.selectedItems() if item.data(Qt.UserRole)]
+        if not tool_names:
             QMessageBox.warning(self, "警告", "请先选择一个工具")
             return
-        
-        tool_name = current_item.data(Qt.UserRole)
-        if not tool_name:
+        if self.test_results is not None:
             return
         
         # 根据工具类型提供不同的测试参数
-        test_params = self.get_test_params(tool_name)
+        steps = [{"id": tool_name, "tool": tool_name, "parameters": self.get_test_params(tool_name)}
+                 for tool_name in dict.fromkeys(tool_names)]
         
+        self.test_results = {}
+        self.test_btn.setEnabled(False)
+        self.details_text.setText(f"正在测试 {len(steps)} 个工具...\n")
+        threading.Thread(target=self.process_test, args=(steps,), daemon=True).start()
+    
+    def process_test(self, steps):
+        """后台线程：执行测试，每完成一个工具就通过信号转发结果"""
         try:
-            # 使用同步方法调用工具
-            result = self.mcp_tools.server.call_tool(tool_name, **test_params)
-            QMessageBox.information(self, "测试结果", f"工具 {tool_name} 测试结果:\n\n{result}")
+            if len(steps) == 1:
+                # 使用同步方法调用工具
+                start = time.perf_counter()
+                result = self.mcp_tools.server.call_tool(steps[0]["tool"], **steps[0]["parameters"])
+                self.test_result_received.emit({"id": steps[0]["id"], "tool": steps[0]["tool"], "ok": looks_successful(result),
+                                                "result": result, "elapsed": round(time.perf_counter() - start, 3)})
+            else:
+                for item in self.mcp_tools.execute_plan(steps):
+                    self.test_result_received.emit(item)
+            self.test_finished.emit({"steps": steps})
         except Exception as e:
-            QMessageBox.warning(self, "测试失败", f"测试工具失败: {str(e)}")
+            self.test_finished.emit({"steps": steps, "error": str(e)})
+    
+    def on_test_result(self, item):
+        """显示一个已完成的测试结果"""
+        if self.test_results is None:
+            return
+        self.test_results[item["id"]] = item
+        cursor = self.details_text.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(f"\n{'✅' if item['ok'] else '❌'} {item['tool']} ({item['elapsed']}秒):\n"
+                          f"{str(item['result'])[:500]}\n")
+        self.details_text.setTextCursor(cursor)
+        self.details_text.ensureCursorVisible()
+    
+    def on_test_finished(self, summary):
+        """全部测试结束：单个工具弹窗显示完整结果，多个工具在详情区域补充汇总"""
+        results, self.test_results = self.test_results or {}, None
+        self.test_btn.setEnabled(True)
+        steps = summary["steps"]
+        if "error" in summary:
+            QMessageBox.warning(self, "测试失败", f"测试工具失败: {summary['error']}")
+            return
+        
+        if len(steps) == 1:
+            result = results[steps[0]["id"]]["result"]
+            QMessageBox.information(self, "测试结果", f"工具 {steps[0]['tool']} 测试结果:\n\n{result}")
+            return
+        
+        # 各工具的结果已逐个显示在详情区域，这里只补充汇总
+        succeeded = sum(1 for item in results.values() if item["ok"])
+        cursor = self.details_text.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(f"\n并发测试 {len(steps)} 个工具完成: 成功 {succeeded} 个，失败 {len(results) - succeeded} 个\n")
+        self.details_text.setTextCursor(cursor)
+        self.details_text.ensureCursorVisible()
+    
+    def open_command_dialog(self):
+        """打开命令运行窗口（输出实时显示，可随时停止）"""
+        dialog = CommandRunDialog(self.mcp_tools.server, self)
+        dialog.exec_()
     
     def get_test_params(self, tool_name):
         """获取工具的测试参数"""
@@ -1179,6 +1273,7 @@ class MCPToolsDialog(QDialog):
             "calculate_distance": {"location1": "北京", "location2": "上海"},
             "calculate": {"expression": "2+2"},
             "get_memory_stats": {},
+            "get_tool_cache_stats": {},
             "高德mcp": {"location1": "北京", "location2": "上海"}
         }
         
@@ -1460,6 +1555,168 @@ class MCPToolsDialog(QDialog):
         return {}
 
 
+class CommandRunDialog(QDialog):
+    """命令运行对话框：流式显示命令输出，支持停止"""
+    
+    output_received = pyqtSignal(str, str)
+    command_finished = pyqtSignal(object)
+    
+    def __init__(self, server, parent=None):
+        super().__init__(parent)
+        self.server = server
+        self.cancel_event = None
+        self.setWindowTitle("运行命令")
+        self.setGeometry(300, 300, 800, 600)
+        
+        self.output_received.connect(self.append_output)
+        self.command_finished.connect(self.on_command_finished)
+        
+        self.init_ui()
+    
+    def init_ui(self):
+        """初始化UI"""
+        layout = QVBoxLayout()
+        
+        command_layout = QHBoxLayout()
+        self.command_edit = QLineEdit()
+        self.command_edit.setPlaceholderText("输入要执行的命令...")
+        self.command_edit.setStyleSheet("""
+            QLineEdit {
+                background-color: #313244;
+                color: #cdd6f4;
+                border-radius: 5px;
+                padding: 5px 10px;
+                font-size: 12px;
+            }
+        """)
+        self.command_edit.returnPressed.connect(self.run_command)
+        command_layout.addWidget(self.command_edit)
+        
+        self.run_btn = QPushButton("运行")
+        self.run_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #a6e3a1;
+                color: #1e1e1e;
+                border-radius: 5px;
+                padding: 5px 15px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #94e2d5;
+            }
+        """)
+        self.run_btn.clicked.connect(self.run_command)
+        command_layout.addWidget(self.run_btn)
+        
+        self.stop_btn = QPushButton("停止")
+        self.stop_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #f38ba8;
+                color: #1e1e1e;
+                border-radius: 5px;
+                padding: 5px 15px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #eba0ac;
+            }
+        """)
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self.stop_command)
+        command_layout.addWidget(self.stop_btn)
+        
+        self.output_text = QTextEdit()
+        self.output_text.setReadOnly(True)
+        self.output_text.setStyleSheet("""
+            QTextEdit {
+                background-color: #313244;
+                color: #cdd6f4;
+                border-radius: 5px;
+                padding: 10px;
+                font-family: Consolas, monospace;
+                font-size: 12px;
+            }
+        """)
+        # 界面中只保留最近的输出，避免长时间运行的命令占满内存
+        self.output_text.document().setMaximumBlockCount(5000)
+        
+        self.status_label = QLabel("就绪")
+        self.status_label.setStyleSheet("color: #cdd6f4; font-size: 12px;")
+        
+        layout.addLayout(command_layout)
+        layout.addWidget(self.output_text)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+    
+    def run_command(self):
+        """在后台线程中运行命令"""
+        command = self.command_edit.text().strip()
+        if not command or self.cancel_event is not None:
+            return
+        
+        self.output_text.clear()
+        self.cancel_event = threading.Event()
+        self.run_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
+        self.status_label.setText(f"正在运行: {command}")
+        threading.Thread(target=self.process_command, args=(command, self.cancel_event), daemon=True).start()
+    
+    def process_command(self, command, cancel_event):
+        """后台线程：逐块转发命令输出"""
+        try:
+            for chunk in self.server.execute_command_stream(command, cancel_event=cancel_event):
+                if chunk["type"] == "exit":
+                    self.command_finished.emit(chunk)
+                else:
+                    self.output_received.emit(chunk["type"], chunk["text"])
+        except Exception as e:
+            self.command_finished.emit({"error": str(e)})
+    
+    def append_output(self, stream, text):
+        """追加输出（stderr显示为红色）"""
+        cursor = self.output_text.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        char_format = cursor.charFormat()
+        char_format.setForeground(QColor("#f38ba8" if stream == "stderr" else "#cdd6f4"))
+        cursor.setCharFormat(char_format)
+        cursor.insertText(text)
+        self.output_text.setTextCursor(cursor)
+        self.output_text.ensureCursorVisible()
+    
+    def stop_command(self):
+        """停止正在运行的命令"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.status_label.setText("正在停止...")
+    
+    def on_command_finished(self, summary):
+        """命令结束后显示退出码和耗时"""
+        self.cancel_event = None
+        self.run_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
+        if "error" in summary:
+            self.status_label.setText(f"❌ 执行命令失败: {summary['error']}")
+            return
+        
+        status = f"退出码 {summary['return_code']}，耗时 {summary['elapsed']} 秒"
+        if summary["cpu_user"] is not None:
+            status += f"，CPU 用户 {summary['cpu_user']} 秒 / 系统 {summary['cpu_system']} 秒"
+        if summary["cancelled"]:
+            status = "⚠️ 已停止，" + status
+        elif summary["timed_out"]:
+            status = "⚠️ 已超时，" + status
+        self.status_label.setText(status)
+    
+    def closeEvent(self, event):
+        """关闭窗口时停止命令"""
+        self.stop_command()
+        super().closeEvent(event)
+    
+    def reject(self):
+        self.stop_command()
+        super().reject()
+
+
 class AddToolDialog(QDialog):
     """新建工具对话框"""
     